@@ -0,0 +1,111 @@
+import os
+import re
+import time
+
+from skipper.cache import write_json
+
+# BuildKit's plain progress (--progress=plain) prefixes every line with the number of the step (vertex) it belongs to
+PROGRESS_LINE = re.compile(r'^#(?P<step>\d+) (?P<text>.*)$')
+DONE = re.compile(r'^DONE (?P<seconds>\d+(\.\d+)?)s$')
+# "[2/5] RUN make", "[builder 3/7] COPY . /src", "[internal] load .dockerignore"
+INSTRUCTION = re.compile(r'^\[(?:\S+ )?\d+/\d+\] ')
+# "sha256:0ab1... 12.58MB / 49.56MB 1.3s done", "transferring context: 2.34MB 0.1s done"
+TRANSFER = re.compile(r'^(?P<what>sha256:[0-9a-f]+|transferring [^:]+:) (?:(?P<done>\S+) / )?(?P<size>\d+(\.\d+)?[kMGT]?B)\b')
+UNITS = {'B': 1, 'kB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'TB': 1000 ** 4}
+
+
+def _bytes(size):
+    number, unit = re.match(r'^(\d+(?:\.\d+)?)(\D+)$', size).groups()
+    return int(float(number) * UNITS[unit])
+
+
+def _cache_column(step):
+    if step['error']:
+        return 'error'
+    if not step['instruction']:
+        return ''
+    return 'hit' if step['cached'] else 'miss'
+
+
+class BuildReport:
+    """
+    Collects the steps of a build from BuildKit's plain progress output: their durations, whether they were cached,
+    and the bytes they transferred (layers pulled, build context sent).
+    """
+
+    def __init__(self, image, tag=None):
+        self.image = image
+        self.tag = tag
+        self.steps = {}
+        self.started = time.time()
+        self.duration = None
+        self.returncode = None
+        self._transfers = {}
+
+    def feed(self, line):
+        """
+        :param line: A line of the progress output, lines of other formats are ignored
+        """
+        match = PROGRESS_LINE.match(line.strip())
+        if not match:
+            return
+        step_id, text = int(match.group('step')), match.group('text').strip()
+        step = self.steps.get(step_id)
+        if step is None:
+            # The first line of a step is its name
+            self.steps[step_id] = {'name': text, 'instruction': bool(INSTRUCTION.match(text)), 'cached': False,
+                                   'duration': 0.0, 'bytes': 0, 'error': None}
+            return
+        done = DONE.match(text)
+        transfer = TRANSFER.match(text)
+        if text == 'CACHED':
+            step['cached'] = True
+        elif done:
+            step['duration'] = float(done.group('seconds'))
+        elif text.startswith('ERROR'):
+            step['error'] = text[len('ERROR'):].lstrip(': ')
+        elif transfer:
+            # Transfers report their progress repeatedly, the last report of each one counts
+            self._transfers[(step_id, transfer.group('what'))] = _bytes(transfer.group('done') or transfer.group('size'))
+            step['bytes'] = sum(size for (transfer_step, _), size in self._transfers.items() if transfer_step == step_id)
+
+    def finish(self, returncode):
+        self.returncode = returncode
+        self.duration = round(time.time() - self.started, 1)
+
+    def to_dict(self):
+        instructions = [step for step in self.steps.values() if step['instruction']]
+        return {
+            'image': self.image,
+            'tag': self.tag,
+            'started': self.started,
+            'duration': self.duration,
+            'returncode': self.returncode,
+            'cache_hits': sum(1 for step in instructions if step['cached']),
+            'cache_misses': sum(1 for step in instructions if not step['cached']),
+            'bytes': sum(step['bytes'] for step in self.steps.values()),
+            'steps': list(self.steps.values()),
+        }
+
+    def summary(self):
+        """
+        :return: A table of the Dockerfile instructions of the build, and of the other steps that took time
+        """
+        import tabulate
+
+        rows = [[step['name'][:80], _cache_column(step), f"{step['duration']:.1f}s", step['bytes']]
+                for step in self.steps.values() if step['instruction'] or step['duration'] >= 0.1 or step['bytes']]
+        return tabulate.tabulate(rows, headers=['STEP', 'CACHE', 'DURATION', 'BYTES'], tablefmt='simple')
+
+    def save(self, report_dir):
+        """
+        Writes the report to <report_dir>/<image>.json (slashes of the image name replaced), replacing the report of the
+        previous build of the image.
+
+        :param report_dir: Directory of the reports, created if needed
+        :return: Path of the report
+        """
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(report_dir, self.image.replace('/', '_') + '.json')
+        write_json(path, self.to_dict())
+        return path
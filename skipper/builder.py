@@ -1,10 +1,114 @@
+import os
+import re
+import subprocess
 from dataclasses import dataclass
 from logging import Logger
 from typing import Callable
 
-from skipper import utils
+from skipper import cache, context, pushes, utils
+from skipper.build_report import BuildReport
 
 DOCKER_TAG_FOR_CACHE = "cache"
+# The registry cache of builds without a branch (a detached HEAD), which must not replace the cache of a branch
+DETACHED_CACHE_TAG = DOCKER_TAG_FOR_CACHE + "-detached"
+
+# How cached builds reuse the layers of previous builds:
+# image - pulls the image tagged "cache" and builds from it, then tags and pushes the result as "cache"
+# registry - BuildKit imports the layer cache from the registry and exports all the layers to it (mode=max)
+# local - BuildKit imports and exports the layer cache from a directory, for runners without a registry
+CACHE_BACKENDS = ("image", "registry", "local")
+
+# What is sent to the builder as the build context:
+# directory - the build context directory, less what its .dockerignore excludes
+# git - the files of the directory that are tracked by git, less what its .dockerignore excludes, streamed as a tar archive
+CONTEXT_SOURCES = ("directory", "git")
+
+# How skipper build passes the git revision it tags the images with
+TAG_DELIVERIES = ("build-arg", "label", "both")
+REVISION_LABEL = "org.opencontainers.image.revision"
+
+INSTRUCTION = re.compile(r"^\s*(?P<instruction>[A-Za-z]+)\s*(?P<arguments>.*)$", re.DOTALL)
+TAG_ARG = re.compile(r"^TAG(=.*)?$")
+TAG_REFERENCE = re.compile(r"\$(TAG\b|\{TAG\b)")
+
+
+def registry_cache_tags(branch=None, default_branch=None):
+    """
+    Returns the tags to import the registry cache from, in order: the branch's, the default branch's, the shared one.
+    A detached HEAD (CI and pull request checkouts) only imports the default branch's, or the shared one if the
+    default branch is unknown.
+
+    :param branch: Branch being built, None for a detached HEAD
+    :param default_branch: Default branch of the repository, if known
+    :return: List of tags
+    """
+    if not branch:
+        return [DOCKER_TAG_FOR_CACHE + "-" + _tag_safe(default_branch) if default_branch else DOCKER_TAG_FOR_CACHE]
+    tags = [DOCKER_TAG_FOR_CACHE + "-" + _tag_safe(name) for name in (branch, default_branch) if name]
+    return list(dict.fromkeys(tags + [DOCKER_TAG_FOR_CACHE]))
+
+
+def registry_cache_export_tag(branch=None):
+    """
+    :param branch: Branch being built, None for a detached HEAD
+    :return: The tag to export the registry cache to, the branch's own or DETACHED_CACHE_TAG
+    """
+    return DOCKER_TAG_FOR_CACHE + "-" + _tag_safe(branch) if branch else DETACHED_CACHE_TAG
+
+
+def tag_arg_warnings(dockerfile):
+    """
+    Finds the ARG TAG instructions that are followed by RUN instructions that don't use TAG, in the same stage.
+    A build arg changes the cache key of every RUN instruction after its ARG, and TAG changes on every commit,
+    so these instructions are rebuilt on every commit.
+
+    :param dockerfile: Path of the Dockerfile
+    :return: List of (line number of the ARG instruction, number of RUN instructions that don't use TAG)
+    """
+    try:
+        with open(dockerfile) as dockerfile_file:
+            lines = dockerfile_file.read().splitlines()
+    except OSError:
+        return []
+
+    warnings = []
+    declared = False
+    for line_number, instruction in _instructions(lines):
+        match = INSTRUCTION.match(instruction)
+        if not match:
+            continue
+        name, arguments = match.group("instruction").upper(), match.group("arguments")
+        if name == "FROM":
+            declared = False
+        elif name == "ARG" and any(TAG_ARG.match(arg) for arg in arguments.split()):
+            declared = True
+            warnings.append([line_number, 0])
+        elif name == "RUN" and declared and not TAG_REFERENCE.search(arguments):
+            warnings[-1][1] += 1
+    return [(line_number, runs) for line_number, runs in warnings if runs]
+
+
+def _instructions(lines):
+    # Joins the continuation lines of every instruction, comments and empty lines excluded
+    instruction, first_line = [], None
+    for line_number, line in enumerate(lines, 1):
+        if not instruction and (not line.strip() or line.lstrip().startswith("#")):
+            continue
+        if first_line is None:
+            first_line = line_number
+        if line.rstrip().endswith("\\"):
+            instruction.append(line.rstrip()[:-1])
+            continue
+        instruction.append(line)
+        yield first_line, " ".join(instruction)
+        instruction, first_line = [], None
+    if instruction:
+        yield first_line, " ".join(instruction)
+
+
+def _tag_safe(name):
+    # Tags are limited to 128 characters of [A-Za-z0-9_.-], "cache-" takes 6 of them
+    return re.sub(r"[^A-Za-z0-9_.-]", "-", name)[:122]
 
 
 class Image:
@@ -59,6 +163,15 @@ class Image:
             )
         return self.__cache_fqdn
 
+    def cache_ref(self, tag):
+        """
+        Generates a Fully Qualified Domain Name for a registry cache of the image.
+
+        :param tag: Tag of the cache, as returned by registry_cache_tags
+        :return: Cache Fully Qualified Domain Name
+        """
+        return utils.generate_fqdn_image(self.registry, self.namespace, self.name, tag)
+
     @property
     def fqdn(self):
         """
@@ -102,18 +215,26 @@ class Image:
 
 
 @dataclass
-class BuildOptions:
+class BuildOptions:  # pylint: disable=too-many-instance-attributes
     """
     A class to encapsulate all the build options needed to create Docker image.
     """
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
         self,
         image: Image,
         container_context,
         build_contexts=None,
         build_args=None,
         use_cache=False,
+        cache_backend="image",
+        cache_tags=None,
+        cache_export_tag=None,
+        cache_dir=None,
+        background_push=False,
+        labels=None,
+        report_dir=None,
+        context_source="directory",
     ):
         """
         Constructs all the necessary attributes for the build options.
@@ -123,12 +244,29 @@ class BuildOptions:
         :param build_contexts: Build contexts to add to build
         :param build_args: Arguments to pass to build
         :param use_cache: Boolean indicating if cache should be used
+        :param cache_backend: How the cache is stored, one of CACHE_BACKENDS
+        :param cache_tags: Tags to import the registry cache from, as returned by registry_cache_tags
+        :param cache_export_tag: Tag to export the registry cache to, as returned by registry_cache_export_tag.
+                                 Defaults to the first of cache_tags
+        :param cache_dir: Directory of the local cache, defaults to one per image under skipper's cache directory
+        :param background_push: Push the image cache in a detached worker instead of waiting for the push
+        :param labels: Labels (key=value) to add to the image
+        :param report_dir: Directory to write a report of the build's steps to, no report if None
+        :param context_source: What is sent as the build context, one of CONTEXT_SOURCES
         """
         self.image = image
         self.container_context = container_context
         self.build_contexts = [ctx for ctx in build_contexts if ctx] if build_contexts else []
         self.build_args = [arg for arg in build_args if arg] if build_args else []
         self.use_cache = use_cache
+        self.cache_backend = cache_backend or "image"
+        self.cache_tags = list(cache_tags) if cache_tags else [DOCKER_TAG_FOR_CACHE]
+        self.cache_export_tag = cache_export_tag or self.cache_tags[0]
+        self.cache_dir = cache_dir
+        self.background_push = background_push
+        self.labels = [label for label in labels if label] if labels else []
+        self.report_dir = report_dir
+        self.context_source = context_source or "directory"
 
     @classmethod
     def from_context_obj(cls, ctx_obj):
@@ -147,6 +285,12 @@ class BuildOptions:
             build_contexts=ctx_obj.get("build_contexts"),
             build_args=ctx_obj.get("build_args"),
             use_cache=ctx_obj.get("use_cache"),
+            cache_backend=ctx_obj.get("build_cache"),
+            cache_tags=ctx_obj.get("cache_tags"),
+            cache_export_tag=ctx_obj.get("cache_export_tag"),
+            cache_dir=ctx_obj.get("build_cache_dir"),
+            report_dir=ctx_obj.get("build_report_dir"),
+            context_source=ctx_obj.get("context_source"),
         )
 
 
@@ -159,7 +303,17 @@ def build(options: BuildOptions, runner: Callable, logger: Logger) -> int:
     :param logger: Logger instance
     :return: A return code representing the success or failure of the build
     """
-    cmd = ["build", "--network=host"]
+    image_cache = options.use_cache and options.cache_backend == "image"
+    if options.use_cache and not image_cache:
+        cmd = _buildkit_command(options, logger)
+    else:
+        cmd = ["build", "--network=host"]
+
+    run_kwargs = {}
+    report = _build_report(options, logger)
+    if report:
+        cmd.append("--progress=plain")
+        run_kwargs["stderr_callback"] = report.feed
 
     for arg in options.build_args:
         cmd += ["--build-arg", arg]
@@ -167,26 +321,128 @@ def build(options: BuildOptions, runner: Callable, logger: Logger) -> int:
     for build_ctx in options.build_contexts:
         cmd += ["--build-context", build_ctx]
 
+    # Labels are set on the image's config, they don't change the cache of its layers
+    for label in options.labels:
+        cmd += ["--label", label]
+
+    dockerfile, build_context = options.image.dockerfile, options.container_context or "."
+    git_context = _git_context(options, logger) if options.context_source == "git" else None
+    if git_context:
+        dockerfile, run_kwargs["stdin_writer"] = git_context
+        build_context = "-"
+
     cmd += [
         "-f",
-        options.image.dockerfile,
+        dockerfile,
         "-t",
         options.image.local,
-        options.container_context or ".",
+        build_context,
     ]
 
-    if options.use_cache:
+    if image_cache:
         runner(["pull", options.image.cache_fqdn])
         cmd.extend(["--cache-from", options.image.cache_fqdn])
 
-    ret = runner(cmd)
+    ret = runner(cmd, **run_kwargs)
+
+    if report:
+        report.finish(ret)
+        _save_build_report(report, options, logger)
 
     if ret != 0:
         logger.error("Failed to build image: %s", options.image)
         return ret
 
-    if options.use_cache:
+    if image_cache:
         runner(["tag", options.image.name, options.image.cache_fqdn])
-        runner(["push", options.image.cache_fqdn])
+        if options.background_push:
+            pushes.push_in_background(options.image.cache_fqdn, logger)
+        else:
+            runner(["push", options.image.cache_fqdn])
 
     return 0
+
+
+def _git_context(options: BuildOptions, logger: Logger):
+    # Returns the Dockerfile's path in the archive of the build context, and a function that writes the archive
+    context_dir = options.container_context or "."
+    try:
+        files = context.git_context_files(context_dir, options.image.dockerfile)
+    except (OSError, subprocess.CalledProcessError):
+        logger.warning("%s is not in a git work tree, sending the whole directory as the build context", context_dir)
+        return None
+
+    dockerfile = os.path.relpath(options.image.dockerfile, context_dir).replace(os.sep, "/")
+    external_dockerfile = None
+    if dockerfile not in files:
+        # The Dockerfile is outside of the build context, untracked or excluded, docker build - reads it from the archive
+        dockerfile, external_dockerfile = context.ARCHIVED_DOCKERFILE, options.image.dockerfile
+    logger.debug("Sending %d files tracked by git as the build context", len(files))
+    return dockerfile, lambda stream: context.write_context_archive(stream, context_dir, files, external_dockerfile)
+
+
+def _build_report(options: BuildOptions, logger: Logger):
+    # The report is parsed from BuildKit's plain progress output
+    if not options.report_dir:
+        return None
+    if utils.get_runtime_command() != "docker":
+        logger.warning("Build reports require BuildKit, building %s without a report", options.image)
+        return None
+    return BuildReport(options.image.name, options.image.tag)
+
+
+def _save_build_report(report: BuildReport, options: BuildOptions, logger: Logger):
+    try:
+        report_path = report.save(options.report_dir)
+    except (OSError, TypeError, ValueError) as exc:
+        # The image was built either way, only its report is missing
+        logger.warning("Failed to write the build report of %s: %s", options.image.local, exc)
+        report_path = "not saved"
+    logger.info("Build report of %s (%s):\n%s", options.image.local, report_path, report.summary())
+
+
+def _buildkit_command(options: BuildOptions, logger: Logger):
+    # BuildKit fetches only the cache metadata and the layers it reuses, instead of pulling the whole cache image,
+    # and exports the cache while building
+    if utils.get_runtime_command() != "docker":
+        logger.warning("The %s build cache requires docker buildx, building without cache", options.cache_backend)
+        return ["build", "--network=host"]
+
+    if options.cache_backend == "registry" and not options.image.registry:
+        logger.warning("The registry build cache requires a registry, building without cache")
+        return ["build", "--network=host"]
+
+    # The default docker driver can't export a cache, a docker-container builder can
+    builder_name = os.environ.get("SKIPPER_BUILDX_BUILDER")
+    exports = _buildx_driver(builder_name) != "docker"
+    if not exports:
+        logger.warning("The docker buildx driver can't export a build cache, the %s cache is not updated. "
+                       "Set SKIPPER_BUILDX_BUILDER to a docker-container builder to update it", options.cache_backend)
+
+    if options.cache_backend == "local":
+        if not exports:
+            # Nor can it import a local cache
+            return ["build", "--network=host"]
+        directory = options.cache_dir or cache.cache_dir("buildkit", options.image.name)
+        cache_args = ["--cache-from", f"type=local,src={directory}", "--cache-to", f"type=local,dest={directory},mode=max"]
+    else:
+        cache_args = []
+        for tag in options.cache_tags:
+            cache_args += ["--cache-from", f"type=registry,ref={options.image.cache_ref(tag)}"]
+        if exports:
+            cache_args += ["--cache-to", f"type=registry,ref={options.image.cache_ref(options.cache_export_tag)},mode=max"]
+
+    cmd = ["buildx", "build"]
+    if builder_name:
+        cmd += ["--builder", builder_name]
+    return cmd + ["--network=host", "--load"] + cache_args
+
+
+def _buildx_driver(builder_name):
+    # The driver of the given builder, or of the current one. None if it is unknown, the build reports the errors
+    try:
+        output = utils.run_container_command(["buildx", "inspect"] + ([builder_name] if builder_name else []))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    match = re.search(r"^Driver:\s*(\S+)", output, re.MULTILINE)
+    return match.group(1) if match else None
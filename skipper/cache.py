@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from skipper.utils import env_flag, env_int
+
+
+def cache_dir(*parts):
+    """
+    Returns a path under skipper's cache directory ($SKIPPER_CACHE_DIR, or ~/.cache/skipper).
+
+    :param parts: Path components under the cache directory
+    :return: The path, which is not created
+    """
+    base = os.environ.get('SKIPPER_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'skipper')
+    return os.path.join(base, *parts)
+
+
+def write_json(path, value):
+    """
+    Writes a JSON file atomically, readers see either its previous or its new content.
+
+    :raises OSError: If the file can't be written
+    :raises TypeError: If the value is not serializable
+    """
+    data = json.dumps(value)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), suffix='.tmp', delete=False) as json_file:
+        json_file.write(data)
+    os.replace(json_file.name, path)
+
+
+def _digest(*parts):
+    return hashlib.sha256('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class RegistryCache:
+    """
+    An on-disk cache of registry metadata: tag existence, manifest digests and tag lists.
+
+    Entries are JSON files grouped by (registry, image), keyed by the request that produced them.
+    Positive and negative answers expire after different TTLs, and expired entries keep their ETag
+    so they can be revalidated. The least recently used entries are evicted above `max_size` bytes.
+
+    The size of the cache is measured once, then tracked through the writes of this instance, its entries
+    are only walked again when it goes over `max_size`. Entries written by other processes are counted then.
+    """
+
+    POSITIVE_TTL = 3600
+    NEGATIVE_TTL = 60
+    MAX_SIZE = 32 * 1024 * 1024
+    # Eviction frees space down to this fraction of max_size, so that it doesn't run again on the next write
+    EVICTION_TARGET = 0.9
+
+    def __init__(self, path, positive_ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL, max_size=MAX_SIZE):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._size = None
+        self._size_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Creates the registry cache configured by the SKIPPER_REGISTRY_CACHE* environment variables.
+
+        :return: An instance of RegistryCache, or None when SKIPPER_REGISTRY_CACHE is 'false'
+        """
+        if not env_flag('SKIPPER_REGISTRY_CACHE', default=True):
+            return None
+        return cls(
+            cache_dir('registry'),
+            positive_ttl=env_int('SKIPPER_REGISTRY_CACHE_TTL', cls.POSITIVE_TTL),
+            negative_ttl=env_int('SKIPPER_REGISTRY_CACHE_NEGATIVE_TTL', cls.NEGATIVE_TTL),
+            max_size=env_int('SKIPPER_REGISTRY_CACHE_SIZE', cls.MAX_SIZE),
+        )
+
+    def _entry_path(self, registry, image, key):
+        return os.path.join(self.path, _digest(registry, image), _digest(*key) + '.json')
+
+    def get(self, registry, image, key):
+        """
+        Looks up a cached entry, marking it as recently used.
+
+        :return: A tuple of the entry's value, whether it is still fresh and its ETag, or None
+        """
+        entry_path = self._entry_path(registry, image, key)
+        try:
+            with open(entry_path) as entry_file:
+                entry = json.load(entry_file)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+        return entry['value'], time.time() < entry['expires_at'], entry.get('etag')
+
+    def put(self, registry, image, key, value, positive=True, etag=None):
+        entry_path = self._entry_path(registry, image, key)
+        try:
+            write_json(entry_path, {
+                'value': value,
+                'etag': etag,
+                'positive': positive,
+                'expires_at': time.time() + (self.positive_ttl if positive else self.negative_ttl),
+            })
+            self._account(os.path.getsize(entry_path))
+        except (OSError, TypeError, ValueError):
+            # The answer is asked from the registry again next time
+            pass
+
+    def refresh(self, registry, image, key):
+        """Extends the expiration of an entry that was revalidated by the registry."""
+        try:
+            with open(self._entry_path(registry, image, key)) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return
+        self.put(registry, image, key, entry['value'], positive=entry.get('positive', True), etag=entry.get('etag'))
+
+    def invalidate(self, registry, image):
+        """Drops all the entries of an image."""
+        shutil.rmtree(os.path.join(self.path, _digest(registry, image)), ignore_errors=True)
+
+    def _account(self, entry_size):
+        # A rewritten entry is counted twice, until the next eviction measures the cache again
+        with self._size_lock:
+            if self._size is None:
+                # The first measure includes the entry that was just written
+                self._size = sum(entry[1] for entry in self._entries())
+            else:
+                self._size += entry_size
+            if self._size > self.max_size:
+                self._size = self._evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for filename in files:
+                try:
+                    stat = os.stat(os.path.join(root, filename))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, filename)))
+        return entries
+
+    def _evict(self):
+        """
+        Removes the least recently used entries, until the cache is below its eviction target.
+
+        :return: The size of the remaining entries
+        """
+        entries = self._entries()
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, entry_path in sorted(entries):
+            if size <= self.max_size * self.EVICTION_TARGET:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            size -= entry_size
+        return size
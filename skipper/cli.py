@@ -1,21 +1,29 @@
 from __future__ import print_function
 
+import hashlib
+import itertools
 import logging
 import os
 import os.path
+import subprocess
 import sys
+from collections.abc import Mapping, Sequence
+from contextlib import ExitStack
 
 from re import compile as compile_expression
 import click
 import six
-import tabulate
-from pkg_resources import get_distribution
-from pbr import packaging
 
-from skipper import git, builder
+from skipper import context, git, builder, locking, pushes, scheduler
+from skipper.cache import RegistryCache
 from skipper import runner
 from skipper import utils
 from skipper.builder import BuildOptions, Image
+from skipper.registry import RegistryClient
+
+
+# Seconds to wait for another skipper building the same build container before building it anyway
+BUILD_LOCK_TIMEOUT = 1800
 
 
 def _validate_publish(ctx, param, value):
@@ -63,6 +71,16 @@ def _validate_port_out_of_range(port):
 @click.option('--env-file', multiple=True, help='Environment variable file(s) to load')
 @click.option('--build-arg', multiple=True, help='Build arguments to pass to the container build', envvar='SKIPPER_BUILD_ARGS')
 @click.option('--build-context', multiple=True, help='Build contexts to pass to the container build')
+@click.option('--build-cache', help='Where cached builds keep their layer cache', type=click.Choice(builder.CACHE_BACKENDS),
+              default='image', envvar='SKIPPER_BUILD_CACHE')
+@click.option('--build-cache-dir', help='Directory of the local build cache', envvar='SKIPPER_BUILD_CACHE_DIR')
+@click.option('--build-report-dir', help='Directory to write a report of every build to', envvar='SKIPPER_BUILD_REPORT_DIR')
+@click.option('--context-source', help='Send the build context directory, or only its files tracked by git',
+              type=click.Choice(builder.CONTEXT_SOURCES), default='directory', envvar='SKIPPER_CONTEXT_SOURCE')
+@click.option('--git-dirty-check', help='How to check for uncommitted changes', type=click.Choice(git.DIRTY_CHECK_STRATEGIES),
+              default='full', envvar='SKIPPER_GIT_DIRTY_CHECK')
+@click.option('--background-dirty-check/--no-background-dirty-check', help='Check for uncommitted changes while the command runs',
+              default=False, envvar='SKIPPER_BACKGROUND_DIRTY_CHECK')
 @click.pass_context
 def cli(
         ctx,
@@ -74,6 +92,12 @@ def cli(
         env_file,
         build_arg,
         build_context,
+        build_cache,
+        build_cache_dir,
+        build_report_dir,
+        context_source,
+        git_dirty_check,
+        background_dirty_check,
 ):
     """
     Easily dockerize your Git repository
@@ -84,7 +108,11 @@ def cli(
     ctx.obj['env_file'] = env_file
     ctx.obj['build_container_image'] = build_container_image
     ctx.obj['build_container_net'] = build_container_net
+    git.DIRTY_CHECK = git_dirty_check
+    git.DIRTY_CHECK_PATHS = _dirty_check_paths(build_container_image, ctx.default_map.get('container_context'))
+    git.DIRTY_CHECK_IN_BACKGROUND = background_dirty_check
     ctx.obj['git_revision'] = build_container_tag == 'git:revision'
+    ctx.obj['content_hash'] = build_container_tag == context.CONTENT_HASH_TAG
     ctx.obj['build_container_tag'] = (git.get_hash() if ctx.obj['git_revision'] else build_container_tag)
     ctx.obj['env'] = ctx.default_map.get('env', {})
     ctx.obj['containers'] = ctx.default_map.get('containers')
@@ -94,15 +122,32 @@ def cli(
     ctx.obj['container_context'] = ctx.default_map.get('container_context')
     ctx.obj['build_args'] = build_arg
     ctx.obj['build_contexts'] = build_context
+    ctx.obj['build_cache'] = build_cache
+    ctx.obj['build_cache_dir'] = build_cache_dir
+    ctx.obj['build_report_dir'] = build_report_dir
+    ctx.obj['context_source'] = context_source
+    if build_cache == 'registry':
+        git_dir = git.find_git_dir()
+        branch = git.current_branch(git_dir)
+        ctx.obj['cache_tags'] = builder.registry_cache_tags(branch, git.default_branch(git_dir))
+        ctx.obj['cache_export_tag'] = builder.registry_cache_export_tag(branch)
     utils.set_remote_registry_login_info(registry, ctx.obj)
+    ctx.obj['registry_client'] = RegistryClient(ctx.obj.get('username'), ctx.obj.get('password'), RegistryCache.from_env())
+    ctx.call_on_close(ctx.obj['registry_client'].close)
 
 
 @cli.command()
 @click.argument('images_to_build', nargs=-1, metavar='[IMAGE...]')
 @click.option('--container-context', help='Container context path', default=None)
 @click.option('-c', '--cache', help='Use cache image', is_flag=True, default=False, envvar='SKIPPER_USE_CACHE_IMAGE')
+@click.option('-j', '--jobs', help='Number of images to build concurrently', type=click.IntRange(min=1), default=1,
+              envvar='SKIPPER_BUILD_JOBS')
+@click.option('--keep-going/--fail-fast', help='Keep building the images that do not depend on a failed image', default=False,
+              envvar='SKIPPER_BUILD_KEEP_GOING')
+@click.option('--tag-as', help='Pass the git revision as the TAG build arg, as a label, or both', type=click.Choice(builder.TAG_DELIVERIES),
+              default='build-arg', envvar='SKIPPER_TAG_AS')
 @click.pass_context
-def build(ctx, images_to_build, container_context, cache):
+def build(ctx, images_to_build, container_context, cache, jobs, keep_going, tag_as):
     """
     Build a container
     """
@@ -110,27 +155,58 @@ def build(ctx, images_to_build, container_context, cache):
 
     valid_images_to_build = _get_images_to_build(ctx, images_to_build)
     tag = git.get_hash()
-    build_args = (ctx.obj.get('build_args', ()) + (f'TAG={tag}',))
+    build_args = ctx.obj.get('build_args', ())
+    if tag_as != 'label':
+        build_args += (f'TAG={tag}',)
+    labels = [f'{builder.REVISION_LABEL}={tag}'] if tag_as != 'build-arg' else []
     build_contexts = ctx.obj.get('build_contexts', ())
 
-    for image, dockerfile in valid_images_to_build.items():
+    try:
+        dependencies = scheduler.get_dependencies(valid_images_to_build)
+    except scheduler.DependencyCycleError as exc:
+        raise click.exceptions.ClickException(str(exc))
+
+    def build_image(image):
         utils.logger.info("Building image: %s", image)
 
+        dockerfile = valid_images_to_build[image]
+        if tag_as != 'label':
+            _warn_on_tag_args(dockerfile)
         main_context = container_context or ctx.obj.get('container_context') or os.path.dirname(dockerfile)
+        # The registry cache is stored next to the image, the image cache keeps its historical local name
+        registry = ctx.obj['registry'] if ctx.obj.get('build_cache') == 'registry' else None
         options = BuildOptions(
-            Image(name=image, tag=tag, dockerfile=dockerfile),
+            Image(name=image, tag=tag, dockerfile=dockerfile, registry=registry),
             main_context,
             build_contexts,
             build_args,
             cache,
+            ctx.obj.get('build_cache'),
+            ctx.obj.get('cache_tags'),
+            ctx.obj.get('cache_export_tag'),
+            ctx.obj.get('build_cache_dir'),
+            labels=labels,
+            report_dir=ctx.obj.get('build_report_dir'),
+            context_source=ctx.obj.get('context_source'),
         )
 
         ret = builder.build(options, runner.run, utils.logger)
         if ret != 0:
             utils.logger.error("Failed to build image: %s", options.image)
-            return ret
+        return ret
 
-    return 0
+    results = scheduler.schedule(dependencies, build_image, jobs, keep_going, utils.logger)
+    failed_images = [image for image, ret in results.items() if ret != 0]
+    if len(failed_images) > 1:
+        utils.logger.error("Failed to build images: %s", ", ".join(failed_images))
+    return results[failed_images[0]] if failed_images else 0
+
+
+def _warn_on_tag_args(dockerfile):
+    for line_number, runs in builder.tag_arg_warnings(dockerfile):
+        utils.logger.warning('%s:%d: ARG TAG changes on every commit, the %d RUN instructions after it that don\'t use it are '
+                             'rebuilt on every commit. Declare it after them, or build with --tag-as label',
+                             dockerfile, line_number, runs)
 
 
 @cli.command()
@@ -148,6 +224,8 @@ def push(ctx, namespace, force, pbr, image):
     tag = git.get_hash()
     tag_to_push = tag
     if pbr:
+        from pbr import packaging
+
         # Format = pbr_version.short_hash
         # pylint: disable=protected-access
         tag_to_push = f"{packaging._get_version_from_git().replace('dev', '')}.{tag[:8]}"
@@ -162,16 +240,13 @@ def push(ctx, namespace, force, pbr, image):
 def _push(ctx, force, image, image_name, namespace, tag):
     fqdn_image = utils.generate_fqdn_image(ctx.obj['registry'], namespace, image, tag)
     utils.logger.debug("Adding tag %s", fqdn_image)
-    command = ['tag', image_name, fqdn_image]
-    ret = runner.run(command)
+    ret = _tag_image(image_name, fqdn_image)
     if ret != 0:
         utils.logger.error('Failed to tag image: %s as fqdn: %s', image_name, fqdn_image)
         sys.exit(ret)
     repo_name = utils.generate_fqdn_image(None, namespace, image, tag=None)
-    images_info = utils.get_remote_images_info([repo_name], ctx.obj['registry'],
-                                               ctx.obj.get('username'), ctx.obj.get('password'))
-    tags = [info[-1] for info in images_info]
-    if tag in tags:
+    # The registry is the source of truth for deciding whether to push, not the local cache
+    if utils.remote_image_exist(ctx.obj['registry_client'], ctx.obj['registry'], repo_name, tag, cached=False):
         if not force:
             utils.logger.info("Image %s is already in registry %s, not pushing",
                               fqdn_image, ctx.obj['registry'])
@@ -181,9 +256,9 @@ def _push(ctx, force, image, image_name, namespace, tag):
             _push_to_registry(ctx.obj['registry'], fqdn_image)
     else:
         _push_to_registry(ctx.obj['registry'], fqdn_image)
+    ctx.obj['registry_client'].invalidate(ctx.obj['registry'], repo_name)
     utils.logger.debug("Removing tag %s", fqdn_image)
-    command = ['rmi', fqdn_image]
-    ret = runner.run(command)
+    ret = _remove_image(fqdn_image)
     if ret != 0:
         utils.logger.warning('Failed to remove image tag: %s', fqdn_image)
     return ret
@@ -191,8 +266,14 @@ def _push(ctx, force, image, image_name, namespace, tag):
 
 @cli.command()
 @click.option('-r', '--remote', help='List also remote images', is_flag=True, default=False)
+@click.option('-j', '--jobs', help='Number of remote images to query concurrently', type=click.IntRange(min=1),
+              default=utils.REGISTRY_JOBS, envvar='SKIPPER_REGISTRY_JOBS')
+@click.option('--page-size', help='Number of tags to request per registry page', type=click.IntRange(min=1),
+              default=utils.REGISTRY_PAGE_SIZE, envvar='SKIPPER_REGISTRY_PAGE_SIZE')
+@click.option('--format', 'output_format', help='Output format, plain prints tab separated rows as they are listed',
+              type=click.Choice(['table', 'plain']), default='table')
 @click.pass_context
-def images(ctx, remote):
+def images(ctx, remote, jobs, page_size, output_format):
     """
     List images
     """
@@ -204,13 +285,23 @@ def images(ctx, remote):
     images_info = utils.get_local_images_info(images_names)
     if remote:
         _validate_global_params(ctx, 'registry')
-        try:
-            images_info += utils.get_remote_images_info(images_names, ctx.obj['registry'],
-                                                        ctx.obj.get('username'), ctx.obj.get('password'))
-        except Exception as exp:
-            raise click.exceptions.ClickException(f'Got unknown error from remote registry {exp}')
+        images_info = itertools.chain(images_info, _get_remote_images_info(ctx, images_names, jobs, page_size))
+
+    if output_format == 'plain':
+        for image_info in images_info:
+            print('\t'.join(image_info), flush=True)
+        return
+
+    import tabulate
+
+    print(tabulate.tabulate(list(images_info), headers=['REGISTRY', 'IMAGE', 'TAG'], tablefmt='grid'))
 
-    print(tabulate.tabulate(images_info, headers=['REGISTRY', 'IMAGE', 'TAG'], tablefmt='grid'))
+
+def _get_remote_images_info(ctx, images_names, jobs, page_size):
+    try:
+        yield from utils.get_remote_images_info(ctx.obj['registry_client'], images_names, ctx.obj['registry'], jobs, page_size)
+    except Exception as exp:
+        raise click.exceptions.ClickException(f'Got unknown error from remote registry {exp}')
 
 
 @cli.command()
@@ -226,12 +317,84 @@ def rmi(ctx, remote, image, tag):
     _validate_project_image(image)
     if remote:
         _validate_global_params(ctx, 'registry')
-        utils.delete_image_from_registry(ctx.obj['registry'], image, tag,
-                                         ctx.obj.get('username'), ctx.obj.get('password'))
+        utils.delete_image_from_registry(ctx.obj['registry_client'], ctx.obj['registry'], image, tag)
     else:
         utils.delete_local_image(image, tag)
 
 
+@cli.command('context-report')
+@click.argument('image', required=False)
+@click.option('--container-context', help='Container context path', default=None)
+@click.option('--depth', help='Number of path components to group the files by', type=click.IntRange(min=1), default=1)
+@click.option('--top', help='Number of groups to show', type=click.IntRange(min=1), default=20)
+@click.pass_context
+def context_report(ctx, image, container_context, depth, top):
+    """
+    Show what makes up the build context of an image, the build container by default
+    """
+    utils.logger.debug("Executing context-report command")
+    if image:
+        dockerfiles = _get_images_to_build(ctx, [image])
+        if not dockerfiles:
+            raise click.BadParameter(f'{image} is not an image of this project', param_hint='image')
+        dockerfile = dockerfiles[image]
+        context_dir = container_context or ctx.obj.get('container_context') or os.path.dirname(dockerfile)
+    else:
+        _validate_global_params(ctx, 'build_container_image')
+        dockerfile = utils.image_to_dockerfile(ctx.obj['build_container_image'])
+        context_dir = container_context or ctx.obj.get('container_context') or '.'
+
+    tracked = None
+    if ctx.obj.get('context_source') == 'git':
+        try:
+            tracked = git.tracked_files(context_dir)
+        except subprocess.CalledProcessError:
+            utils.logger.warning('%s is not in a git work tree, the whole directory is sent', context_dir)
+
+    rows = context.context_report(context_dir, dockerfile, depth, tracked)
+    for status in (context.SENT, context.IGNORED, context.UNTRACKED):
+        files = [row for row in rows if row['status'] == status]
+        if files:
+            utils.logger.info('%s: %d files, %s', status, sum(row['files'] for row in files),
+                              _human_size(sum(row['bytes'] for row in files)))
+
+    import tabulate
+
+    print(tabulate.tabulate([[row['path'], row['status'], row['files'], _human_size(row['bytes'])] for row in rows[:top]],
+                            headers=['PATH', 'STATUS', 'FILES', 'SIZE'], tablefmt='grid'))
+
+
+def _human_size(size):
+    units = ['B', 'kB', 'MB', 'GB']
+    unit = units.pop(0)
+    while size >= 1000 and units:
+        size /= 1000
+        unit = units.pop(0)
+    return f'{size}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+
+
+@cli.command('pushes')
+@click.option('-w', '--wait', 'wait_for_pushes', help='Wait for the running pushes to end', is_flag=True, default=False)
+@click.option('--timeout', help='Seconds to wait', type=click.IntRange(min=0), default=None)
+def pushes_(wait_for_pushes, timeout):
+    """
+    Show the cache pushes running in the background
+    """
+    utils.logger.debug("Executing pushes command")
+    states = pushes.wait(timeout) if wait_for_pushes else pushes.pushes()
+    statuses = [pushes.status(state) for state in states]
+
+    import tabulate
+
+    print(tabulate.tabulate([[state['image'], (state['digest'] or '')[:19], state_status, state['log']]
+                             for state, state_status in zip(states, statuses)],
+                            headers=['IMAGE', 'DIGEST', 'STATUS', 'LOG'], tablefmt='grid'))
+    # Waiting succeeds once every push succeeded
+    if wait_for_pushes and any(state_status != pushes.SUCCEEDED for state_status in statuses):
+        return 1
+    return 0
+
+
 @cli.command(context_settings={"ignore_unknown_options": True})
 @click.option('-i', '--interactive', help='Interactive mode', is_flag=True, default=False, envvar='SKIPPER_INTERACTIVE')
 @click.option('-n', '--name', help='Container name', default=None)
@@ -251,8 +414,8 @@ def run(ctx, interactive, name, env, publish, cache, command):
     build_container = _prepare_build_container(
         BuildOptions.from_context_obj(ctx.obj),
         ctx.obj.get('git_revision'),
-        ctx.obj.get('username'),
-        ctx.obj.get('password'),
+        ctx.obj['registry_client'],
+        ctx.obj.get('content_hash'),
     )
 
     return runner.run(
@@ -291,8 +454,8 @@ def make(ctx, interactive, name, env, makefile, cache, publish, make_params):
     build_container = _prepare_build_container(
         BuildOptions.from_context_obj(ctx.obj),
         ctx.obj.get('git_revision'),
-        ctx.obj.get('username'),
-        ctx.obj.get('password'),
+        ctx.obj['registry_client'],
+        ctx.obj.get('content_hash'),
     )
 
     command = ['make', '-f', makefile] + list(make_params)
@@ -329,8 +492,8 @@ def shell(ctx, env, name, cache, publish):
     build_container = _prepare_build_container(
         BuildOptions.from_context_obj(ctx.obj),
         ctx.obj.get('git_revision'),
-        ctx.obj.get('username'),
-        ctx.obj.get('password'),
+        ctx.obj['registry_client'],
+        ctx.obj.get('content_hash'),
     )
 
     return runner.run(
@@ -349,13 +512,28 @@ def shell(ctx, env, name, cache, publish):
     )
 
 
+@cli.command(name='context-hash')
+@click.argument('path', default='.', type=click.Path(exists=True, file_okay=False))
+@click.option('-f', '--dockerfile', help='Dockerfile whose own .dockerignore takes precedence', type=click.Path(dir_okay=False))
+@click.option('-j', '--jobs', help='Number of files to hash concurrently (default: number of CPUs)', type=click.IntRange(min=1))
+@click.option('--no-index', help="Don't use the stat index, read all the files", is_flag=True, default=False)
+def context_hash(path, dockerfile, jobs, no_index):
+    """
+    Print the digest of a build context
+    """
+    utils.logger.debug("Executing context-hash command")
+    click.echo(context.hash_context(path, dockerfile, jobs, use_index=not no_index))
+
+
 @cli.command()
 def version():
     """
     output skipper version
     """
     utils.logger.debug("printing skipper version")
-    click.echo(get_distribution("strato-skipper").version)  # pylint: disable=no-member
+    from importlib import metadata
+
+    click.echo(metadata.version("strato-skipper"))
 
 
 @cli.command()
@@ -369,6 +547,34 @@ def completion():
         print(fin.read(), end="")
 
 
+def _tag_image(image_name, fqdn_image):
+    engine_client = utils.get_engine_client()
+    if not engine_client:
+        return runner.run(['tag', image_name, fqdn_image])
+    from skipper import engine
+
+    try:
+        engine_client.tag_image(image_name, fqdn_image)
+    except engine.EngineError as exc:
+        utils.logger.error('%s', exc)
+        return 1
+    return 0
+
+
+def _remove_image(fqdn_image):
+    engine_client = utils.get_engine_client()
+    if not engine_client:
+        return runner.run(['rmi', fqdn_image])
+    from skipper import engine
+
+    try:
+        engine_client.remove_image(fqdn_image)
+    except engine.EngineError as exc:
+        utils.logger.warning('%s', exc)
+        return 1
+    return 0
+
+
 def _push_to_registry(registry, fqdn_image):
     utils.logger.debug("Pushing to registry %s", registry)
     command = ['push', fqdn_image]
@@ -381,10 +587,10 @@ def _push_to_registry(registry, fqdn_image):
 def _prepare_build_container(
         options: BuildOptions,
         git_revision: bool,
-        username: str,
-        password: str,
+        registry_client: RegistryClient,
+        content_hash: bool = False,
 ):
-    def runner_run(command):
+    def runner_run(command, **kwargs):
         """
         All output generated by the container runtime during this stage should
         not be included in stdout - we should redirect it to stderr, as the
@@ -399,20 +605,29 @@ def _prepare_build_container(
         env var.
         """
         utils.logger.debug("Running command: %s", command)
-        return runner.run(command, stdout_to_stderr=True)
+        return runner.run(command, stdout_to_stderr=True, **kwargs)
 
     image = options.image
+    # The command starts as soon as the build container exists locally, its cache is pushed meanwhile
+    options.background_push = utils.env_flag('SKIPPER_BACKGROUND_CACHE_PUSH', default=True)
+
+    if content_hash:
+        if not image.dockerfile:
+            sys.exit(f'Could not find any dockerfile for {image.name}')
+        # The build container is tagged with a digest of its inputs, it is rebuilt only when they change
+        image.tag = context.content_hash(options)
+        utils.logger.debug('Content hash of build container %s: %s', image.name, image.tag)
 
     if image.tag:
         if utils.local_image_exist(image.name, image.tag):
             utils.logger.info('Using build container: %s', image.name)
             return image.local
 
-        if image.registry and utils.remote_image_exist(image.registry, image.name, image.tag, username, password):
+        if image.registry and utils.remote_image_exist(registry_client, image.registry, image.name, image.tag):
             utils.logger.info('Using build container: %s', image.fqdn)
             return image.fqdn
 
-        if not git_revision:
+        if not git_revision and not content_hash:
             raise click.exceptions.ClickException(f"Couldn't find build image {image.name} with tag {image.tag}")
     else:
         utils.logger.info('No build container tag was provided')
@@ -420,12 +635,31 @@ def _prepare_build_container(
     if not image.dockerfile:
         sys.exit(f'Could not find any dockerfile for {image.name}')
 
-    utils.logger.info('Building image using docker file: %s', image.dockerfile)
+    # Concurrent invocations (parallel make jobs, CI agents sharing a host) build a missing image once
+    with ExitStack() as stack:
+        try:
+            timeout = utils.env_int('SKIPPER_BUILD_LOCK_TIMEOUT', BUILD_LOCK_TIMEOUT, minimum=0)
+            stack.enter_context(locking.file_lock(_build_lock_path(image), timeout=timeout))
+        except OSError as exc:  # Including locking.LockTimeout
+            utils.logger.warning('%s, building the build container anyway', exc)
+
+        # Another invocation may have built the image since it was looked up, even if it released the lock before
+        # this one requested it
+        if image.tag and utils.local_image_exist(image.name, image.tag):
+            utils.logger.info('Using build container built by another skipper: %s', image.name)
+            return image.local
+
+        utils.logger.info('Building image using docker file: %s', image.dockerfile)
+
+        if builder.build(options, runner_run, utils.logger) != 0:
+            sys.exit(f'Failed to build image: {image}')
 
-    if builder.build(options, runner_run, utils.logger) != 0:
-        sys.exit(f'Failed to build image: {image}')
+        return image.local
 
-    return image.local
+
+def _build_lock_path(image):
+    key = hashlib.sha256(image.local.encode('utf-8')).hexdigest()[:16]
+    return locking.runtime_dir('locks', f'build-{key}.lock')
 
 
 def _validate_global_params(ctx, *params):
@@ -434,6 +668,15 @@ def _validate_global_params(ctx, *params):
             raise click.BadParameter(str(ctx.obj[param]), param_hint=param)
 
 
+def _dirty_check_paths(build_container_image, container_context):
+    # The scoped dirty check only looks at what the build container is built from
+    paths = [container_context or '.']
+    dockerfile = utils.image_to_dockerfile(build_container_image) if build_container_image else None
+    if dockerfile:
+        paths.append(dockerfile)
+    return tuple(paths)
+
+
 def _validate_project_image(image):
     project_images = utils.get_images_from_dockerfiles()
     if image not in project_images:
@@ -444,11 +687,11 @@ def _expend_env(ctx, extra_env):
     environment = []
     env = ctx.obj['env']
     # env is allowed to be of type list and of type dict
-    if isinstance(env, dict):
+    if isinstance(env, Mapping):
         for key, value in six.iteritems(env):
             utils.logger.debug("Adding %s=%s to environment", key, value)
             environment.append(f"{key}={value}")
-    elif isinstance(env, list):
+    elif isinstance(env, Sequence) and not isinstance(env, str):
         for item in env:
             if '=' in item:
                 # if the items is of the form 'a=b', add it to the environment list
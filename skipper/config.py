@@ -1,45 +1,237 @@
+import hashlib
+import json
 import os
+import threading
+import time
 from collections import defaultdict
-from re import findall
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from re import compile as compile_expression
 from string import Template
 from subprocess import check_output
 
 import six
-import yaml
+
+from skipper.cache import cache_dir, write_json
+from skipper.utils import env_flag
+
+
+CONFIG_CACHE_VERSION = 3
+# A config modified this recently may be modified again without its mtime changing, it is not cached yet
+RACY_MARGIN_NS = 2 * 10 ** 9
+COMMAND = compile_expression(r'\$\(.+\)')
+MAX_CONCURRENT_COMMANDS = 8
 
 
 def load_defaults():
+    """
+    Loads skipper.yaml (or $SKIPPER_CONF), without evaluating it.
+
+    :return: An instance of LazyConfig, whose values are interpolated when first accessed
+    """
     skipper_conf = os.environ.get('SKIPPER_CONF', 'skipper.yaml')
 
-    defaults = {}
-    if os.path.exists(skipper_conf):
-        with open(skipper_conf) as confile:
-            config = yaml.safe_load(confile)
-            containers = config.pop('containers', None)
-        _normalize_config(config, defaults)
-        if containers:
-            defaults['containers'] = containers
-    return defaults
-
-
-def _normalize_config(config, normalized_config):
-    for key, value in six.iteritems(config):
-        normalized_key = key.replace('-', '_')
-        if isinstance(value, dict):
-            normalized_config[normalized_key] = {}
-            _normalize_config(value, normalized_config[normalized_key])
-        elif isinstance(value, list):
-            normalized_config[normalized_key] = [_interpolate_env_vars(x) for x in value]
+    if not os.path.exists(skipper_conf):
+        return {}
+
+    cache_path, key = _config_cache_key(skipper_conf)
+    config = _load_cached_config(cache_path, key)
+    if config is None:
+        config = _load_config(skipper_conf)
+        _store_cached_config(cache_path, key, config)
+
+    # Only the parsed config is cached, its commands run again on every invocation as their output may change
+    return LazyConfig(config, Interpolator(), raw_keys=('containers',))
+
+
+def _load_config(skipper_conf):
+    import yaml
+
+    with open(skipper_conf) as confile:
+        # libyaml's loader is several times faster than the pure Python one, when it is available
+        config = yaml.load(confile, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    containers = config.pop('containers', None)
+    config = _normalize_keys(config)
+    if containers:
+        config['containers'] = containers
+    return config
+
+
+def _config_cache_key(skipper_conf):
+    """
+    Returns where the normalized config is cached, and the stat of the config file it is valid for.
+
+    :return: A tuple of the cache path and the key, or (None, None) when the cache is disabled
+    """
+    if not env_flag('SKIPPER_CONFIG_CACHE', default=True):
+        return None, None
+    try:
+        conf_stat = os.stat(skipper_conf)
+    except OSError:
+        return None, None
+    path = os.path.realpath(skipper_conf)
+    cache_path = cache_dir('config', hashlib.sha256(os.fsencode(path)).hexdigest() + '.json')
+    return cache_path, [path, conf_stat.st_mtime_ns, conf_stat.st_size, conf_stat.st_ino]
+
+
+def _load_cached_config(cache_path, key):
+    if not cache_path:
+        return None
+    try:
+        with open(cache_path) as cache_file:
+            entry = json.load(cache_file)
+        if entry['version'] != CONFIG_CACHE_VERSION or entry['key'] != key:
+            return None
+        return entry['config']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _store_cached_config(cache_path, key, config):
+    if not cache_path or time.time_ns() - key[1] < RACY_MARGIN_NS:
+        return
+    try:
+        # Values that don't survive a JSON round trip, such as dates or non string keys, are not cached
+        if json.loads(json.dumps(config)) != config:
+            return
+        write_json(cache_path, {'version': CONFIG_CACHE_VERSION, 'key': key, 'config': config})
+    except (OSError, TypeError, ValueError):
+        # The next invocation parses the file again
+        pass
+
+
+def _normalize_keys(config):
+    return {
+        key.replace('-', '_'): _normalize_keys(value) if isinstance(value, dict) else value
+        for key, value in six.iteritems(config)
+    }
+
+
+def _run_command(match):
+    output = check_output("echo " + match, shell=True).strip().decode("utf-8")
+    if not output:
+        raise ValueError(match)
+    return output
+
+
+class Interpolator:
+    """
+    Interpolates config values: runs their $(...) commands, then substitutes environment variables.
+
+    The output of every command is memoized for the lifetime of the interpolator, and given commands that were not
+    run yet are run concurrently.
+    """
+
+    def __init__(self):
+        self.outputs = {}
+        self._lock = threading.Lock()
+
+    def run(self, commands):
+        """Runs the given commands that were not run yet, concurrently."""
+        with self._lock:
+            missing = [command for command in dict.fromkeys(commands) if command not in self.outputs]
+        if not missing:
+            return
+        if len(missing) == 1:
+            outputs = [_run_command(missing[0])]
         else:
-            normalized_config[normalized_key] = _interpolate_env_vars(value)
-
-
-def _interpolate_env_vars(key):
-    if not key or isinstance(key, bool):
-        return key
-    for match in findall(r'\$\(.+\)', key):
-        output = check_output("echo " + match, shell=True).strip().decode("utf-8")
-        if not output:
-            raise ValueError(match)
-        key = key.replace(match, output)
-    return Template(key).substitute(defaultdict(lambda: "", os.environ))
+            with ThreadPoolExecutor(max_workers=min(len(missing), MAX_CONCURRENT_COMMANDS)) as executor:
+                outputs = list(executor.map(_run_command, missing))
+        with self._lock:
+            self.outputs.update(zip(missing, outputs))
+
+    def interpolate(self, value):
+        if not value or not isinstance(value, str):
+            return value
+        matches = COMMAND.findall(value)
+        self.run(matches)
+        for match in matches:
+            value = value.replace(match, self.outputs[match])
+        return Template(value).substitute(defaultdict(lambda: "", os.environ))
+
+
+def _commands(values):
+    return [match for value in values if isinstance(value, str) for match in COMMAND.findall(value)]
+
+
+def _lazy_value(value, interpolator):
+    if isinstance(value, dict):
+        return LazyConfig(value, interpolator)
+    if isinstance(value, list):
+        return LazyList(value, interpolator)
+    return interpolator.interpolate(value)
+
+
+class LazyConfig(Mapping):
+    """
+    A read only mapping of config values, each one interpolated when it is first accessed.
+
+    Reading all of its values at once (items(), values()) runs their commands concurrently.
+    """
+
+    def __init__(self, config, interpolator, raw_keys=()):
+        """
+        :param config: The config, with normalized keys
+        :param interpolator: An instance of Interpolator
+        :param raw_keys: Keys whose values are returned as is
+        """
+        self._config = config
+        self._interpolator = interpolator
+        self._raw_keys = raw_keys
+        self._values = {}
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            value = self._config[key]
+            self._values[key] = value if key in self._raw_keys else _lazy_value(value, self._interpolator)
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._config)
+
+    def __len__(self):
+        return len(self._config)
+
+    def __repr__(self):
+        return f'LazyConfig({self._config!r})'
+
+    def items(self):
+        self._prefetch()
+        return super().items()
+
+    def values(self):
+        self._prefetch()
+        return super().values()
+
+    def _prefetch(self):
+        self._interpolator.run(_commands(
+            value for key, value in self._config.items() if key not in self._values and key not in self._raw_keys))
+
+
+class LazyList(Sequence):
+    """A read only list of config values, interpolated (concurrently) when one of them is first accessed."""
+
+    def __init__(self, config, interpolator):
+        self._config = config
+        self._interpolator = interpolator
+        self._values = None
+
+    def _evaluate(self):
+        if self._values is None:
+            self._interpolator.run(_commands(self._config))
+            self._values = [_lazy_value(value, self._interpolator) for value in self._config]
+        return self._values
+
+    def __getitem__(self, index):
+        return self._evaluate()[index]
+
+    def __len__(self):
+        return len(self._config)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyList)):
+            return self._evaluate() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'LazyList({self._config!r})'
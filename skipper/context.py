@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+import re
+import stat
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from skipper import git
+from skipper.cache import cache_dir, write_json
+
+if TYPE_CHECKING:
+    # The builder imports this module to send git build contexts
+    from skipper.builder import BuildOptions
+
+
+DOCKERIGNORE = '.dockerignore'
+CONTENT_HASH_TAG = 'content:hash'
+# Length of the hexadecimal digest used as a tag
+TAG_LENGTH = 16
+CHUNK_SIZE = 1024 * 1024
+# Name of a Dockerfile that is not part of the files of a git build context in its archive
+ARCHIVED_DOCKERFILE = '.skipper.Dockerfile'
+# Why the files of a directory are sent to the builder or not, in a context report
+SENT = 'sent'
+IGNORED = 'ignored'
+UNTRACKED = 'untracked'
+
+
+def _pattern_regex(pattern):
+    # Translates a Go filepath.Match pattern, extended with '**' like docker does, to a regex
+    regex = ''
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith('**/', index):
+            regex += '(.*/)?'
+            index += 2
+        elif pattern.startswith('**', index):
+            regex += '.*'
+            index += 1
+        elif char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[' and ']' in pattern[index + 2:]:
+            end = pattern.index(']', index + 2)
+            char_class = pattern[index + 1:end].replace('\\', '\\\\')
+            regex += '[' + char_class + ']'
+            index = end
+        elif char == '\\' and index + 1 < len(pattern):
+            index += 1
+            regex += re.escape(pattern[index])
+        else:
+            regex += re.escape(char)
+        index += 1
+    return re.compile(regex + '$')
+
+
+class DockerIgnore:
+    """
+    The exclusion rules of a .dockerignore file.
+
+    Like docker, a path is excluded when it or one of its parent directories matches the last
+    matching pattern, and patterns starting with '!' re-include paths.
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            exclusion = pattern.startswith('!')
+            pattern = pattern[1:].strip() if exclusion else pattern
+            pattern = os.path.normpath(pattern).replace(os.sep, '/').lstrip('/')
+            if pattern and pattern != '.':
+                self.patterns.append((_pattern_regex(pattern), exclusion))
+        self.has_exclusions = any(exclusion for _, exclusion in self.patterns)
+
+    @classmethod
+    def load(cls, context_dir, dockerfile=None):
+        """
+        Loads the ignore file of a build context, preferring the Dockerfile specific <Dockerfile>.dockerignore.
+
+        :param context_dir: Path of the build context
+        :param dockerfile: Path of the Dockerfile
+        :return: An instance of DockerIgnore, without patterns if there is no ignore file
+        """
+        candidates = [dockerfile + DOCKERIGNORE] if dockerfile else []
+        candidates.append(os.path.join(context_dir, DOCKERIGNORE))
+        for candidate in candidates:
+            try:
+                with open(candidate) as ignore_file:
+                    return cls(ignore_file.read().splitlines())
+            except OSError:
+                continue
+        return cls()
+
+    def ignored(self, path):
+        """
+        :param path: Path relative to the build context, '/' separated
+        :return: True if the path is not sent to the builder
+        """
+        parts = path.split('/')
+        parents = ['/'.join(parts[:index]) for index in range(1, len(parts) + 1)]
+        ignored = False
+        for regex, exclusion in self.patterns:
+            if exclusion == ignored and any(regex.match(parent) for parent in parents):
+                ignored = not exclusion
+        return ignored
+
+
+def context_files(context_dir, ignore):
+    """
+    Lists the files of a build context that are sent to the builder.
+
+    :param context_dir: Path of the build context
+    :param ignore: An instance of DockerIgnore
+    :return: Sorted paths relative to the build context, '/' separated
+    """
+    files = []
+    for root, dirs, filenames in os.walk(context_dir):
+        relative_root = os.path.relpath(root, context_dir).replace(os.sep, '/')
+        prefix = '' if relative_root == '.' else relative_root + '/'
+        if not ignore.has_exclusions:
+            # An excluded directory can only be skipped when no pattern may re-include its content
+            dirs[:] = [name for name in dirs if not ignore.ignored(prefix + name)]
+        for name in filenames + [name for name in dirs if os.path.islink(os.path.join(root, name))]:
+            if not ignore.ignored(prefix + name):
+                files.append(prefix + name)
+    return sorted(files)
+
+
+def git_context_files(context_dir, dockerfile=None):
+    """
+    Lists the files of a build context that are tracked by git and not excluded by its .dockerignore.
+
+    :param context_dir: Path of the build context
+    :param dockerfile: Path of the Dockerfile, whose own <Dockerfile>.dockerignore takes precedence
+    :return: Sorted paths relative to the build context, '/' separated
+    :raises subprocess.CalledProcessError: If the build context is not in a git work tree
+    """
+    ignore = DockerIgnore.load(context_dir, dockerfile)
+    return sorted(path for path in git.tracked_files(context_dir)
+                  if not ignore.ignored(path) and os.path.lexists(os.path.join(context_dir, path)))
+
+
+def _normalized(tar_info):
+    # The owner of the files in the checkout doesn't matter to the image, ADD and COPY use root unless told otherwise
+    tar_info.uid = tar_info.gid = 0
+    tar_info.uname = tar_info.gname = ''
+    return tar_info
+
+
+def write_context_archive(stream, context_dir, files, dockerfile=None):
+    """
+    Writes a build context to a stream as an uncompressed tar archive, as read by `docker build -`.
+
+    :param stream: Binary stream to write to
+    :param context_dir: Path of the build context
+    :param files: Paths of the files to archive, relative to the build context
+    :param dockerfile: Path of a Dockerfile to archive as ARCHIVED_DOCKERFILE
+    """
+    with tarfile.open(fileobj=stream, mode='w|') as archive:
+        for path in files:
+            archive.add(os.path.join(context_dir, path), arcname=path, recursive=False, filter=_normalized)
+        if dockerfile:
+            archive.add(dockerfile, arcname=ARCHIVED_DOCKERFILE, filter=_normalized)
+
+
+def context_report(context_dir, dockerfile=None, depth=1, tracked=None):
+    """
+    Sums up the sizes of the files of a build context by directory, and whether they are sent to the builder.
+
+    :param context_dir: Path of the build context
+    :param dockerfile: Path of the Dockerfile, whose own <Dockerfile>.dockerignore takes precedence
+    :param depth: Number of path components to group the files by
+    :param tracked: Paths of the files tracked by git, for a git build context
+    :return: List of dicts with the path, status (SENT, IGNORED or UNTRACKED), number of files and bytes of every
+             group, largest first
+    """
+    ignore = DockerIgnore.load(context_dir, dockerfile)
+    tracked = set(tracked) if tracked is not None else None
+    groups = {}
+    for root, _, filenames in os.walk(context_dir):
+        relative_root = os.path.relpath(root, context_dir).replace(os.sep, '/')
+        prefix = '' if relative_root == '.' else relative_root + '/'
+        for name in filenames:
+            path = prefix + name
+            if ignore.ignored(path):
+                status = IGNORED
+            elif tracked is not None and path not in tracked:
+                status = UNTRACKED
+            else:
+                status = SENT
+            group = groups.setdefault(('/'.join(path.split('/')[:depth]), status), {'files': 0, 'bytes': 0})
+            group['files'] += 1
+            group['bytes'] += os.lstat(os.path.join(root, name)).st_size
+    rows = [{'path': path, 'status': status, **group} for (path, status), group in groups.items()]
+    return sorted(rows, key=lambda row: (-row['bytes'], row['path']))
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StatIndex:
+    """
+    Remembers the digests of the files of a build context, keyed by their path, along with
+    their mtime, size and inode, like git's index does. A file is only read again when one of
+    them changed. Files modified shortly before the index was saved are always read again,
+    as a later change within the file system's timestamp granularity could go unnoticed.
+    """
+
+    VERSION = 1
+    RACY_MARGIN_NS = 2 * 10 ** 9
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.saved_at = 0
+        self._dirty = False
+        try:
+            with open(path) as index_file:
+                data = json.load(index_file)
+            if data.get('version') == self.VERSION:
+                self.entries = data['entries']
+                self.saved_at = data['saved_at']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    @classmethod
+    def for_context(cls, context_dir):
+        """
+        :param context_dir: Path of the build context
+        :return: The index of the build context, stored under skipper's cache directory
+        """
+        return cls(cache_dir('context', hashlib.sha256(os.fsencode(os.path.realpath(context_dir))).hexdigest() + '.json'))
+
+    def lookup(self, path, file_stat):
+        entry = self.entries.get(path)
+        if not entry or entry[:3] != [file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino]:
+            return None
+        if file_stat.st_mtime_ns >= self.saved_at - self.RACY_MARGIN_NS:
+            return None
+        return entry[3]
+
+    def update(self, path, file_stat, file_digest):
+        self.entries[path] = [file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino, file_digest]
+        self._dirty = True
+
+    def save(self, context_dir):
+        """Writes the index, dropping the entries of files that were removed from the build context."""
+        removed = [path for path in self.entries if not os.path.lexists(os.path.join(context_dir, path))]
+        for path in removed:
+            del self.entries[path]
+        if not (self._dirty or removed):
+            return
+        try:
+            write_json(self.path, {'version': self.VERSION, 'saved_at': time.time_ns(), 'entries': self.entries})
+            self._dirty = False
+        except OSError:
+            # The next invocation hashes the files again
+            pass
+
+
+def hash_context(context_dir, dockerfile=None, jobs=None, use_index=True):
+    """
+    Computes a digest of the files of a build context that are not excluded by its .dockerignore.
+
+    Unchanged files are not read again when the context's stat index is used, and the
+    changed ones are read concurrently.
+
+    :param context_dir: Path of the build context
+    :param dockerfile: Path of the Dockerfile, whose own <Dockerfile>.dockerignore takes precedence
+    :param jobs: Number of files to hash concurrently, defaults to the number of CPUs
+    :param use_index: Use (and update) the stat index of the build context
+    :return: The hexadecimal digest
+    """
+    index = StatIndex.for_context(context_dir) if use_index else None
+    files = []
+    for path in context_files(context_dir, DockerIgnore.load(context_dir, dockerfile)):
+        full_path = os.path.join(context_dir, path)
+        file_stat = os.lstat(full_path)
+        if stat.S_ISLNK(file_stat.st_mode):
+            files.append((path, b'link', os.readlink(full_path), None))
+            continue
+        # Only the executable bit matters for the image, other permissions vary between checkouts
+        kind = b'exec' if file_stat.st_mode & stat.S_IXUSR else b'file'
+        files.append((path, kind, index.lookup(path, file_stat) if index is not None else None, file_stat))
+
+    changed = [(path, file_stat) for path, kind, file_digest, file_stat in files if kind != b'link' and not file_digest]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1 and len(changed) > 1:
+        # hashlib releases the GIL while hashing, so threads do use several cores
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            digests = dict(zip((path for path, _ in changed),
+                               executor.map(_file_digest, (os.path.join(context_dir, path) for path, _ in changed))))
+    else:
+        digests = {path: _file_digest(os.path.join(context_dir, path)) for path, _ in changed}
+
+    digest = hashlib.sha256()
+    for path, kind, file_digest, file_stat in files:
+        if path in digests:
+            file_digest = digests[path]
+            if index is not None:
+                index.update(path, file_stat, file_digest)
+        entry = [path.encode('utf-8', 'surrogateescape'), kind, file_digest.encode('utf-8', 'surrogateescape')]
+        digest.update(b'\0'.join(entry) + b'\0')
+
+    if index is not None:
+        index.save(context_dir)
+    return digest.hexdigest()
+
+
+def content_hash(options: 'BuildOptions', jobs=None, use_index=True) -> str:
+    """
+    Computes a digest of everything a build depends on: the Dockerfile, the build arguments,
+    and the files of the build contexts that are not excluded by their .dockerignore.
+
+    :param options: Build options as an instance of BuildOptions
+    :param jobs: Number of files to hash concurrently, defaults to the number of CPUs
+    :param use_index: Use (and update) the stat index of the build contexts
+    :return: The digest, usable as an image tag
+    """
+    digest = hashlib.sha256()
+    dockerfile = options.image.dockerfile
+    digest.update(b'dockerfile\0' + _file_digest(dockerfile).encode('utf-8') + b'\0')
+    for arg in options.build_args:
+        digest.update(b'arg\0' + arg.encode('utf-8') + b'\0')
+
+    context_digest = hash_context(options.container_context or '.', dockerfile, jobs, use_index)
+    digest.update(b'context\0' + context_digest.encode('utf-8') + b'\0')
+    for build_ctx in options.build_contexts:
+        digest.update(b'context\0' + build_ctx.encode('utf-8') + b'\0')
+        _, _, location = build_ctx.partition('=')
+        if os.path.isdir(location):
+            digest.update(hash_context(location, jobs=jobs, use_index=use_index).encode('utf-8') + b'\0')
+
+    return digest.hexdigest()[:TAG_LENGTH]
@@ -0,0 +1,61 @@
+#!/usr/bin/env bash
+# Runs in a skipper session container: "keepalive" keeps the container running until it was idle for
+# SKIPPER_SESSION_TIMEOUT seconds, "exec <command>" runs a command in it, as skipper-entrypoint.sh would.
+
+SESSION_DIR=/tmp/.skipper-session-${HOSTNAME}
+
+keepalive() {
+  mkdir -p ${SESSION_DIR}
+  chmod 777 ${SESSION_DIR}
+  touch ${SESSION_DIR}/last-used ${SESSION_DIR}/ready
+
+  while true; do
+    sleep 5
+    busy=false
+    for marker in ${SESSION_DIR}/busy.*; do
+      [ -e "${marker}" ] || continue
+      # A command whose process is gone was killed before it could remove its marker
+      if [ -d /proc/${marker##*.} ]; then
+        busy=true
+      else
+        rm -f "${marker}"
+      fi
+    done
+
+    if [ "${busy}" == "true" ]; then
+      touch ${SESSION_DIR}/last-used
+    elif [ $(( $(date +%s) - $(stat -c %Y ${SESSION_DIR}/last-used) )) -ge ${SKIPPER_SESSION_TIMEOUT} ]; then
+      exit 0
+    fi
+  done
+}
+
+run() {
+  # The user is set up by skipper-entrypoint.sh (or the user layer) before keepalive starts
+  for _ in $(seq 300); do
+    [ -e ${SESSION_DIR}/ready ] && break
+    sleep 0.1
+  done
+
+  touch ${SESSION_DIR}/busy.$$ ${SESSION_DIR}/last-used
+  trap "rm -f ${SESSION_DIR}/busy.$$; touch ${SESSION_DIR}/last-used" EXIT
+
+  if [ "$(id -u)" != "0" ] || [ -z "${SKIPPER_DOCKER_GID}" ]; then
+    # Already running as the user (of a user layer), or as root without a user to switch to
+    bash -c "$@"
+  elif [ "$SKIPPER_USE_SUDO" == "true" ]; then
+    sudo -sE -u ${SKIPPER_USERNAME} "$@"
+  else
+    su -m ${SKIPPER_USERNAME} -c "$@"
+  fi
+}
+
+case "$1" in
+  keepalive)
+    keepalive
+    ;;
+  exec)
+    shift
+    run "$@"
+    ;;
+esac
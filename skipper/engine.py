@@ -0,0 +1,186 @@
+import http.client
+import json
+import logging
+import os
+import socket
+from urllib.parse import quote, urlencode
+
+
+DOCKER_SOCKET = '/var/run/docker.sock'
+PODMAN_ROOT_SOCKET = '/run/podman/podman.sock'
+
+
+class EngineError(RuntimeError):
+    def __init__(self, status, message):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a unix domain socket."""
+
+    def __init__(self, path, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self.sock = sock
+
+
+class EngineClient:
+    """
+    A minimal client of the Docker Engine API (also served by podman's compatibility socket).
+
+    Talks HTTP over a single persistent connection to the runtime's unix socket, instead of
+    forking the runtime's CLI for every query.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = UnixHTTPConnection(path)
+
+    def request(self, method, path, params=None, body=None):
+        """
+        Sends a request to the engine, reconnecting once if the connection was dropped.
+
+        :return: A tuple of the response status and its decoded JSON body (or None)
+        """
+        if params:
+            path += '?' + urlencode(params)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        payload = json.dumps(body) if body is not None else None
+        try:
+            response, data = self._send(method, path, payload, headers)
+        except (http.client.RemoteDisconnected, http.client.CannotSendRequest, BrokenPipeError, ConnectionResetError):
+            # The engine closed the idle keep-alive connection, retry once over a new one
+            self._connection.close()
+            response, data = self._send(method, path, payload, headers)
+
+        if data and 'json' in response.getheader('Content-Type', ''):
+            return response.status, json.loads(data)
+        return response.status, data.decode('utf-8', errors='replace') or None
+
+    def _send(self, method, path, payload, headers):
+        self._connection.request(method, path, body=payload, headers=headers)
+        response = self._connection.getresponse()
+        return response, response.read()
+
+    def ping(self):
+        status, _ = self.request('GET', '/_ping')
+        return status == http.client.OK
+
+    def image_exists(self, name):
+        status, body = self.request('GET', f'/images/{_quote(name)}/json')
+        _check(status, body, http.client.OK, http.client.NOT_FOUND)
+        return status == http.client.OK
+
+    def image_id(self, name):
+        status, body = self.request('GET', f'/images/{_quote(name)}/json')
+        _check(status, body, http.client.OK, http.client.NOT_FOUND)
+        return body.get('Id') if status == http.client.OK else None
+
+    def tag_image(self, source, target):
+        repository, tag = split_image_tag(target)
+        status, body = self.request('POST', f'/images/{_quote(source)}/tag', params={'repo': repository, 'tag': tag})
+        _check(status, body, http.client.OK, http.client.CREATED)
+
+    def remove_image(self, name):
+        status, body = self.request('DELETE', f'/images/{_quote(name)}')
+        _check(status, body, http.client.OK)
+
+    def network_exists(self, name):
+        status, body = self.request('GET', f'/networks/{_quote(name)}')
+        _check(status, body, http.client.OK, http.client.NOT_FOUND)
+        return status == http.client.OK
+
+    def create_network(self, name):
+        status, body = self.request('POST', '/networks/create', body={'Name': name, 'CheckDuplicate': True})
+        _check(status, body, http.client.OK, http.client.CREATED)
+
+    def remove_network(self, name):
+        status, body = self.request('DELETE', f'/networks/{_quote(name)}')
+        _check(status, body, http.client.OK, http.client.NO_CONTENT)
+
+    def container_running(self, name):
+        status, body = self.request('GET', f'/containers/{_quote(name)}/json')
+        _check(status, body, http.client.OK, http.client.NOT_FOUND)
+        return status == http.client.OK and bool(body.get('State', {}).get('Running'))
+
+    def close(self):
+        self._connection.close()
+
+
+def _check(status, body, *expected):
+    if status not in expected:
+        message = body.get('message', body) if isinstance(body, dict) else body
+        raise EngineError(status, message)
+
+
+def _quote(name):
+    return quote(name, safe='/:@')
+
+
+def split_image_tag(image):
+    """
+    Splits an image reference into its repository and tag, a port in the registry is not a tag.
+
+    :return: A tuple of the repository and the tag ('latest' when missing)
+    """
+    repository, _, tag = image.rpartition(':')
+    if not repository or '/' in tag:
+        return image, 'latest'
+    return repository, tag
+
+
+def socket_path(runtime):
+    """
+    Returns the unix socket the given runtime's CLI talks to, or None if it is not a local socket.
+    """
+    host = os.environ.get('DOCKER_HOST' if runtime == 'docker' else 'CONTAINER_HOST')
+    if host:
+        return host[len('unix://'):] if host.startswith('unix://') else None
+    if runtime == 'docker':
+        # A non default docker context may point anywhere, leave it to the CLI
+        return DOCKER_SOCKET if _docker_context() in (None, 'default') else None
+    if runtime == 'podman':
+        runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+        if os.getuid() != 0 and runtime_dir:
+            return os.path.join(runtime_dir, 'podman', 'podman.sock')
+        return PODMAN_ROOT_SOCKET
+    return None
+
+
+def _docker_context():
+    if os.environ.get('DOCKER_CONTEXT'):
+        return os.environ['DOCKER_CONTEXT']
+    config_dir = os.environ.get('DOCKER_CONFIG') or os.path.join(os.path.expanduser('~'), '.docker')
+    try:
+        with open(os.path.join(config_dir, 'config.json')) as config_file:
+            return json.load(config_file).get('currentContext')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def connect(runtime):
+    """
+    Connects to the engine API of the given runtime.
+
+    :param runtime: The container runtime command, docker or podman
+    :return: An instance of EngineClient, or None when the runtime's socket is not reachable
+    """
+    path = socket_path(runtime)
+    if not path or not os.path.exists(path):
+        return None
+
+    client = EngineClient(path)
+    try:
+        if client.ping():
+            logging.getLogger('skipper').debug('Using the %s engine API at %s', runtime, path)
+            return client
+    except (OSError, http.client.HTTPException):
+        pass
+    client.close()
+    return None
@@ -1,31 +1,227 @@
+import functools
 import logging
 import os
+import re
 import subprocess
+import threading
+
+
+DIRTY_CHECK_STRATEGIES = ('full', 'scoped', 'off')
+# How get_hash checks for uncommitted changes, set by the cli
+DIRTY_CHECK = 'full'
+# Paths checked by the scoped strategy
+DIRTY_CHECK_PATHS = ()
+DIRTY_CHECK_IN_BACKGROUND = False
+
+OBJECT_ID = re.compile(r'^([0-9a-f]{40}|[0-9a-f]{64})$')
+# Symbolic refs pointing to symbolic refs are followed up to this depth, like git does
+MAX_SYMREF_DEPTH = 5
 
 
 def get_hash(short=False):
+    """
+    Returns the revision of HEAD, resolved once per process and working directory.
+
+    :param short: Return the abbreviated revision
+    :return: The revision, or 'none' when not working in a git repository
+    """
+    return _get_hash(os.getcwd(), short)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_hash(cwd, short):  # pylint: disable=unused-argument
     if not is_git_repository():
         logging.warning('*** Not working in a git repository ***')
         return 'none'
 
+    _warn_on_uncommitted_changes()
+
+    # Abbreviating a revision uniquely requires the object database, only git can do it
+    revision = None if short else resolve_head(find_git_dir())
+    if revision:
+        return revision
+
     git_command = ['git', 'rev-parse']
     if short:
         git_command += ['--short']
     git_command += ['HEAD']
+    return subprocess.check_output(git_command).strip().decode('utf-8')
 
-    if uncommitted_changes():
-        logging.warning("*** Uncommitted changes present - Build container version might be outdated ***")
 
-    return subprocess.check_output(git_command).strip().decode('utf-8')
+def _warn_on_uncommitted_changes():
+    def check():
+        if uncommitted_changes(DIRTY_CHECK, DIRTY_CHECK_PATHS):
+            logging.warning("*** Uncommitted changes present - Build container version might be outdated ***")
 
+    if DIRTY_CHECK == 'off':
+        return
+    if DIRTY_CHECK_IN_BACKGROUND:
+        # The check only leads to a warning, the command does not wait for it (and it is not shown if the command ends first,
+        # which is why it is opt-in)
+        threading.Thread(target=check, name='git-dirty-check', daemon=True).start()
+    else:
+        check()
 
-def uncommitted_changes():
-    """Return True is there are uncommitted changes."""
-    return subprocess.call(['git', 'diff', '--quiet', 'HEAD']) != 0
+
+def uncommitted_changes(strategy='full', paths=()):
+    """
+    Return True is there are uncommitted changes.
+
+    :param strategy: One of DIRTY_CHECK_STRATEGIES, scoped only checks the given paths
+    :param paths: Paths checked by the scoped strategy
+    :return: True if there are uncommitted changes, always False with the off strategy
+    """
+    if strategy == 'off':
+        return False
+    # git diff already uses the repository's own core.fsmonitor and core.untrackedCache settings
+    command = ['git', 'diff', '--quiet', 'HEAD']
+    if strategy == 'scoped' and paths:
+        command += ['--'] + list(paths)
+    return subprocess.call(command) != 0
+
+
+def tracked_files(path='.'):
+    """
+    Lists the files tracked by git under a directory, those of its submodules included.
+
+    :param path: Path of the directory
+    :return: Paths relative to the directory, '/' separated, including tracked files deleted from the work tree
+    :raises subprocess.CalledProcessError: If the directory is not in a git work tree
+    """
+    output = subprocess.check_output(['git', '-C', path, 'ls-files', '-z', '--recurse-submodules'], stderr=subprocess.DEVNULL)
+    return [name for name in output.decode('utf-8', 'surrogateescape').split('\0') if name]
 
 
 def is_git_repository():
-    if os.path.exists('.git'):
-        return True
-    command = ['git', 'rev-parse', '--is-inside-work-tree']
-    return subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+    return find_git_dir() is not None
+
+
+def find_git_dir(path='.'):
+    """
+    Looks for the git directory of the work tree containing the given path, like git does.
+
+    Layouts it does not recognize are left to git rev-parse --git-dir.
+
+    :param path: A path inside the work tree
+    :return: The path of the git directory, or None if it was not found
+    """
+    path = os.path.abspath(path)
+    git_dir = _find_git_dir(path)
+    return git_dir if git_dir is not None else _rev_parse_git_dir(path)
+
+
+def _find_git_dir(path):
+    if os.environ.get('GIT_DIR'):
+        return os.environ['GIT_DIR'] if os.path.isdir(os.environ['GIT_DIR']) else None
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return dot_git
+        if os.path.isfile(dot_git):
+            # Work trees and submodules have a .git file pointing to their git directory
+            return _read_gitdir_file(dot_git)
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _rev_parse_git_dir(path):
+    try:
+        output = subprocess.check_output(['git', '-C', path, 'rev-parse', '--git-dir'], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    # The git directory is relative to the given path, unless it is outside of it
+    return os.path.join(path, output.strip().decode('utf-8'))
+
+
+def _read_gitdir_file(path):
+    try:
+        with open(path) as gitdir_file:
+            content = gitdir_file.read().strip()
+    except OSError:
+        return None
+    if not content.startswith('gitdir:'):
+        return None
+    git_dir = os.path.join(os.path.dirname(path), content[len('gitdir:'):].strip())
+    return os.path.normpath(git_dir) if os.path.isdir(git_dir) else None
+
+
+def _common_dir(git_dir):
+    # The git directory of a linked work tree only has its own HEAD, the refs are in the main one
+    try:
+        with open(os.path.join(git_dir, 'commondir')) as commondir_file:
+            return os.path.normpath(os.path.join(git_dir, commondir_file.read().strip()))
+    except OSError:
+        return git_dir
+
+
+def _read_ref(git_dir, common_dir, ref):
+    for directory in dict.fromkeys([git_dir, common_dir]):
+        try:
+            with open(os.path.join(directory, ref)) as ref_file:
+                return ref_file.read().strip()
+        except OSError:
+            continue
+    try:
+        with open(os.path.join(common_dir, 'packed-refs')) as packed_refs:
+            for line in packed_refs:
+                if line.startswith(('#', '^')):
+                    continue
+                object_id, _, name = line.strip().partition(' ')
+                if name == ref:
+                    return object_id
+    except OSError:
+        pass
+    return None
+
+
+def resolve_head(git_dir):
+    """
+    Resolves HEAD by reading the git directory, without running git.
+
+    :param git_dir: Path of the git directory, as returned by find_git_dir
+    :return: The revision, or None if it could not be resolved, e.g. for an unborn branch,
+             or a repository whose refs are not stored as files
+    """
+    if not git_dir:
+        return None
+    common_dir = _common_dir(git_dir)
+    value = _read_ref(git_dir, common_dir, 'HEAD')
+    for _ in range(MAX_SYMREF_DEPTH):
+        if not value or not value.startswith('ref:'):
+            break
+        value = _read_ref(git_dir, common_dir, value[len('ref:'):].strip())
+    return value if value and OBJECT_ID.match(value) else None
+
+
+def current_branch(git_dir):
+    """
+    Returns the branch checked out in the work tree, by reading the git directory.
+
+    :param git_dir: Path of the git directory, as returned by find_git_dir
+    :return: The branch name, or None for a detached HEAD
+    """
+    if not git_dir:
+        return None
+    value = _read_ref(git_dir, _common_dir(git_dir), 'HEAD')
+    if value and value.startswith('ref: refs/heads/'):
+        return value[len('ref: refs/heads/'):]
+    return None
+
+
+def default_branch(git_dir, remote='origin'):
+    """
+    Returns the default branch of a remote, as recorded by git clone (or git remote set-head).
+
+    :param git_dir: Path of the git directory, as returned by find_git_dir
+    :param remote: Name of the remote
+    :return: The branch name, or None if it is not known
+    """
+    if not git_dir:
+        return None
+    prefix = f'ref: refs/remotes/{remote}/'
+    value = _read_ref(git_dir, _common_dir(git_dir), f'refs/remotes/{remote}/HEAD')
+    if value and value.startswith(prefix):
+        return value[len(prefix):]
+    return None
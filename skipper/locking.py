@@ -0,0 +1,127 @@
+import fcntl
+import os
+import socket
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+# Seconds between attempts to take a lock held by another process, doubled up to the maximum
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 1
+
+
+class LockTimeout(TimeoutError):
+    """The lock was not acquired in time, or its holder is gone."""
+
+    def __init__(self, path, holder, stale=False):
+        state = 'is not running but still holds' if stale else 'still holds'
+        super().__init__(f'{holder or "Another process"} {state} {path}')
+        self.path = path
+        self.holder = holder
+        self.stale = stale
+
+
+def runtime_dir(*parts):
+    """
+    Returns a path under skipper's runtime directory, which holds the state shared by concurrent invocations
+    ($SKIPPER_RUNTIME_DIR, or skipper under $XDG_RUNTIME_DIR, or skipper-<uid> under the temporary directory).
+
+    :param parts: Path components under the runtime directory
+    :return: The path, which is not created
+    """
+    base = os.environ.get('SKIPPER_RUNTIME_DIR')
+    if not base and os.environ.get('XDG_RUNTIME_DIR'):
+        base = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'skipper')
+    if not base:
+        base = os.path.join(tempfile.gettempdir(), f'skipper-{os.getuid()}')
+    return os.path.join(base, *parts)
+
+
+def process_alive(pid):
+    """
+    :param pid: Process id, of this host
+    :return: True if the process is running (or exists as another user's)
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _holder(lock_file):
+    lock_file.seek(0)
+    return lock_file.read().strip()
+
+
+def _holder_gone(holder):
+    # The lock is released by the kernel when its holder dies, unless a process it started inherited it
+    try:
+        pid, hostname = holder.split()[:2]
+        return hostname == socket.gethostname() and not process_alive(int(pid))
+    except ValueError:
+        return False
+
+
+@contextmanager
+def file_lock(path, shared=False, timeout=None):
+    """
+    Holds an flock(2) lock of the given file, which is created if needed, until the context exits.
+
+    The lock is released by the kernel when the process dies, a crashed invocation never leaves it behind.
+    The holder of an exclusive lock writes its pid and host name to the file, to tell who others are waiting for,
+    and clears them when it releases the lock.
+
+    :param path: Path of the lock file
+    :param shared: Take a shared lock instead of an exclusive one
+    :param timeout: Seconds to wait for the lock, forever if None
+    :raises LockTimeout: If the lock was not acquired within the timeout, or its holder is not running anymore
+    :return: A context whose value is True if the lock was held by another process when it was requested
+    """
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    with open(path, 'a+') as lock_file:
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        waited = False
+        if timeout is None:
+            try:
+                fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waited = True
+                fcntl.flock(lock_file, operation)
+        else:
+            deadline = time.monotonic() + timeout
+            interval = POLL_INTERVAL
+            gone = None
+            while True:
+                try:
+                    fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                holder = _holder(lock_file)
+                # A holder that died leaves its record behind, until the next one takes the lock and replaces it.
+                # Only a dead holder seen on consecutive polls still holds the lock
+                if _holder_gone(holder):
+                    if holder == gone:
+                        raise LockTimeout(path, holder, stale=True)
+                    gone = holder
+                else:
+                    gone = None
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(path, holder)
+                time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+        try:
+            if not shared:
+                lock_file.truncate(0)
+                lock_file.write(f'{os.getpid()} {socket.gethostname()}\n')
+                lock_file.flush()
+            yield waited
+        finally:
+            if not shared:
+                lock_file.truncate(0)
+                lock_file.flush()
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
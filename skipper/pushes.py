@@ -0,0 +1,125 @@
+# Cache images are pushed by a detached worker process, the command that built them doesn't wait for the push.
+# Every image has a JSON state file under the runtime directory, next to its worker's log, for later invocations.
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from skipper import locking, utils
+from skipper.cache import write_json
+
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def _state_path(fqdn_image):
+    key = hashlib.sha256(fqdn_image.encode('utf-8')).hexdigest()[:16]
+    return locking.runtime_dir('pushes', f'{key}.json')
+
+
+def _read_state(path):
+    try:
+        with open(path) as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return None
+
+
+def status(state):
+    """
+    :param state: State of a push, as returned by pushes()
+    :return: RUNNING, SUCCEEDED or FAILED (including a worker that died before recording its result)
+    """
+    if state.get('returncode') is not None:
+        return SUCCEEDED if state['returncode'] == 0 else FAILED
+    return RUNNING if locking.process_alive(state['pid']) else FAILED
+
+
+def push_in_background(fqdn_image, logger):
+    """
+    Starts pushing an image in a detached worker, unless a push of the same image and digest is already running.
+
+    :param fqdn_image: Image to push
+    :param logger: Logger instance
+    :return: State of the push
+    """
+    path = _state_path(fqdn_image)
+    digest = utils.local_image_id(fqdn_image)
+    with locking.file_lock(path + '.lock'):
+        state = _read_state(path)
+        if state and state.get('digest') == digest and status(state) == RUNNING:
+            logger.info('%s is already being pushed, see %s', fqdn_image, state['log'])
+            return state
+
+        log_path = path[:-len('.json')] + '.log'
+        with open(log_path, 'w') as log_file:
+            # A new session keeps the worker alive when the terminal or make kills skipper's process group
+            worker = subprocess.Popen(  # pylint: disable=consider-using-with
+                [sys.executable, '-m', 'skipper.pushes', path], stdin=subprocess.DEVNULL, stdout=log_file,
+                stderr=subprocess.STDOUT, start_new_session=True)
+        state = {
+            'image': fqdn_image,
+            'digest': digest,
+            'command': [utils.get_runtime_command(), 'push', fqdn_image],
+            'pid': worker.pid,
+            'log': log_path,
+            'started': time.time(),
+            'returncode': None,
+        }
+        write_json(path, state)
+    logger.info('Pushing %s in the background, see %s', fqdn_image, log_path)
+    return state
+
+
+def pushes():
+    """
+    :return: States of the pushes started by this and earlier invocations, the last one of every image
+    """
+    states = [_read_state(path) for path in sorted(glob.glob(locking.runtime_dir('pushes', '*.json')))]
+    return [state for state in states if state]
+
+
+def wait(timeout=None, interval=0.5):
+    """
+    Waits for the running pushes to end.
+
+    :param timeout: Seconds to wait, forever if None
+    :param interval: Seconds between checks
+    :return: The states of the pushes, some of them may still be running if the timeout expired
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        states = pushes()
+        if all(status(state) != RUNNING for state in states):
+            return states
+        if deadline is not None and time.monotonic() >= deadline:
+            return states
+        time.sleep(interval)
+
+
+def _work(path):
+    # The state is written by the parent once the worker started
+    with locking.file_lock(path + '.lock'):
+        state = _read_state(path)
+    if not state:
+        # The parent died before it wrote the state, or it was removed
+        print(f'No push state in {path}, nothing to push', file=sys.stderr, flush=True)
+        return 1
+    # A newer push of the same tag waits for this one, the registry ends up with the newer image
+    with locking.file_lock(path + '.push.lock'):
+        print(' '.join(state['command']), flush=True)
+        returncode = subprocess.call(state['command'], stdin=subprocess.DEVNULL)
+    with locking.file_lock(path + '.lock'):
+        latest = _read_state(path)
+        if latest and latest['pid'] == os.getpid():
+            latest.update(returncode=returncode, finished=time.time())
+            write_json(path, latest)
+    return returncode
+
+
+if __name__ == '__main__':
+    sys.exit(_work(sys.argv[1]))
@@ -0,0 +1,227 @@
+import json
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+
+# Registries that omit "expires_in" issue tokens valid for 60 seconds (distribution token spec)
+DEFAULT_TOKEN_TTL = 60
+# Refresh tokens slightly before they expire to avoid racing the registry clock
+TOKEN_EXPIRY_MARGIN = 5
+# Keep-alive connections kept per registry host, enough for the concurrent tag listing
+POOL_SIZE = 16
+REPOSITORY_PATH = re.compile(r'^/v2/(?P<repository>.+)/(tags|manifests|blobs)/')
+CHALLENGE_PARAM = re.compile(r'(\w+)="([^"]*)"')
+CACHED_HEADERS = ('Content-Type', 'Docker-Content-Digest', 'ETag', 'Link')
+
+
+class BearerTokenAuth:  # pylint: disable=too-few-public-methods
+    """
+    Docker registry token authentication that reuses issued tokens until they expire.
+
+    Once a registry has challenged a request for a repository, the token is attached
+    upfront to the following requests of the same kind, saving the 401 round trip.
+    Any callable is a valid requests auth, so requests is not needed to define it.
+    """
+
+    def __init__(self, username=None, password=None):
+        self._auth_info = (username, password) if username is not None and password is not None else None
+        self._tokens = {}
+        self._token_keys = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        request.headers['Connection'] = 'Keep-Alive'
+        token = self._cached_token(self._scope_key(request))
+        if token:
+            request.headers['Authorization'] = f'Bearer {token}'
+        request.register_hook('response', self._response_hook)
+        return request
+
+    @staticmethod
+    def _scope_key(request):
+        url = urlparse(request.url)
+        match = REPOSITORY_PATH.match(url.path)
+        repository = match.group('repository') if match else None
+        action = 'delete' if request.method == 'DELETE' else 'pull'
+        return url.netloc, repository, action
+
+    def _cached_token(self, scope_key):
+        with self._lock:
+            token_key = self._token_keys.get(scope_key)
+            token, expires_at = self._tokens.get(token_key, (None, 0))
+            if token and time.monotonic() < expires_at:
+                return token
+            self._tokens.pop(token_key, None)
+            return None
+
+    def _response_hook(self, response, **kwargs):
+        if response.status_code != 401:
+            return None
+        challenge = response.headers.get('WWW-Authenticate', '')
+        if not challenge.startswith('Bearer'):
+            return None
+        return self._retry_with_token(response, challenge, **kwargs)
+
+    def _retry_with_token(self, response, challenge, **kwargs):
+        params = dict(CHALLENGE_PARAM.findall(challenge[len('Bearer'):]))
+        if params.pop('error', None) or 'realm' not in params:
+            return response
+
+        realm = params.pop('realm')
+        token_key = (realm, params.get('service'), params.get('scope'))
+        scope_key = self._scope_key(response.request)
+        with self._lock:
+            self._token_keys[scope_key] = token_key
+            # A rejected cached token is dropped so that a fresh one is requested
+            if 'Authorization' in response.request.headers:
+                self._tokens.pop(token_key, None)
+
+        history = [response]
+        token = self._cached_token(scope_key)
+        if not token:
+            response.content  # pylint: disable=pointless-statement
+            response.raw.release_conn()
+            token_request = response.request.copy()
+            token_request.prepare_method('GET')
+            token_request.prepare_url(realm, params=params)
+            token_request.prepare_body(None, None)
+            token_request.headers.pop('Authorization', None)
+            token_request.prepare_auth(self._auth_info)
+            token_response = response.connection.send(token_request, **dict(kwargs, stream=False))
+            if token_response.status_code != 200:
+                token_response.history.append(response)
+                return token_response
+            token = self._store_token(token_key, token_response.json())
+            history.append(token_response)
+
+        authorized_request = response.request.copy()
+        authorized_request.headers['Authorization'] = f'Bearer {token}'
+        authorized_response = response.connection.send(authorized_request, **kwargs)
+        authorized_response.history += history
+        return authorized_response
+
+    def _store_token(self, token_key, token_info):
+        token = token_info.get('token') or token_info.get('access_token')
+        ttl = int(token_info.get('expires_in') or DEFAULT_TOKEN_TTL)
+        with self._lock:
+            self._tokens[token_key] = (token, time.monotonic() + max(ttl - TOKEN_EXPIRY_MARGIN, 0))
+        return token
+
+
+class RegistryClient:
+    """
+    A docker registry HTTP client shared by all the registry calls of a single invocation.
+
+    Keeps one pooled keep-alive session per registry host, all of them sharing the
+    same token cache. Requests made with `cached=True` are answered from the given
+    on-disk RegistryCache while fresh, and revalidated with their ETag once stale.
+    Requests made with `revalidate=True` as well are revalidated every time.
+    """
+
+    def __init__(self, username=None, password=None, cache=None):
+        self.cache = cache
+        self._auth = BearerTokenAuth(username, password)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, registry):
+        """
+        Returns the session used for talking with the given registry host, creating it on first use.
+
+        :param registry: Registry host (and port)
+        :return: A requests.Session instance
+        """
+        # requests is only imported once the registry is actually contacted, it is slow to import
+        import requests
+        from requests.adapters import HTTPAdapter
+        import urllib3
+
+        with self._lock:
+            if registry not in self._sessions:
+                urllib3.disable_warnings()
+                session = requests.Session()
+                session.verify = False
+                session.auth = self._auth
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+                self._sessions[registry] = session
+            return self._sessions[registry]
+
+    def get(self, url, cached=False, revalidate=False, **kwargs):
+        return self._request('GET', url, cached, revalidate, **kwargs)
+
+    def head(self, url, cached=False, **kwargs):
+        return self._request('HEAD', url, cached, **kwargs)
+
+    def delete(self, url, **kwargs):
+        response = self.session(urlparse(url).netloc).delete(url=url, **kwargs)
+        self.invalidate(*_cache_scope(url))
+        return response
+
+    def invalidate(self, registry, image):
+        """Forgets the cached metadata of an image, after it was changed in the registry."""
+        if self.cache:
+            self.cache.invalidate(registry, image)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def _request(self, method, url, cached, revalidate=False, **kwargs):
+        session = self.session(urlparse(url).netloc)
+        send = session.get if method == 'GET' else session.head
+        if not (cached and self.cache):
+            return send(url=url, **kwargs)
+
+        registry, image = _cache_scope(url)
+        key = (method, url, json.dumps(kwargs.get('params'), sort_keys=True), (kwargs.get('headers') or {}).get('Accept'))
+        hit = self.cache.get(registry, image, key)
+        if hit:
+            value, fresh, etag = hit
+            if fresh and not revalidate:
+                return _cached_response(url, value)
+            if etag:
+                headers = dict(kwargs.get('headers') or {}, **{'If-None-Match': etag})
+                response = send(url=url, **dict(kwargs, headers=headers))
+                if response.status_code == 304:
+                    self.cache.refresh(registry, image, key)
+                    return _cached_response(url, value)
+                self._store(registry, image, key, response)
+                return response
+
+        response = send(url=url, **kwargs)
+        self._store(registry, image, key, response)
+        return response
+
+    def _store(self, registry, image, key, response):
+        # Only definite answers are cached: the resource exists, or it does not
+        if response.status_code not in (200, 404):
+            return
+        value = {
+            'status_code': response.status_code,
+            'headers': {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers},
+            'content': response.text,
+        }
+        self.cache.put(registry, image, key, value, positive=response.status_code == 200, etag=response.headers.get('ETag'))
+
+
+def _cache_scope(url):
+    url = urlparse(url)
+    match = REPOSITORY_PATH.match(url.path)
+    return url.netloc, match.group('repository') if match else None
+
+
+def _cached_response(url, value):
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    response = requests.Response()
+    response.status_code = value['status_code']
+    response.headers = CaseInsensitiveDict(value['headers'])
+    response._content = value['content'].encode('utf-8')  # pylint: disable=protected-access
+    response.encoding = 'utf-8'
+    response.url = url
+    return response
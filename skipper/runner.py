@@ -1,13 +1,43 @@
 # pylint: disable=consider-using-with
 import getpass
 import grp
+import hashlib
+import json
 import logging
 import os
+import re
+import shlex
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
 from contextlib import contextmanager
 import sys
-from retry import retry
-from skipper import utils
+from skipper import locking, utils
+from skipper.cache import write_json
+
+
+ENTRYPOINT = '/opt/skipper/skipper-entrypoint.sh'
+SESSION_SCRIPT = '/opt/skipper/skipper-session.sh'
+SESSION_PREFIX = 'skipper-session-'
+SESSION_LABEL = 'skipper.session'
+SESSION_KEY_LENGTH = 16
+# Errors of docker and podman exec when the container is gone, the command was not started
+SESSION_GONE = re.compile(r'is not running|no such container|on running containers', re.IGNORECASE)
+NETWORKS_FILE = 'networks.json'
+# Networks that always exist, they are not reference counted
+BUILTIN_NETWORKS = ('host', 'bridge', 'none')
+NETWORK_IDLE_TIMEOUT = 300
+USER_LAYER_REPOSITORY = 'skipper-user-layer'
+USER_LAYER_LABEL = 'skipper.user-layer'
+USER_LAYER_KEY_LENGTH = 16
+USER_LAYER_DOCKERFILE = """FROM {image}
+USER root
+COPY skipper-entrypoint.sh /tmp/skipper-entrypoint.sh
+RUN mkdir -p {homedir} && SKIPPER_USERNAME={username} SKIPPER_UID={uid} SKIPPER_DOCKER_GID={docker_gid} HOME={homedir} \\
+    bash /tmp/skipper-entrypoint.sh true && rm -f /tmp/skipper-entrypoint.sh
+"""
 
 
 def get_default_net():
@@ -18,7 +48,8 @@ def get_default_net():
 
 # pylint: disable=too-many-arguments
 def run(command, fqdn_image=None, environment=None, interactive=False, name=None, net=None, publish=(), volumes=None,
-        workdir=None, use_cache=False, workspace=None, env_file=(), stdout_to_stderr=False):
+        workdir=None, use_cache=False, workspace=None, env_file=(), stdout_to_stderr=False, stderr_callback=None,
+        stdin_writer=None):
 
     if not net:
         net = get_default_net()
@@ -27,15 +58,21 @@ def run(command, fqdn_image=None, environment=None, interactive=False, name=None
         return _run_nested(fqdn_image, environment, command, interactive, name, net, publish, volumes,
                            workdir, use_cache, workspace, env_file)
 
-    return _run(command, stdout_to_stderr=stdout_to_stderr)
+    return _run(command, stdout_to_stderr=stdout_to_stderr, stderr_callback=stderr_callback, stdin_writer=stdin_writer)
 
 
-def _run(cmd_args, stdout_to_stderr=False):
+def _run(cmd_args, stdout_to_stderr=False, replace_process=False, stderr_callback=None, stdin_writer=None):
     logger = logging.getLogger('skipper')
 
     cmd = [utils.get_runtime_command()]
     cmd.extend(cmd_args)
     logger.debug(' '.join(cmd))
+    if replace_process:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execvp(cmd[0], cmd)
+    if stderr_callback or stdin_writer:
+        return _run_with_streams(cmd, stdout_to_stderr, stderr_callback, stdin_writer)
     proc = (subprocess.Popen(cmd)
             if not stdout_to_stderr else
             subprocess.Popen(cmd, stdout=sys.stderr))
@@ -43,6 +80,41 @@ def _run(cmd_args, stdout_to_stderr=False):
     return proc.returncode
 
 
+def _run_with_streams(cmd, stdout_to_stderr, stderr_callback, stdin_writer):
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if stdin_writer else None,
+                            stdout=sys.stderr if stdout_to_stderr else None,
+                            stderr=subprocess.PIPE if stderr_callback else None)
+    writer = None
+    if stdin_writer:
+        # The input is written while the output is read, neither side waits for the other's pipe to drain
+        writer = threading.Thread(target=_write_stdin, args=(proc.stdin, stdin_writer), name='skipper-stdin', daemon=True)
+        writer.start()
+    if stderr_callback:
+        # The lines are still shown as they come, and also handed to the callback
+        for raw_line in proc.stderr:
+            line = raw_line.decode('utf-8', 'replace')
+            sys.stderr.write(line)
+            stderr_callback(line)
+    proc.wait()
+    if writer:
+        writer.join()
+    return proc.returncode
+
+
+def _write_stdin(pipe, stdin_writer):
+    try:
+        stdin_writer(pipe)
+    except BrokenPipeError:
+        # The command exited without reading all of its input, its exit code tells why
+        pass
+    finally:
+        # Even a failed writer ends the input, the command must not wait for more of it
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
 # pylint: disable=too-many-locals
 # pylint: disable=too-many-arguments
 def _run_nested(fqdn_image, environment, command, interactive, name, net, publish, volumes, workdir, use_cache, workspace, env_file):
@@ -50,6 +122,16 @@ def _run_nested(fqdn_image, environment, command, interactive, name, net, publis
     if workspace is None:
         workspace = os.path.dirname(cwd)
     homedir = os.path.expanduser('~')
+    keep_containers = os.environ.get("KEEP_CONTAINERS", False)
+    container_args = _container_args(environment, net, publish, volumes, use_cache, workspace, env_file, homedir)
+
+    user_layer = _user_layer(fqdn_image, homedir) if utils.env_flag('SKIPPER_USER_LAYER') else None
+
+    session_timeout = utils.env_int('SKIPPER_SESSION_TIMEOUT', 0, minimum=0)
+    if session_timeout and not name and not keep_containers:
+        return _run_in_session(fqdn_image, container_args, command, interactive, net, handle_workdir([], cwd, workdir),
+                               session_timeout, user_layer, env_file)
+
     cmd = ['run']
     if interactive:
         cmd += ['-i']
@@ -59,11 +141,38 @@ def _run_nested(fqdn_image, environment, command, interactive, name, net, publis
 
     cmd += ['-t']
 
-    if os.environ.get("KEEP_CONTAINERS", False):
+    if keep_containers:
         cmd += ['-e', 'KEEP_CONTAINERS=True']
     else:
         cmd += ['--rm']
 
+    cmd += container_args
+
+    cmd = handle_workdir(cmd, cwd, workdir)
+
+    if user_layer:
+        # The user already exists in the layer, the command starts as the user without going through the entrypoint
+        cmd += ['--user', getpass.getuser(), '--entrypoint', '/bin/bash', user_layer, '-c']
+    else:
+        cmd += ['--entrypoint', ENTRYPOINT]
+        cmd += [fqdn_image]
+    cmd += [' '.join(command)]
+
+    if utils.env_flag('SKIPPER_EXEC'):
+        # Nothing is left to do once the container exits, the runtime replaces skipper's process. It keeps
+        # its process id, which holds the reference to the network until the container exits
+        _acquire_network(net)
+        return _run(cmd, replace_process=True)
+
+    with _network(net):
+        ret = _run(cmd)
+
+    return ret
+
+
+def _container_args(environment, net, publish, volumes, use_cache, workspace, env_file, homedir):
+    """Returns the options of the run command that define the build container, whatever command it runs."""
+    cmd = []
     for cmd_limit in utils.SKIPPER_ULIMIT:
         cmd += cmd_limit
 
@@ -85,12 +194,9 @@ def _run_nested(fqdn_image, environment, command, interactive, name, net, publis
     cmd += ['-e', f'HOME={homedir}']
     cmd += ['-e', f'CONTAINER_RUNTIME_COMMAND={utils.get_runtime_command()}']
 
-    if utils.get_runtime_command() == "docker":
-        try:
-            docker_gid = grp.getgrnam('docker').gr_gid
-            cmd += ['-e', f'SKIPPER_DOCKER_GID={docker_gid}']
-        except KeyError:
-            pass
+    docker_gid = _docker_gid()
+    if docker_gid is not None:
+        cmd += ['-e', f'SKIPPER_DOCKER_GID={docker_gid}']
 
     if utils.get_runtime_command() == "podman":
         cmd += ['--group-add', 'keep-groups']
@@ -98,20 +204,187 @@ def _run_nested(fqdn_image, environment, command, interactive, name, net, publis
     if use_cache:
         cmd += ['-e', 'SKIPPER_USE_CACHE_IMAGE=True']
 
-    cmd = handle_volumes_bind_mount(cmd, homedir, volumes, workspace)
+    return handle_volumes_bind_mount(cmd, homedir, volumes, workspace)
 
-    cmd = handle_workdir(cmd, cwd, workdir)
 
-    cmd += ['--entrypoint', '/opt/skipper/skipper-entrypoint.sh']
-    cmd += [fqdn_image]
-    cmd += [' '.join(command)]
-
-    with _network(net):
+def _docker_gid():
+    if utils.get_runtime_command() != "docker":
+        return None
+    try:
+        return grp.getgrnam('docker').gr_gid
+    except KeyError:
+        return None
+
+
+def _user_layer(fqdn_image, homedir):
+    """
+    Returns an image deriving from the build container, in which skipper-entrypoint.sh already set up the user.
+
+    The layer is built once for every build container image, user and docker group, and labeled skipper.user-layer.
+    It replaces the user's layers of the same image name and home directory (the image was rebuilt, or the entrypoint
+    changed), the layers of other tags may be used by other work trees.
+
+    :return: The name of the image, or None when the user should be set up by the entrypoint
+    """
+    docker_gid = _docker_gid()
+    if docker_gid is None:
+        # Without a docker group the entrypoint runs the command as root, there is no user to set up
+        return None
+    image_id = utils.local_image_id(fqdn_image)
+    if not image_id:
+        # The image is pulled by this run, the layer is built by the next one
+        return None
+
+    entrypoint = utils.get_extra_file('skipper-entrypoint.sh')
+    with open(entrypoint, 'rb') as entrypoint_file:
+        entrypoint_digest = hashlib.sha256(entrypoint_file.read()).hexdigest()
+    user = getpass.getuser()
+    key = json.dumps([image_id, os.getuid(), user, docker_gid, homedir, entrypoint_digest])
+    user_layer = f'{USER_LAYER_REPOSITORY}:{hashlib.sha256(key.encode("utf-8")).hexdigest()[:USER_LAYER_KEY_LENGTH]}'
+    if utils.local_image_id(user_layer):
+        return user_layer
+
+    logging.debug("Building user layer %s of %s", user_layer, fqdn_image)
+    # The home directory is created before the entrypoint runs, for it to be owned by the user when it is not /home/<user>
+    dockerfile = USER_LAYER_DOCKERFILE.format(
+        image=fqdn_image,
+        username=shlex.quote(user),
+        uid=os.getuid(),
+        docker_gid=docker_gid,
+        homedir=shlex.quote(homedir),
+    )
+    labels = [f'{USER_LAYER_LABEL}=true', f'{USER_LAYER_LABEL}.image={fqdn_image}', f'{USER_LAYER_LABEL}.user={user}',
+              f'{USER_LAYER_LABEL}.homedir={homedir}']
+    previous_layers = _user_layers(labels[1:])
+    with tempfile.TemporaryDirectory() as context_dir:
+        shutil.copy(entrypoint, os.path.join(context_dir, 'skipper-entrypoint.sh'))
+        with open(os.path.join(context_dir, 'Dockerfile'), 'w') as dockerfile_file:
+            dockerfile_file.write(dockerfile)
+        cmd = ['build', '-q']
+        for label in labels:
+            cmd += ['--label', label]
+        ret = _run(cmd + ['-t', user_layer, context_dir], stdout_to_stderr=True)
+    if ret != 0:
+        logging.warning("Failed to build the user layer of %s, the user is set up when the container starts", fqdn_image)
+        return None
+    for layer in previous_layers:
+        _remove_user_layer(layer)
+    return user_layer
+
+
+def _remove_user_layer(layer):
+    # A layer still used by a container (a session) is not removed
+    logging.debug("Removing user layer %s", layer)
+    engine_client = utils.get_engine_client()
+    if not engine_client:
+        try:
+            utils.run_container_command(['rmi', layer])
+        except subprocess.CalledProcessError:
+            logging.debug("User layer %s was not removed", layer)
+        return
+    from skipper import engine
+
+    try:
+        engine_client.remove_image(layer)
+    except engine.EngineError as exc:
+        logging.debug("User layer %s was not removed: %s", layer, exc)
+
+
+def _user_layers(labels):
+    cmd = ['images', '-q', '--no-trunc']
+    for label in labels:
+        cmd += ['--filter', f'label={label}']
+    try:
+        return sorted(set(utils.run_container_command(cmd).split()))
+    except subprocess.CalledProcessError:
+        return []
+
+
+def _run_in_session(fqdn_image, container_args, command, interactive, net, workdir_args, timeout, user_layer=None, env_file=()):
+    """
+    Runs a command in the session container of the build container's image and options, with exec.
+
+    The session container is started by the first command, and stops itself once it is idle for
+    the given timeout. Later commands skip the creation of a container and the setup of the user.
+    Changing an environment file starts a new session, the container only reads them when it starts.
+    """
+    key = json.dumps([fqdn_image, user_layer] + container_args + [_file_state(path) for path in env_file])
+    key = hashlib.sha256(key.encode('utf-8')).hexdigest()[:SESSION_KEY_LENGTH]
+    session = SESSION_PREFIX + key
+
+    cmd = ['exec']
+    if interactive:
+        cmd += ['-i']
+        cmd += ['-e', 'SKIPPER_INTERACTIVE=True']
+    cmd += ['-t']
+    cmd += workdir_args
+    cmd += [session, SESSION_SCRIPT, 'exec', ' '.join(command)]
+
+    if not _container_running(session):
+        _start_session(session, key, fqdn_image, container_args, net, timeout, user_layer)
+    ret, started = _exec_in_session(cmd)
+    if not started:
+        # The session expired right before the command was executed in it. A command that did start is not run again,
+        # whatever its exit code, even if it stopped the session itself
+        logging.debug("Session %s stopped, starting it again", session)
+        _start_session(session, key, fqdn_image, container_args, net, timeout, user_layer)
         ret = _run(cmd)
-
     return ret
 
 
+def _exec_in_session(cmd):
+    """
+    Runs an exec command, telling whether the runtime started it.
+
+    The output of the command goes to its terminal (exec -t), the runtime's own errors are the only ones on stderr.
+
+    :return: A tuple of the exit code, and False if the runtime failed to exec the command as the container is gone
+    """
+    errors = []
+
+    def check_error(line):
+        if SESSION_GONE.search(line):
+            errors.append(line)
+
+    ret = _run(cmd, stderr_callback=check_error)
+    return ret, ret == 0 or not errors
+
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _start_session(session, key, fqdn_image, container_args, net, timeout, user_layer):
+    logging.debug("Starting session %s", session)
+    # The reference to the network is dropped when this process exits, but it is not removed while the session uses it
+    _acquire_network(net)
+
+    cmd = ['run', '-d', '--rm', '--name', session, '--label', f'{SESSION_LABEL}={key}']
+    cmd += ['-e', f'SKIPPER_SESSION_TIMEOUT={timeout}']
+    cmd += container_args
+    cmd += ['-v', f'{utils.get_extra_file("skipper-session.sh")}:{SESSION_SCRIPT}:ro']
+    if user_layer:
+        cmd += ['--user', getpass.getuser(), '--entrypoint', SESSION_SCRIPT, user_layer, 'keepalive']
+    else:
+        cmd += ['--entrypoint', ENTRYPOINT]
+        cmd += [fqdn_image]
+        cmd += [f'{SESSION_SCRIPT} keepalive']
+    # The container id is printed to stdout, which belongs to the command run in the session
+    if _run(cmd, stdout_to_stderr=True) != 0 and not _container_running(session):
+        raise RuntimeError(f'Failed to start session {session}')
+
+
+def _container_running(name):
+    engine_client = utils.get_engine_client()
+    if engine_client:
+        return engine_client.container_running(name)
+    return bool(utils.run_container_command(['ps', '-q', '--filter', f'name=^{name}$']))
+
+
 def handle_workdir(cmd, cwd, workdir):
     if workdir:
         cmd += ['-w', workdir]
@@ -132,7 +405,8 @@ def handle_networking(cmd, publish, net):
 
 
 def handle_volumes_bind_mount(docker_cmd, homedir, volumes, workspace):
-    volumes = volumes or []
+    # A copy, the volumes of the config may be read only and are not extended with skipper's own
+    volumes = list(volumes or [])
     volumes.extend([f'{homedir}/.netrc:{homedir}/.netrc:ro',
                     f'{homedir}/.gitconfig:{homedir}/.gitconfig:ro'])
 
@@ -216,28 +490,107 @@ def _add_path_if_exists(source, target, permissions, volumes):
 
 @contextmanager
 def _network(net):
-    if utils.get_runtime_command() != "docker":
+    _acquire_network(net)
+    try:
         yield
-    elif _network_exists(net):
-        yield
-    else:
-        _create_network(net)
-        yield
-        _destroy_network(net)
+    finally:
+        _release_network(net)
+
+
+def _managed_network(net):
+    return utils.get_runtime_command() == "docker" and net not in BUILTIN_NETWORKS
+
+
+def _load_networks(path):
+    try:
+        with open(path) as networks_file:
+            networks = json.load(networks_file)
+        return networks if isinstance(networks, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _acquire_network(net):
+    """
+    Takes a reference to the network, creating it if it does not exist.
+
+    The networks created by skipper are reference counted by the processes using them, in the runtime
+    directory, and removed once they were unused for SKIPPER_NETWORK_IDLE_TIMEOUT seconds. Networks
+    created by others are never removed.
+    """
+    if not _managed_network(net):
+        return
+    path = locking.runtime_dir(NETWORKS_FILE)
+    with locking.file_lock(path + '.lock'):
+        networks = _load_networks(path)
+        if net not in networks:
+            if _network_exists(net):
+                # Not created by skipper, or by an invocation that lost track of it
+                _collect_idle_networks(networks)
+                write_json(path, networks)
+                return
+            _create_network(net)
+            networks[net] = {'users': []}
+        networks[net]['users'] = networks[net].get('users', []) + [os.getpid()]
+        networks[net].pop('idle_since', None)
+        _collect_idle_networks(networks)
+        write_json(path, networks)
+
+
+def _release_network(net):
+    if not _managed_network(net):
+        return
+    path = locking.runtime_dir(NETWORKS_FILE)
+    with locking.file_lock(path + '.lock'):
+        networks = _load_networks(path)
+        if net in networks:
+            networks[net]['users'] = [pid for pid in networks[net].get('users', []) if pid != os.getpid()]
+        _collect_idle_networks(networks)
+        write_json(path, networks)
+
+
+def _collect_idle_networks(networks):
+    now = time.time()
+    timeout = utils.env_int('SKIPPER_NETWORK_IDLE_TIMEOUT', NETWORK_IDLE_TIMEOUT)
+    for net, network in list(networks.items()):
+        # The processes that died without releasing their reference, e.g. replaced by the runtime, don't use it anymore
+        network['users'] = [pid for pid in network.get('users', []) if locking.process_alive(pid)]
+        if network['users']:
+            continue
+        network.setdefault('idle_since', now)
+        if now - network['idle_since'] < timeout:
+            continue
+        try:
+            _destroy_network(net)
+        except Exception:  # pylint: disable=broad-except
+            # Containers that were not started by skipper, or a session, still use it
+            logging.debug("Network %s is still in use, not removing it", net)
+            continue
+        del networks[net]
 
 
 def _create_network(net):
     logging.debug("Creating network %s", net)
-    utils.run_container_command(['network', 'create', net])
+    engine_client = utils.get_engine_client()
+    if engine_client:
+        engine_client.create_network(net)
+    else:
+        utils.run_container_command(['network', 'create', net])
 
 
-@retry(delay=0.1, tries=10)
 def _destroy_network(net):
     logging.debug("Deleting network %s", net)
-    utils.run_container_command(['network', 'rm', net])
+    engine_client = utils.get_engine_client()
+    if engine_client:
+        engine_client.remove_network(net)
+    else:
+        utils.run_container_command(['network', 'rm', net])
 
 
 def _network_exists(net):
+    engine_client = utils.get_engine_client()
+    if engine_client:
+        return engine_client.network_exists(net)
     cmd = ['network', 'ls', "-f", f"NAME={net}"]
     result = utils.run_container_command(cmd)
     return net in result
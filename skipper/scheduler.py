@@ -0,0 +1,133 @@
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging import Logger
+from typing import Callable, Dict, List, Set
+
+
+FROM_INSTRUCTION = re.compile(r'^\s*FROM\s+(?:--\S+\s+)*(?P<image>\S+)(?:\s+AS\s+(?P<stage>\S+))?', re.IGNORECASE)
+ARG_REFERENCE = re.compile(r'\$\{?\w+(:-[^}]*)?\}?')
+
+
+class DependencyCycleError(ValueError):
+    pass
+
+
+def _repository(image):
+    # Drop the digest, the tag (a ${TAG} reference included) and the registry/namespace of a base image
+    image = ARG_REFERENCE.sub('', image.split('@')[0])
+    name, _, tag = image.rpartition(':')
+    if name and '/' not in tag:
+        image = name
+    return image.rsplit('/', 1)[-1]
+
+
+def get_base_images(dockerfile):
+    """
+    Parses the FROM instructions of a Dockerfile.
+
+    :param dockerfile: Path of the Dockerfile
+    :return: The repository names of the base images, stages of the same Dockerfile excluded
+    """
+    base_images = set()
+    stages = set()
+    try:
+        with open(dockerfile) as dockerfile_file:
+            lines = dockerfile_file.readlines()
+    except OSError:
+        return base_images
+
+    for line in lines:
+        match = FROM_INSTRUCTION.match(line)
+        if not match:
+            continue
+        if match.group('image').lower() not in stages:
+            base_images.add(_repository(match.group('image')))
+        if match.group('stage'):
+            stages.add(match.group('stage').lower())
+    return base_images
+
+
+def get_dependencies(images: Dict[str, str]) -> Dict[str, Set[str]]:
+    """
+    Finds which of the given images are built on top of other given images.
+
+    :param images: Dockerfiles keyed by image name
+    :return: The parents of every image, among the given images
+    """
+    dependencies = {image: get_base_images(dockerfile) & (set(images) - {image}) for image, dockerfile in images.items()}
+    topological_order(dependencies)
+    return dependencies
+
+
+def topological_order(dependencies: Dict[str, Set[str]]) -> List[str]:
+    """
+    Orders images so that every image comes after its parents, otherwise keeping the given order.
+
+    :param dependencies: The parents of every image
+    :return: The ordered images
+    :raises DependencyCycleError: If images depend on each other
+    """
+    order, in_progress = [], []
+
+    def visit(image):
+        if image in in_progress:
+            cycle = in_progress[in_progress.index(image):] + [image]
+            raise DependencyCycleError(f"Images depend on each other: {' -> '.join(cycle)}")
+        if image in order:
+            return
+        in_progress.append(image)
+        for parent in sorted(dependencies[image]):
+            visit(parent)
+        in_progress.pop()
+        order.append(image)
+
+    for image in dependencies:
+        visit(image)
+    return order
+
+
+def schedule(dependencies: Dict[str, Set[str]], build: Callable, jobs: int = 1, keep_going: bool = False,
+             logger: Logger = None) -> Dict[str, int]:
+    """
+    Builds images concurrently, each one only once all of its parents were built.
+
+    Images are started in the given order, as soon as a worker is free and their parents are ready.
+    On a failure no new build is started, unless `keep_going` is set, in which case only the
+    images depending on the failed one are skipped. Builds already running are always waited for.
+
+    :param dependencies: The parents of every image to build, as returned by get_dependencies
+    :param build: Callable that builds the given image, returning its return code
+    :param jobs: Maximal number of concurrent builds
+    :param keep_going: Keep building the images that don't depend on a failed one
+    :param logger: Logger instance
+    :return: The return code of every image that was built, in completion order
+    """
+    pending = topological_order(dependencies)
+    results = {}
+    running = {}
+    failed = False
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for image in list(pending):
+                if len(running) >= jobs or (failed and not keep_going):
+                    break
+                if any(results.get(parent, 0) != 0 for parent in dependencies[image]):
+                    pending.remove(image)
+                    if logger:
+                        logger.warning("Skipping image %s, its base image failed to build", image)
+                    results[image] = None
+                    continue
+                if all(parent in results for parent in dependencies[image]):
+                    pending.remove(image)
+                    running[executor.submit(build, image)] = image
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                image = running.pop(future)
+                results[image] = future.result()
+                failed = failed or results[image] != 0
+
+    return {image: ret for image, ret in results.items() if ret is not None}
@@ -3,24 +3,38 @@ import glob
 import json
 import logging
 import os
+import queue
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from shutil import which
-from six.moves import http_client
-import requests
-from requests_bearer import HttpBearerAuth
-import urllib3
-import pkg_resources
+from urllib.parse import urljoin
+from http import HTTPStatus
 
 
 REGISTRY_BASE_URL = 'https://%(registry)s/v2/'
 IMAGE_TAGS_URL = REGISTRY_BASE_URL + '%(image)s/tags/list'
 MANIFEST_URL = REGISTRY_BASE_URL + '%(image)s/manifests/%(reference)s'
+MANIFEST_MEDIA_TYPES = ', '.join([
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.oci.image.index.v1+json',
+])
 DOCKER = "docker"
 PODMAN = "podman"
+REGISTRY_JOBS = 8
+REGISTRY_PAGE_SIZE = 1000
 
 logger = None   # pylint: disable=invalid-name
 
 CONTAINER_RUNTIME_COMMAND = os.getenv("CONTAINER_RUNTIME_COMMAND")
+# None until probed, False when the runtime's engine API is not used
+ENGINE_CLIENT = None
+
+# Values of boolean environment variables
+TRUE_VALUES = ('true', '1', 'yes', 'on')
+FALSE_VALUES = ('false', '0', 'no', 'off')
 
 SKIPPER_ULIMIT = [['--ulimit', limit] for limit in os.environ.get('SKIPPER_ULIMITS', 'nofile=65536:65536').split(',')]
 
@@ -39,6 +53,39 @@ def configure_logging(name, level):
     logger.addHandler(console_handler)
 
 
+def env_flag(name, default=False):
+    """
+    Reads a boolean environment variable.
+
+    :param name: Name of the variable
+    :param default: Value when the variable is not set, or is neither true nor false
+    :return: True or False
+    """
+    value = os.environ.get(name, '').lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    return default
+
+
+def env_int(name, default, minimum=None):
+    """
+    Reads an integer environment variable.
+
+    :param name: Name of the variable
+    :param default: Value when the variable is not set, or is not a number
+    :param minimum: Smallest value, smaller ones are raised to it
+    :return: The value
+    """
+    try:
+        value = int(os.environ.get(name, default))
+    except ValueError:
+        logging.getLogger('skipper').warning('Ignoring %s, it should be a number', name)
+        value = default
+    return value if minimum is None else max(value, minimum)
+
+
 def get_images_from_dockerfiles():
     dockerfiles = glob.glob("Containerfile.*") + glob.glob("Dockerfile.*")
     images = {dockerfile_to_image(dockerfile): dockerfile for dockerfile in dockerfiles}
@@ -47,6 +94,9 @@ def get_images_from_dockerfiles():
 
 def local_image_exist(image, tag):
     name = image + ':' + tag
+    engine_client = get_engine_client()
+    if engine_client:
+        return engine_client.image_exists(name)
     command = [
         'images',
         '--format', '{{.ID}}',
@@ -56,78 +106,181 @@ def local_image_exist(image, tag):
     return output != ''
 
 
-def remote_image_exist(registry, image, tag, username, password):
-    urllib3.disable_warnings()
-    url = IMAGE_TAGS_URL % {"registry": registry, "image": image}
-    headers = {"Accept": "application/vnd.docker.distribution.manifest.v2+json"}
-    response = requests.get(url=url, verify=False, headers=headers, auth=HttpBearerAuth(username, password))
+def local_image_id(name):
+    """
+    :param name: Name of the image, with its tag
+    :return: The id of the image, or None if it is not a local image
+    """
+    engine_client = get_engine_client()
+    if engine_client:
+        return engine_client.image_id(name)
+    return run_container_command(['images', '--no-trunc', '--format', '{{.ID}}', name]) or None
 
-    if response.status_code != http_client.OK:
+
+def remote_image_exist(client, registry, image, tag, cached=True):
+    url = MANIFEST_URL % {"registry": registry, "image": image, "reference": tag}
+    response = client.head(url, cached=cached, headers={"Accept": MANIFEST_MEDIA_TYPES})
+    if response.status_code == HTTPStatus.OK:
+        logger.debug('Found %s:%s in %s with digest %s', image, tag, registry, response.headers.get('Docker-Content-Digest'))
+        return True
+    if response.status_code == HTTPStatus.NOT_FOUND:
         return False
 
-    info = response.json()
-    return tag in info['tags']
+    # Registries rejecting manifest HEAD requests are answered from the (much bigger) tags list
+    logger.debug('Manifest HEAD request failed with status %s, listing the tags of %s', response.status_code, image)
+    return _remote_tag_listed(client, registry, image, tag, cached)
+
+
+def _remote_tag_listed(client, registry, image, tag, cached):
+    headers = {"Accept": "application/vnd.docker.distribution.manifest.v2+json"}
+    for response in _get_remote_tags_pages(client, registry, image, headers=headers, cached=cached):
+        if response.status_code != HTTPStatus.OK:
+            return False
+        if tag in (response.json().get('tags') or []):
+            return True
+    return False
 
 
 def get_local_images_info(images):
+    images = list(images)
+    if not images:
+        return []
+
+    # A single listing for all the images, repeated reference filters match any of them
     command = [
         'images',
         '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
     ]
-    images_info = []
     for image in images:
-        output = run_container_command(command + [image])
-        if output == '':
-            continue
-        image_info = [json.loads(record) for record in output.splitlines()]
-        images_info += [['none', info['name'], info['tag']] for info in image_info]
+        command += ['--filter', f'reference={image}']
+    output = run_container_command(command)
 
-    return images_info
+    images_info = {image: [] for image in images}
+    for record in output.splitlines():
+        info = json.loads(record)
+        image = _local_repository_name(info['name'])
+        if image in images_info:
+            images_info[image].append(['none', info['name'], info['tag']])
+
+    return [image_info for image in images for image_info in images_info[image]]
+
+
+def _local_repository_name(name):
+    # podman names local images localhost/<image>, and images pulled from a registry keep its host
+    host, _, path = name.partition('/')
+    if path and (host == 'localhost' or '.' in host or ':' in host):
+        return path
+    return name
+
+
+def get_remote_images_info(client, images, registry, jobs=REGISTRY_JOBS, page_size=REGISTRY_PAGE_SIZE):
+    """
+    Yields the remote tags of the given images, querying up to `jobs` images concurrently.
+
+    Rows keep the order of `images`: the rows of the image being listed are yielded as its pages arrive, the rows
+    of the next images are held back until then. The first failure stops the queries and cancels the ones that
+    did not start yet.
+    """
+    images = list(images)
+    if jobs == 1 or len(images) <= 1:
+        for image in images:
+            yield from get_remote_image_info(client, image, registry, page_size)
+        return
+
+    # The queries send (index of the image, row) pairs, then the done marker or their error
+    rows = queue.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def _query(index, image):
+        try:
+            for row in get_remote_image_info(client, image, registry, page_size):
+                if stop.is_set():
+                    return
+                rows.put((index, row))
+        except Exception as exc:  # pylint: disable=broad-except
+            rows.put((index, exc))
+            return
+        rows.put((index, done))
+
+    with ThreadPoolExecutor(max_workers=min(jobs, len(images))) as executor:
+        futures = [executor.submit(_query, index, image) for index, image in enumerate(images)]
+        held_back = [[] for _ in images]
+        current = 0
+        try:
+            while current < len(images):
+                index, row = rows.get()
+                if isinstance(row, Exception):
+                    raise row
+                if index != current:
+                    held_back[index].append(row)
+                elif row is not done:
+                    yield row
+                else:
+                    current += 1
+                    # The next images may have been listed already
+                    while current < len(images):
+                        held_rows, held_back[current] = held_back[current], []
+                        yield from (held_row for held_row in held_rows if held_row is not done)
+                        if done not in held_rows:
+                            break
+                        current += 1
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+
+
+def get_remote_image_info(client, image, registry, page_size=REGISTRY_PAGE_SIZE):
+    for response in _get_remote_tags_pages(client, registry, image, page_size):
+        info = response.json()
+        if response.ok:
+            for tag in info['tags'] or []:
+                yield [registry, image, tag]
+        elif info['errors'][0]['code'] in ['NAME_UNKNOWN', 'NOT_FOUND']:
+            return
+        else:
+            raise RuntimeError(info)
 
 
-def get_remote_images_info(images, registry, username, password):
-    images_info = []
-    for image in images:
-        images_info += get_remote_image_info(image, registry, username, password)
-    return images_info
+def _get_remote_tags_pages(client, registry, image, page_size=REGISTRY_PAGE_SIZE, headers=None, cached=True):
+    """
+    Yields the responses of the paginated tags list of `image`, following the `Link: rel="next"` headers.
 
-
-def get_remote_image_info(image, registry, username, password):
-    urllib3.disable_warnings()
-    image_info = []
+    Registries that do not paginate answer everything in the first page. Pages are revalidated on every read,
+    tags pushed since they were cached are listed.
+    """
     url = IMAGE_TAGS_URL % {"registry": registry, "image": image}
-    response = requests.get(url=url, verify=False, auth=HttpBearerAuth(username, password))
-    info = response.json()
-    if response.ok:
-        if info['tags']:
-            image_info += [[registry, image, tag] for tag in info['tags']]
-    else:
-        if info['errors'][0]['code'] in ['NAME_UNKNOWN', 'NOT_FOUND']:
-            pass
-        else:
-            raise RuntimeError(info)
+    params = {'n': page_size}
+    while url:
+        response = client.get(url, cached=cached, revalidate=True, params=params, headers=headers)
+        yield response
+        next_page = response.links.get('next') if response.ok else None
+        # The next link carries its own `n` and `last` parameters
+        url, params = (urljoin(url, next_page['url']), None) if next_page else (None, None)
 
-    return image_info
 
-
-def get_image_digest(registry, image, tag, username, password):
-    urllib3.disable_warnings()
+def get_image_digest(client, registry, image, tag):
     url = MANIFEST_URL % {"registry": registry, "image": image, "reference": tag}
     headers = {"Accept": "application/vnd.docker.distribution.manifest.v2+json"}
-    response = requests.get(url=url, headers=headers, verify=False, auth=HttpBearerAuth(username, password))
+    response = client.get(url, headers=headers)
     return response.headers['Docker-Content-Digest']
 
 
-def delete_image_from_registry(registry, image, tag, username, password):
-    digest = get_image_digest(registry, image, tag, username, password)
+def delete_image_from_registry(client, registry, image, tag):
+    digest = get_image_digest(client, registry, image, tag)
     url = MANIFEST_URL % {"registry": registry, "image": image, "reference": digest}
-    response = requests.delete(url=url, verify=False, auth=HttpBearerAuth(username, password))
+    response = client.delete(url)
     response.raise_for_status()
 
 
 def delete_local_image(image, tag):
     name = image + ':' + tag
-    run_container_command(['rmi', name])
+    engine_client = get_engine_client()
+    if engine_client:
+        engine_client.remove_image(name)
+    else:
+        run_container_command(['rmi', name])
 
 
 def generate_fqdn_image(registry, namespace, image, tag='latest'):
@@ -176,8 +329,26 @@ def get_runtime_command():
     return CONTAINER_RUNTIME_COMMAND
 
 
+def get_engine_client():
+    """
+    Returns a client of the container runtime's engine API, used instead of forking the runtime's CLI.
+
+    The API is used when the runtime's unix socket is reachable, unless SKIPPER_ENGINE_API is 'false'.
+
+    :return: An instance of engine.EngineClient, or None to use the runtime's CLI
+    """
+    global ENGINE_CLIENT  # pylint: disable=global-statement
+    if ENGINE_CLIENT is None:
+        from skipper import engine
+
+        ENGINE_CLIENT = (env_flag('SKIPPER_ENGINE_API', default=True) and engine.connect(get_runtime_command())) or False
+    return ENGINE_CLIENT or None
+
+
 def get_extra_file(filename):
-    return pkg_resources.resource_filename("skipper", f"data/{filename}")
+    from importlib import resources
+
+    return str(resources.files("skipper") / "data" / filename)
 
 
 def run_container_command(args):
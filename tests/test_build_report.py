@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import unittest
+
+from skipper.build_report import BuildReport
+
+PROGRESS = '''#0 building with "default" instance using docker driver
+
+#1 [internal] load build definition from Dockerfile.service
+#1 transferring dockerfile: 312B done
+#1 DONE 0.0s
+
+#2 [internal] load metadata for docker.io/library/python:3.11
+#2 DONE 1.2s
+
+#3 [internal] load build context
+#3 transferring context: 1.20MB 0.1s
+#3 transferring context: 2.34MB 0.2s done
+#3 DONE 0.3s
+
+#4 [1/4] FROM docker.io/library/python:3.11@sha256:0123
+#4 sha256:aaaa 10.49MB / 49.56MB 0.2s
+#4 sha256:bbbb 1.00kB / 1.00kB 0.3s done
+#4 sha256:aaaa 49.56MB / 49.56MB 1.3s done
+#4 DONE 5.2s
+
+#5 [2/4] RUN pip install -r requirements.txt
+#5 CACHED
+
+#6 [3/4] COPY . /src
+#6 DONE 0.4s
+
+#7 [4/4] RUN make -C /src
+#7 0.512 make: Entering directory '/src'
+#7 ERROR: process "/bin/sh -c make -C /src" did not complete successfully: exit code: 2
+'''
+
+
+class TestBuildReport(unittest.TestCase):
+    def _report(self):
+        report = BuildReport('service', '1234567')
+        for line in PROGRESS.splitlines(True):
+            report.feed(line)
+        report.finish(1)
+        return report
+
+    def test_steps(self):
+        report = self._report()
+        steps = report.steps
+        self.assertEqual(steps[3]['bytes'], 2340000)
+        self.assertEqual(steps[4]['bytes'], 49561000)
+        self.assertEqual(steps[4]['duration'], 5.2)
+        self.assertTrue(steps[5]['cached'])
+        self.assertTrue(steps[5]['instruction'])
+        self.assertFalse(steps[3]['instruction'])
+        self.assertEqual(steps[7]['error'], 'process "/bin/sh -c make -C /src" did not complete successfully: exit code: 2')
+
+        summary = report.to_dict()
+        self.assertEqual(summary['tag'], '1234567')
+        self.assertEqual(summary['returncode'], 1)
+        self.assertEqual(summary['cache_hits'], 1)
+        self.assertEqual(summary['cache_misses'], 3)
+        self.assertEqual(summary['bytes'], 312 + 2340000 + 49561000)
+
+    def test_summary(self):
+        lines = self._report().summary().splitlines()
+        self.assertEqual(lines[0].split(), ['STEP', 'CACHE', 'DURATION', 'BYTES'])
+        self.assertIn('[2/4] RUN pip install -r requirements.txt', lines[-3])
+        self.assertIn('hit', lines[-3])
+        self.assertIn('error', lines[-1])
+        self.assertFalse(any('building with' in line for line in lines))
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as report_dir:
+            report = BuildReport('team/service', '1234567')
+            path = report.save(os.path.join(report_dir, 'reports'))
+            self.assertEqual(path, os.path.join(report_dir, 'reports', 'team_service.json'))
+            with open(path) as report_file:
+                self.assertEqual(json.load(report_file)['image'], 'team/service')
@@ -1,9 +1,16 @@
+import json
 import logging
+import os
+import subprocess
+import tempfile
 from unittest import TestCase, mock
 
 from skipper import builder
 from skipper.builder import BuildOptions, Image
 
+BUILDX_CONTAINER_BUILDER = "Name:          skipper\nDriver:        docker-container\n"
+BUILDX_DOCKER_BUILDER = "Name:          default\nDriver:        docker\n"
+
 
 class TestBuilder(TestCase):
     def test_build_basic_usage(self):
@@ -214,3 +221,397 @@ class TestBuilder(TestCase):
         }
 
         self.assertRaises(ValueError, BuildOptions.from_context_obj, ctx_obj)
+
+    def test_registry_cache_tags(self):
+        """Testing the order of the registry cache tags."""
+
+        self.assertEqual(["cache-main", "cache"], builder.registry_cache_tags("main", "main"))
+        self.assertEqual(
+            ["cache-feature-login", "cache-main", "cache"],
+            builder.registry_cache_tags("feature/login", "main"),
+        )
+        self.assertEqual("cache-feature-login", builder.registry_cache_export_tag("feature/login"))
+
+    def test_registry_cache_tags_of_detached_head(self):
+        """Testing that builds without a branch don't export to the cache of a branch."""
+
+        self.assertEqual(["cache-main"], builder.registry_cache_tags(None, "main"))
+        self.assertEqual(["cache"], builder.registry_cache_tags())
+        self.assertEqual("cache-detached", builder.registry_cache_export_tag(None))
+
+    @mock.patch("skipper.utils.get_runtime_command", mock.MagicMock(return_value="docker"))
+    @mock.patch("skipper.utils.run_container_command", mock.MagicMock(return_value=BUILDX_CONTAINER_BUILDER))
+    def test_build_with_registry_cache(self):
+        """Testing the 'build' function with a BuildKit registry cache."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="test",
+                registry="registry.io",
+            ),
+            container_context=(),
+            use_cache=True,
+            cache_backend="registry",
+            cache_tags=builder.registry_cache_tags("feature", "main"),
+            cache_export_tag=builder.registry_cache_export_tag("feature"),
+        )
+        expected_cmd = [
+            "buildx",
+            "build",
+            "--network=host",
+            "--load",
+            "--cache-from",
+            "type=registry,ref=registry.io/test:cache-feature",
+            "--cache-from",
+            "type=registry,ref=registry.io/test:cache-main",
+            "--cache-from",
+            "type=registry,ref=registry.io/test:cache",
+            "--cache-to",
+            "type=registry,ref=registry.io/test:cache-feature,mode=max",
+            "-f",
+            options.image.dockerfile,
+            "-t",
+            options.image.local,
+            ".",
+        ]
+
+        result = builder.build(options, runner.run, logging.getLogger())
+        self.assertEqual(0, result)
+        runner.run.assert_called_once_with(expected_cmd)
+
+    @mock.patch("skipper.utils.get_runtime_command", mock.MagicMock(return_value="docker"))
+    @mock.patch("skipper.utils.run_container_command", mock.MagicMock(return_value=BUILDX_DOCKER_BUILDER))
+    def test_build_with_registry_cache_on_docker_driver(self):
+        """Testing the 'build' function importing but not exporting a registry cache with the docker driver."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+        logger = mock.MagicMock()
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="test",
+                registry="registry.io",
+            ),
+            container_context=(),
+            use_cache=True,
+            cache_backend="registry",
+            cache_tags=["cache-main"],
+        )
+
+        self.assertEqual(0, builder.build(options, runner.run, logger))
+        runner.run.assert_called_once_with([
+            "buildx", "build", "--network=host", "--load", "--cache-from", "type=registry,ref=registry.io/test:cache-main",
+            "-f", "test", "-t", "test:test", ".",
+        ])
+        logger.warning.assert_called_once()
+
+    @mock.patch("skipper.utils.get_runtime_command", mock.MagicMock(return_value="docker"))
+    @mock.patch.dict("os.environ", {"SKIPPER_BUILDX_BUILDER": "skipper"})
+    @mock.patch("skipper.utils.run_container_command", return_value=BUILDX_CONTAINER_BUILDER)
+    def test_build_with_local_cache(self, run_container_command_mock):
+        """Testing the 'build' function with a BuildKit local cache."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="test",
+            ),
+            container_context=(),
+            use_cache=True,
+            cache_backend="local",
+            cache_dir="/var/cache/buildkit",
+        )
+        expected_cmd = [
+            "buildx",
+            "build",
+            "--builder",
+            "skipper",
+            "--network=host",
+            "--load",
+            "--cache-from",
+            "type=local,src=/var/cache/buildkit",
+            "--cache-to",
+            "type=local,dest=/var/cache/buildkit,mode=max",
+            "-f",
+            options.image.dockerfile,
+            "-t",
+            options.image.local,
+            ".",
+        ]
+
+        result = builder.build(options, runner.run, logging.getLogger())
+        self.assertEqual(0, result)
+        runner.run.assert_called_once_with(expected_cmd)
+        run_container_command_mock.assert_called_once_with(["buildx", "inspect", "skipper"])
+
+    @mock.patch("skipper.utils.get_runtime_command", mock.MagicMock(return_value="docker"))
+    def test_build_with_registry_cache_without_registry(self):
+        """Testing the 'build' function with a registry cache but no registry."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="test",
+            ),
+            container_context=(),
+            use_cache=True,
+            cache_backend="registry",
+        )
+
+        result = builder.build(options, runner.run, logging.getLogger())
+        self.assertEqual(0, result)
+        runner.run.assert_called_once_with(
+            ["build", "--network=host", "-f", "test", "-t", "test:test", "."]
+        )
+
+    @mock.patch("skipper.utils.get_runtime_command", mock.MagicMock(return_value="podman"))
+    def test_build_with_registry_cache_on_podman(self):
+        """Testing the 'build' function with a registry cache on podman."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="test",
+                registry="registry.io",
+            ),
+            container_context=(),
+            use_cache=True,
+            cache_backend="registry",
+        )
+
+        result = builder.build(options, runner.run, logging.getLogger())
+        self.assertEqual(0, result)
+        runner.run.assert_called_once_with(
+            ["build", "--network=host", "-f", "test", "-t", "test:test", "."]
+        )
+
+    @mock.patch("skipper.pushes.push_in_background")
+    def test_build_with_background_push(self, push_in_background_mock):
+        """Testing the 'build' function pushing the image cache in the background."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="test",
+            ),
+            container_context=(),
+            use_cache=True,
+            background_push=True,
+        )
+
+        result = builder.build(options, runner.run, logging.getLogger())
+        self.assertEqual(0, result)
+        runner.run.assert_has_calls([
+            mock.call(["pull", options.image.cache_fqdn]),
+            mock.call(["tag", options.image.name, options.image.cache_fqdn]),
+        ], any_order=True)
+        self.assertNotIn(mock.call(["push", options.image.cache_fqdn]), runner.run.call_args_list)
+        push_in_background_mock.assert_called_once_with(options.image.cache_fqdn, mock.ANY)
+
+    def test_build_with_labels(self):
+        """Testing the 'build' function with labels."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="test",
+            ),
+            container_context=(),
+            labels=["org.opencontainers.image.revision=1234567"],
+        )
+        expected_cmd = [
+            "build",
+            "--network=host",
+            "--label",
+            "org.opencontainers.image.revision=1234567",
+            "-f",
+            options.image.dockerfile,
+            "-t",
+            options.image.local,
+            ".",
+        ]
+
+        result = builder.build(options, runner.run, logging.getLogger())
+        self.assertEqual(0, result)
+        runner.run.assert_called_once_with(expected_cmd)
+
+    def test_tag_arg_warnings(self):
+        """Testing the detection of ARG TAG instructions that invalidate the cache of later layers."""
+
+        with tempfile.NamedTemporaryFile("w", suffix=".Dockerfile") as dockerfile:
+            dockerfile.write(
+                "ARG TAG\n"
+                "FROM base:${TAG} AS deps\n"
+                "# Dependencies\n"
+                "ARG TAG\n"
+                "RUN apt-get update && \\\n"
+                "    apt-get install -y gcc\n"
+                "RUN pip install -r requirements.txt\n"
+                "FROM deps\n"
+                "COPY . /src\n"
+                "ARG TAG=none\n"
+                "RUN echo ${TAG} > /version\n"
+            )
+            dockerfile.flush()
+            self.assertEqual([(4, 2)], builder.tag_arg_warnings(dockerfile.name))
+
+        self.assertEqual([], builder.tag_arg_warnings("/nonexistent/Dockerfile"))
+
+    @mock.patch("skipper.utils.get_runtime_command", mock.MagicMock(return_value="docker"))
+    def test_build_with_report(self):
+        """Testing the 'build' function writing a build report."""
+
+        def run(cmd, stderr_callback):
+            for line in ["#1 [1/2] FROM base\n", "#1 DONE 1.5s\n", "#2 [2/2] RUN make\n", "#2 CACHED\n"]:
+                stderr_callback(line)
+            return 0
+
+        runner = mock.MagicMock()
+        runner.run.side_effect = run
+
+        with tempfile.TemporaryDirectory() as report_dir:
+            options = BuildOptions(
+                image=Image(
+                    name="test",
+                    tag="test",
+                    dockerfile="test",
+                ),
+                container_context=(),
+                report_dir=report_dir,
+            )
+
+            result = builder.build(options, runner.run, logging.getLogger())
+            self.assertEqual(0, result)
+            runner.run.assert_called_once_with(
+                ["build", "--network=host", "--progress=plain", "-f", "test", "-t", "test:test", "."],
+                stderr_callback=mock.ANY,
+            )
+            with open(os.path.join(report_dir, "test.json")) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(1, report["cache_hits"])
+        self.assertEqual(1, report["cache_misses"])
+        self.assertEqual(1.5, report["steps"][0]["duration"])
+
+    @mock.patch("skipper.utils.get_runtime_command", mock.MagicMock(return_value="docker"))
+    @mock.patch("skipper.build_report.BuildReport.save", mock.MagicMock(side_effect=PermissionError(13, "Permission denied")))
+    def test_build_with_unwritable_report(self):
+        """Testing the 'build' function succeeding when its report can't be written."""
+
+        runner = mock.MagicMock(return_value=0)
+        logger = mock.MagicMock()
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="test",
+            ),
+            container_context=(),
+            report_dir="/read-only",
+        )
+
+        self.assertEqual(0, builder.build(options, runner, logger))
+        logger.warning.assert_called_once_with("Failed to write the build report of %s: %s", "test:test", mock.ANY)
+
+    @mock.patch("skipper.context.git_context_files", mock.MagicMock(return_value=["Dockerfile.test", "src/main.py"]))
+    @mock.patch("skipper.context.write_context_archive")
+    def test_build_with_git_context(self, write_context_archive_mock):
+        """Testing the 'build' function sending the files tracked by git as the build context."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="context/Dockerfile.test",
+            ),
+            container_context="context",
+            context_source="git",
+        )
+
+        result = builder.build(options, runner.run, logging.getLogger())
+        self.assertEqual(0, result)
+        runner.run.assert_called_once_with(
+            ["build", "--network=host", "-f", "Dockerfile.test", "-t", "test:test", "-"],
+            stdin_writer=mock.ANY,
+        )
+        stream = mock.Mock()
+        runner.run.call_args[1]["stdin_writer"](stream)
+        write_context_archive_mock.assert_called_once_with(stream, "context", ["Dockerfile.test", "src/main.py"], None)
+
+    @mock.patch("skipper.context.git_context_files", mock.MagicMock(return_value=["src/main.py"]))
+    @mock.patch("skipper.context.write_context_archive")
+    def test_build_with_git_context_and_external_dockerfile(self, write_context_archive_mock):
+        """Testing the 'build' function sending a Dockerfile from outside of a git build context."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="Dockerfile.test",
+            ),
+            container_context="context",
+            context_source="git",
+        )
+
+        result = builder.build(options, runner.run, logging.getLogger())
+        self.assertEqual(0, result)
+        runner.run.assert_called_once_with(
+            ["build", "--network=host", "-f", ".skipper.Dockerfile", "-t", "test:test", "-"],
+            stdin_writer=mock.ANY,
+        )
+        runner.run.call_args[1]["stdin_writer"](mock.sentinel.stream)
+        write_context_archive_mock.assert_called_once_with(mock.sentinel.stream, "context", ["src/main.py"], "Dockerfile.test")
+
+    @mock.patch("skipper.context.git_context_files", mock.MagicMock(side_effect=subprocess.CalledProcessError(128, "git")))
+    def test_build_with_git_context_outside_of_git(self):
+        """Testing the 'build' function with a git build context that is not in a git work tree."""
+
+        runner = mock.MagicMock()
+        runner.run.return_value = 0
+
+        options = BuildOptions(
+            image=Image(
+                name="test",
+                tag="test",
+                dockerfile="test",
+            ),
+            container_context="context",
+            context_source="git",
+        )
+
+        result = builder.build(options, runner.run, logging.getLogger())
+        self.assertEqual(0, result)
+        runner.run.assert_called_once_with(["build", "--network=host", "-f", "test", "-t", "test:test", "context"])
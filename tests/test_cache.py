@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+import mock
+
+from skipper import cache
+
+REGISTRY = 'registry.io:5000'
+IMAGE = 'image'
+KEY = ('HEAD', 'https://registry.io:5000/v2/image/manifests/1234567')
+
+
+class TestRegistryCache(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache = cache.RegistryCache(cache_dir.name, positive_ttl=100, negative_ttl=10)
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get(REGISTRY, IMAGE, KEY))
+
+    @mock.patch('time.time')
+    def test_positive_and_negative_ttl(self, time_mock):
+        time_mock.return_value = 1000
+        self.cache.put(REGISTRY, IMAGE, KEY, 'positive', etag='"etag"')
+        self.cache.put(REGISTRY, IMAGE, KEY + ('negative',), 'negative', positive=False)
+
+        time_mock.return_value = 1050
+        self.assertEqual(self.cache.get(REGISTRY, IMAGE, KEY), ('positive', True, '"etag"'))
+        self.assertEqual(self.cache.get(REGISTRY, IMAGE, KEY + ('negative',)), ('negative', False, None))
+
+    @mock.patch('time.time')
+    def test_refresh(self, time_mock):
+        time_mock.return_value = 1000
+        self.cache.put(REGISTRY, IMAGE, KEY, 'value', etag='"etag"')
+        time_mock.return_value = 2000
+        self.cache.refresh(REGISTRY, IMAGE, KEY)
+        self.assertEqual(self.cache.get(REGISTRY, IMAGE, KEY), ('value', True, '"etag"'))
+
+    def test_invalidate(self):
+        self.cache.put(REGISTRY, IMAGE, KEY, 'value')
+        self.cache.put(REGISTRY, 'other', KEY, 'value')
+        self.cache.invalidate(REGISTRY, IMAGE)
+        self.assertIsNone(self.cache.get(REGISTRY, IMAGE, KEY))
+        self.assertIsNotNone(self.cache.get(REGISTRY, 'other', KEY))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for index in range(3):
+            self.cache.put(REGISTRY, IMAGE, KEY + (index,), 'x' * 100)
+            entry_path = self.cache._entry_path(REGISTRY, IMAGE, KEY + (index,))  # pylint: disable=protected-access
+            os.utime(entry_path, (index, index))
+        entry_size = os.path.getsize(entry_path)
+        # room for three entries, whose sizes may differ by a few bytes, but not for a fourth
+        self.cache.max_size = 3 * entry_size + entry_size // 2
+        # reading the oldest entry makes it the most recently used one
+        self.cache.get(REGISTRY, IMAGE, KEY + (0,))
+        self.cache.put(REGISTRY, IMAGE, KEY + (3,), 'x' * 100)
+
+        self.assertIsNotNone(self.cache.get(REGISTRY, IMAGE, KEY + (0,)))
+        self.assertIsNone(self.cache.get(REGISTRY, IMAGE, KEY + (1,)))
+        self.assertIsNotNone(self.cache.get(REGISTRY, IMAGE, KEY + (2,)))
+        self.assertIsNotNone(self.cache.get(REGISTRY, IMAGE, KEY + (3,)))
+
+    def test_entries_are_walked_only_over_the_limit(self):
+        with mock.patch('os.walk', wraps=os.walk) as walk_mock:
+            for index in range(10):
+                self.cache.put(REGISTRY, IMAGE, KEY + (index,), 'value')
+            self.assertEqual(walk_mock.call_count, 1)
+
+            self.cache.max_size = 1
+            self.cache.put(REGISTRY, IMAGE, KEY + (10,), 'value')
+            self.assertEqual(walk_mock.call_count, 2)
+        self.assertIsNone(self.cache.get(REGISTRY, IMAGE, KEY + (0,)))
+
+    @mock.patch.dict(os.environ, {'SKIPPER_REGISTRY_CACHE': 'false'})
+    def test_disabled_from_env(self):
+        self.assertIsNone(cache.RegistryCache.from_env())
+
+    @mock.patch.dict(os.environ, {'SKIPPER_CACHE_DIR': '/tmp/skipper-cache', 'SKIPPER_REGISTRY_CACHE_TTL': '5'})
+    def test_from_env(self):
+        registry_cache = cache.RegistryCache.from_env()
+        self.assertEqual(registry_cache.path, '/tmp/skipper-cache/registry')
+        self.assertEqual(registry_cache.positive_ttl, 5)
+        self.assertEqual(registry_cache.negative_ttl, cache.RegistryCache.NEGATIVE_TTL)
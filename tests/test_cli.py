@@ -1,4 +1,5 @@
 import os
+import tempfile
 import unittest
 import mock
 from six.moves import http_client
@@ -8,7 +9,7 @@ from click import testing
 from requests import HTTPError
 
 from skipper import cli
-from skipper import config, utils
+from skipper import config, git, locking, utils
 from tests.consts import REGISTRY, SKIPPER_CONF_BUILD_CONTAINER_TAG, SKIPPER_CONF_MAKEFILE, SKIPPER_CONF_BUILD_CONTAINER_IMAGE, IMAGE, TAG
 
 BUILD_CONTAINER_IMAGE = 'build-container-image'
@@ -154,8 +155,16 @@ SKIPPER_CONF_WITH_CONTEXT_NO_TAG = {
 
 class TestCLI(unittest.TestCase):
     def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        environ_patcher = mock.patch.dict(os.environ, {'SKIPPER_CACHE_DIR': cache_dir.name,
+                                                       'SKIPPER_RUNTIME_DIR': os.path.join(cache_dir.name, 'runtime')})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+        git._get_hash.cache_clear()  # pylint: disable=protected-access
         self.runtime = "docker"
         utils.CONTAINER_RUNTIME_COMMAND = self.runtime
+        utils.ENGINE_CLIENT = False
         self._runner = testing.CliRunner()
         self.global_params = [
             '--registry', REGISTRY,
@@ -254,6 +263,80 @@ class TestCLI(unittest.TestCase):
         ]
         skipper_runner_run_mock.assert_called_once_with(expected_command)
 
+    @mock.patch('skipper.utils.get_images_from_dockerfiles', mock.MagicMock(autospec=True,
+                                                                            return_value={
+                                                                                'image1': '/home/user/work/project/Dockerfile.image1'}))
+    @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
+    @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('skipper.builder.tag_arg_warnings', autospec=True)
+    @mock.patch('skipper.runner.run', autospec=True, return_value=0)
+    def test_build_with_tag_as_label(self, skipper_runner_run_mock, tag_arg_warnings_mock):
+        build_params = ['image1', '--tag-as', 'label', '--container-context', '/home/user/work/project']
+        self._invoke_cli(
+            global_params=self.global_params,
+            subcmd='build',
+            subcmd_params=build_params
+        )
+        expected_command = [
+            'build',
+            '--network=host',
+            '--label', 'org.opencontainers.image.revision=1234567',
+            '-f', '/home/user/work/project/Dockerfile.image1',
+            '-t', 'image1:1234567',
+            '/home/user/work/project'
+        ]
+        skipper_runner_run_mock.assert_called_once_with(expected_command)
+        tag_arg_warnings_mock.assert_not_called()
+
+    @mock.patch('skipper.utils.get_images_from_dockerfiles', mock.MagicMock(autospec=True,
+                                                                            return_value={
+                                                                                'image1': '/home/user/work/project/Dockerfile.image1'}))
+    @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
+    @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('skipper.builder.tag_arg_warnings', autospec=True, return_value=[(3, 5)])
+    @mock.patch('skipper.runner.run', autospec=True, return_value=0)
+    def test_build_warns_on_early_tag_arg(self, skipper_runner_run_mock, tag_arg_warnings_mock):
+        with mock.patch.object(utils.logger, 'warning') as warning_mock:
+            self._invoke_cli(
+                global_params=self.global_params,
+                subcmd='build',
+                subcmd_params=['image1']
+            )
+        tag_arg_warnings_mock.assert_called_once_with('/home/user/work/project/Dockerfile.image1')
+        warning_mock.assert_any_call(mock.ANY, '/home/user/work/project/Dockerfile.image1', 3, 5)
+        skipper_runner_run_mock.assert_called_once()
+
+    @mock.patch('skipper.utils.get_images_from_dockerfiles', mock.MagicMock(autospec=True,
+                                                                            return_value={
+                                                                                'image1': '/home/user/work/project/Dockerfile.image1'}))
+    @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
+    @mock.patch('skipper.git.current_branch', mock.MagicMock(autospec=True, return_value='feature'))
+    @mock.patch('skipper.git.default_branch', mock.MagicMock(autospec=True, return_value='main'))
+    @mock.patch('skipper.utils.run_container_command', mock.MagicMock(autospec=True, return_value='Driver: docker-container'))
+    @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('skipper.runner.run', autospec=True, return_value=0)
+    def test_build_with_registry_build_cache(self, skipper_runner_run_mock):
+        build_params = ['image1', '--cache', '--container-context', '/home/user/work/project']
+        self._invoke_cli(
+            global_params=self.global_params + ['--build-cache', 'registry'],
+            subcmd='build',
+            subcmd_params=build_params
+        )
+        expected_command = [
+            'buildx', 'build',
+            '--network=host',
+            '--load',
+            '--cache-from', f'type=registry,ref={REGISTRY}/image1:cache-feature',
+            '--cache-from', f'type=registry,ref={REGISTRY}/image1:cache-main',
+            '--cache-from', f'type=registry,ref={REGISTRY}/image1:cache',
+            '--cache-to', f'type=registry,ref={REGISTRY}/image1:cache-feature,mode=max',
+            '--build-arg', 'TAG=1234567',
+            '-f', '/home/user/work/project/Dockerfile.image1',
+            '-t', 'image1:1234567',
+            '/home/user/work/project'
+        ]
+        skipper_runner_run_mock.assert_called_once_with(expected_command)
+
     @mock.patch('skipper.utils.get_images_from_dockerfiles', mock.MagicMock(autospec=True,
                                                                             return_value={
                                                                                 'image1': '/home/user/work/project/Dockerfile.image1',
@@ -394,6 +477,52 @@ class TestCLI(unittest.TestCase):
         ]
         skipper_runner_run_mock.assert_called_once_with(expected_command)
 
+    @mock.patch('skipper.utils.get_images_from_dockerfiles', mock.MagicMock(autospec=True,
+                                                                            return_value={
+                                                                                'image1': '/home/user/work/project/Dockerfile.image1',
+                                                                                'image2': '/home/user/work/project/Dockerfile.image2'}))
+    @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
+    @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('skipper.runner.run', autospec=True, return_value=1)
+    def test_build_multiple_images_fail_fast(self, skipper_runner_run_mock):
+        result = self._invoke_cli(
+            global_params=self.global_params,
+            subcmd='build',
+            subcmd_params=['image1', 'image2']
+        )
+        self.assertEqual(skipper_runner_run_mock.call_count, 1)
+        self.assertEqual(result.return_value, 1)
+
+    @mock.patch('skipper.utils.get_images_from_dockerfiles', mock.MagicMock(autospec=True,
+                                                                            return_value={
+                                                                                'image1': '/home/user/work/project/Dockerfile.image1',
+                                                                                'image2': '/home/user/work/project/Dockerfile.image2',
+                                                                                'image3': '/home/user/work/project/Dockerfile.image3'}))
+    @mock.patch('skipper.scheduler.get_base_images', mock.MagicMock(
+        autospec=True, side_effect=lambda dockerfile: {'image1'} if 'image2' in dockerfile else set()))
+    @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
+    @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('skipper.runner.run', autospec=True, return_value=1)
+    def test_build_multiple_images_keep_going(self, skipper_runner_run_mock):
+        self._invoke_cli(
+            global_params=self.global_params,
+            subcmd='build',
+            subcmd_params=['image2', 'image1', 'image3', '--jobs', '2', '--keep-going']
+        )
+        expected_commands = [
+            mock.call(['build', '--network=host', '--build-arg', 'TAG=1234567',
+                       '-f', '/home/user/work/project/Dockerfile.image1', '-t',
+                       'image1:1234567',
+                       '/home/user/work/project']),
+            mock.call(['build', '--network=host', '--build-arg', 'TAG=1234567',
+                       '-f', '/home/user/work/project/Dockerfile.image3', '-t',
+                       'image3:1234567',
+                       '/home/user/work/project']),
+        ]
+        # image2 is built on top of image1, which failed
+        skipper_runner_run_mock.assert_has_calls(expected_commands, any_order=True)
+        self.assertEqual(skipper_runner_run_mock.call_count, 2)
+
     @mock.patch('skipper.utils.get_images_from_dockerfiles', mock.MagicMock(autospec=True,
                                                                             return_value={
                                                                                 'image1': '/home/user/work/project/Dockerfile.image1',
@@ -531,18 +660,12 @@ class TestCLI(unittest.TestCase):
         skipper_runner_run_mock.assert_called_once_with(expected_commands)
 
     @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.head')
     @mock.patch('skipper.runner.run', autospec=True)
-    def test_push(self, skipper_runner_run_mock, requests_get_mock):
+    def test_push(self, skipper_runner_run_mock, requests_head_mock):
         skipper_runner_run_mock.side_effect = [0, 0]
         push_params = ['my_image']
-        with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
-            requests_response_mock = requests_response_class_mock.return_value
-            requests_response_mock.json.return_value = {
-                'name': 'my_image',
-                'tags': ['latest', 'aaaaaaa', 'bbbbbbb']
-            }
-            requests_get_mock.return_value = requests_response_mock
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.NOT_FOUND)
 
         self._invoke_cli(
             global_params=self.global_params,
@@ -555,20 +678,45 @@ class TestCLI(unittest.TestCase):
             mock.call(['rmi', 'registry.io:5000/my_image:1234567']),
         ]
         skipper_runner_run_mock.assert_has_calls(expected_commands)
+        requests_head_mock.assert_called_once_with(url='https://registry.io:5000/v2/my_image/manifests/1234567',
+                                                   headers={'Accept': utils.MANIFEST_MEDIA_TYPES})
 
     @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.get')
+    @mock.patch('requests.Session.head')
     @mock.patch('skipper.runner.run', autospec=True)
-    def test_push_already_in_registry(self, skipper_runner_run_mock, requests_get_mock):
+    def test_push_already_in_registry_without_manifest_head(self, skipper_runner_run_mock, requests_head_mock,
+                                                            requests_get_mock):
         skipper_runner_run_mock.side_effect = [0, 0]
         push_params = ['my_image']
-        with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
-            requests_response_mock = requests_response_class_mock.return_value
-            requests_response_mock.json.return_value = {
-                'name': 'my_image',
-                'tags': ['latest', 'aaaaaaa', 'bbbbbbb', "1234567"]
-            }
-            requests_get_mock.return_value = requests_response_mock
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.METHOD_NOT_ALLOWED)
+        requests_get_mock.return_value = mock.Mock(status_code=http_client.OK, links={})
+        requests_get_mock.return_value.json.return_value = {
+            'name': 'my_image',
+            'tags': ['latest', 'aaaaaaa', 'bbbbbbb', '1234567']
+        }
+
+        self._invoke_cli(
+            global_params=self.global_params,
+            subcmd='push',
+            subcmd_params=push_params
+        )
+        expected_commands = [
+            mock.call(['tag', 'my_image:1234567', 'registry.io:5000/my_image:1234567']),
+            mock.call(['rmi', 'registry.io:5000/my_image:1234567']),
+        ]
+        self.assertEqual(skipper_runner_run_mock.call_args_list, expected_commands)
+        requests_get_mock.assert_called_once_with(url='https://registry.io:5000/v2/my_image/tags/list',
+                                                  params={'n': utils.REGISTRY_PAGE_SIZE},
+                                                  headers={'Accept': 'application/vnd.docker.distribution.manifest.v2+json'})
+
+    @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
+    @mock.patch('requests.Session.head')
+    @mock.patch('skipper.runner.run', autospec=True)
+    def test_push_already_in_registry(self, skipper_runner_run_mock, requests_head_mock):
+        skipper_runner_run_mock.side_effect = [0, 0]
+        push_params = ['my_image']
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.OK)
 
         self._invoke_cli(
             global_params=self.global_params,
@@ -582,18 +730,12 @@ class TestCLI(unittest.TestCase):
         skipper_runner_run_mock.assert_has_calls(expected_commands)
 
     @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.head')
     @mock.patch('skipper.runner.run', autospec=True)
-    def test_push_already_in_registry_with_force(self, skipper_runner_run_mock, requests_get_mock):
+    def test_push_already_in_registry_with_force(self, skipper_runner_run_mock, requests_head_mock):
         skipper_runner_run_mock.side_effect = [0, 0]
         push_params = ['my_image', "--force"]
-        with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
-            requests_response_mock = requests_response_class_mock.return_value
-            requests_response_mock.json.return_value = {
-                'name': 'my_image',
-                'tags': ['latest', 'aaaaaaa', 'bbbbbbb']
-            }
-            requests_get_mock.return_value = requests_response_mock
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.OK)
 
         self._invoke_cli(
             global_params=self.global_params,
@@ -608,18 +750,12 @@ class TestCLI(unittest.TestCase):
         skipper_runner_run_mock.assert_has_calls(expected_commands)
 
     @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.head')
     @mock.patch('skipper.runner.run', autospec=True)
-    def test_push_fail(self, skipper_runner_run_mock, requests_get_mock):
+    def test_push_fail(self, skipper_runner_run_mock, requests_head_mock):
         skipper_runner_run_mock.side_effect = [0, 1]
         push_params = ['my_image']
-        with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
-            requests_response_mock = requests_response_class_mock.return_value
-            requests_response_mock.json.return_value = {
-                'name': 'my_image',
-                'tags': ['latest', 'aaaaaaa', 'bbbbbbb']
-            }
-            requests_get_mock.return_value = requests_response_mock
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.NOT_FOUND)
 
         result = self._invoke_cli(
             global_params=self.global_params,
@@ -650,18 +786,12 @@ class TestCLI(unittest.TestCase):
         skipper_runner_run_mock.assert_has_calls(expected_commands)
 
     @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.head')
     @mock.patch('skipper.runner.run', autospec=True)
-    def test_push_rmi_fail(self, skipper_runner_run_mock, requests_get_mock):
+    def test_push_rmi_fail(self, skipper_runner_run_mock, requests_head_mock):
         skipper_runner_run_mock.side_effect = [0, 0, 1]
         push_params = ['my_image']
-        with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
-            requests_response_mock = requests_response_class_mock.return_value
-            requests_response_mock.json.return_value = {
-                'name': 'my_image',
-                'tags': ['latest', 'aaaaaaa', 'bbbbbbb']
-            }
-            requests_get_mock.return_value = requests_response_mock
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.NOT_FOUND)
 
         result = self._invoke_cli(
             global_params=self.global_params,
@@ -677,18 +807,12 @@ class TestCLI(unittest.TestCase):
         skipper_runner_run_mock.assert_has_calls(expected_commands)
 
     @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.head')
     @mock.patch('skipper.runner.run', autospec=True)
-    def test_push_to_namespace(self, skipper_runner_run_mock, requests_get_mock):
+    def test_push_to_namespace(self, skipper_runner_run_mock, requests_head_mock):
         skipper_runner_run_mock.side_effect = [0, 0]
         push_params = ['--namespace', 'my_namespace', 'my_image']
-        with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
-            requests_response_mock = requests_response_class_mock.return_value
-            requests_response_mock.json.return_value = {
-                'name': 'my_image',
-                'tags': ['latest', 'aaaaaaa', 'bbbbbbb']
-            }
-            requests_get_mock.return_value = requests_response_mock
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.NOT_FOUND)
 
         self._invoke_cli(
             global_params=self.global_params,
@@ -705,18 +829,12 @@ class TestCLI(unittest.TestCase):
     @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
     @mock.patch('skipper.config.load_defaults', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF))
     @mock.patch('skipper.git.get_hash', mock.MagicMock(autospec=True, return_value='1234567'))
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.head')
     @mock.patch('skipper.runner.run', autospec=True)
-    def test_push_with_defaults_from_config_file(self, skipper_runner_run_mock, requests_get_mock):
+    def test_push_with_defaults_from_config_file(self, skipper_runner_run_mock, requests_head_mock):
         skipper_runner_run_mock.side_effect = [0, 0]
         push_params = ['my_image']
-        with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
-            requests_response_mock = requests_response_class_mock.return_value
-            requests_response_mock.json.return_value = {
-                'name': 'my_image',
-                'tags': ['latest', 'aaaaaaa', 'bbbbbbb']
-            }
-            requests_get_mock.return_value = requests_response_mock
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.NOT_FOUND)
 
         self._invoke_cli(
             defaults=config.load_defaults(),
@@ -745,7 +863,7 @@ class TestCLI(unittest.TestCase):
             'docker',
             'images',
             '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
-            'my_image'
+            '--filter', 'reference=my_image',
         ]
         subprocess_check_output_mock.assert_called_once_with(expected_command)
         tabulate_mock.assert_called_once_with([['none', 'my_image', '1234567']], headers=['REGISTRY', 'IMAGE', 'TAG'],
@@ -755,26 +873,25 @@ class TestCLI(unittest.TestCase):
     @mock.patch('tabulate.tabulate', autospec=True)
     @mock.patch('subprocess.check_output', autospec=True)
     def test_images_with_multiple_local_results(self, subprocess_check_output_mock, tabulate_mock):
-        subprocess_check_output_mock.side_effect = [
-            '{"name": "image1", "tag": "aaaaaaa"}\n',
-            '{"name": "image2", "tag": "bbbbbbb"}\n{"name": "image2", "tag": "ccccccc"}\n',
-        ]
+        subprocess_check_output_mock.return_value = (
+            '{"name": "image2", "tag": "bbbbbbb"}\n'
+            '{"name": "image1", "tag": "aaaaaaa"}\n'
+            '{"name": "image2", "tag": "ccccccc"}\n'
+        )
         self._invoke_cli(
             global_params=self.global_params,
             subcmd='images',
             subcmd_params=[]
         )
 
-        command_prefix = [
+        expected_command = [
             'docker',
             'images',
             '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
+            '--filter', 'reference=image1',
+            '--filter', 'reference=image2',
         ]
-        expected_check_output_calls = [
-            mock.call(command_prefix + ['image1']),
-            mock.call(command_prefix + ['image2']),
-        ]
-        subprocess_check_output_mock.assert_has_calls(expected_check_output_calls, any_order=True)
+        subprocess_check_output_mock.assert_called_once_with(expected_command)
         expected_table = [
             ['none', 'image1', 'aaaaaaa'],
             ['none', 'image2', 'bbbbbbb'],
@@ -782,13 +899,11 @@ class TestCLI(unittest.TestCase):
         ]
         tabulate_mock.assert_called_once_with(expected_table, headers=['REGISTRY', 'IMAGE', 'TAG'], tablefmt='grid')
 
-    @mock.patch('skipper.utils.HttpBearerAuth', autospec=True)
     @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.my_image']))
     @mock.patch('tabulate.tabulate', autospec=True)
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.get')
     @mock.patch('subprocess.check_output', autospec=True)
-    def test_images_with_all_results(self, subprocess_check_output_mock, requests_get_mock, tabulate_mock,
-                                     requests_bearer_auth_mock):
+    def test_images_with_all_results(self, subprocess_check_output_mock, requests_get_mock, tabulate_mock):
         subprocess_check_output_mock.return_value = '{"name": "my_image", "tag": "aaaaaaa"}'
 
         with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
@@ -797,6 +912,9 @@ class TestCLI(unittest.TestCase):
                 'name': 'my_image',
                 'tags': ['latest', 'aaaaaaa', 'bbbbbbb']
             }
+            requests_response_mock.status_code = http_client.OK
+            requests_response_mock.headers = {}
+            requests_response_mock.links = {}
             requests_get_mock.return_value = requests_response_mock
 
         self._invoke_cli(
@@ -809,16 +927,12 @@ class TestCLI(unittest.TestCase):
             'docker',
             'images',
             '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
-            'my_image',
+            '--filter', 'reference=my_image',
         ]
         subprocess_check_output_mock.assert_called_once_with(expected_command)
 
         expected_url = 'https://%(registry)s/v2/my_image/tags/list' % dict(registry=REGISTRY)
-        requests_get_mock.assert_called_once_with(
-            url=expected_url,
-            auth=requests_bearer_auth_mock(),
-            verify=False
-        )
+        requests_get_mock.assert_called_once_with(url=expected_url, params={'n': utils.REGISTRY_PAGE_SIZE}, headers=None)
 
         expected_images_results = [
             ['none', 'my_image', 'aaaaaaa'],
@@ -829,19 +943,41 @@ class TestCLI(unittest.TestCase):
         tabulate_mock.assert_called_once_with(expected_images_results, headers=['REGISTRY', 'IMAGE', 'TAG'],
                                               tablefmt='grid')
 
-    @mock.patch('skipper.utils.HttpBearerAuth', autospec=True)
     @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.my_image']))
     @mock.patch('tabulate.tabulate', autospec=True)
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('skipper.utils.get_remote_images_info', autospec=True)
+    @mock.patch('subprocess.check_output', autospec=True, return_value='{"name": "my_image", "tag": "aaaaaaa"}')
+    def test_images_with_plain_format(self, subprocess_check_output_mock, get_remote_images_info_mock, tabulate_mock):
+        get_remote_images_info_mock.return_value = iter([[REGISTRY, 'my_image', 'latest'], [REGISTRY, 'my_image', 'aaaaaaa']])
+        result = self._invoke_cli(
+            global_params=self.global_params,
+            subcmd='images',
+            subcmd_params=['-r', '--format', 'plain']
+        )
+
+        subprocess_check_output_mock.assert_called_once()
+        # The output starts with the logged expected images
+        self.assertEqual(result.output.splitlines()[-3:], [
+            'none\tmy_image\taaaaaaa',
+            f'{REGISTRY}\tmy_image\tlatest',
+            f'{REGISTRY}\tmy_image\taaaaaaa',
+        ])
+        tabulate_mock.assert_not_called()
+
+    @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.my_image']))
+    @mock.patch('tabulate.tabulate', autospec=True)
+    @mock.patch('requests.Session.get')
     @mock.patch('subprocess.check_output', autospec=True, return_value='')
-    def test_images_with_remote_results_only(self, subprocess_check_output_mock, requests_get_mock, tabulate_mock,
-                                             requests_bearer_auth_mock):
+    def test_images_with_remote_results_only(self, subprocess_check_output_mock, requests_get_mock, tabulate_mock):
         with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
             requests_response_mock = requests_response_class_mock.return_value
             requests_response_mock.json.return_value = {
                 'name': 'my_image',
                 'tags': ['latest', 'aaaaaaa', 'bbbbbbb']
             }
+            requests_response_mock.status_code = http_client.OK
+            requests_response_mock.headers = {}
+            requests_response_mock.links = {}
             requests_get_mock.return_value = requests_response_mock
 
         self._invoke_cli(
@@ -854,16 +990,12 @@ class TestCLI(unittest.TestCase):
             'docker',
             'images',
             '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
-            'my_image',
+            '--filter', 'reference=my_image',
         ]
         subprocess_check_output_mock.assert_called_once_with(expected_command)
 
         expected_url = 'https://%(registry)s/v2/my_image/tags/list' % dict(registry=REGISTRY)
-        requests_get_mock.assert_called_once_with(
-            url=expected_url,
-            verify=False,
-            auth=requests_bearer_auth_mock()
-        )
+        requests_get_mock.assert_called_once_with(url=expected_url, params={'n': utils.REGISTRY_PAGE_SIZE}, headers=None)
 
         expected_images_results = [
             ['registry.io:5000', 'my_image', 'latest'],
@@ -873,13 +1005,11 @@ class TestCLI(unittest.TestCase):
         tabulate_mock.assert_called_once_with(expected_images_results, headers=['REGISTRY', 'IMAGE', 'TAG'],
                                               tablefmt='grid')
 
-    @mock.patch('skipper.utils.HttpBearerAuth', autospec=True)
     @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.my_image']))
     @mock.patch('tabulate.tabulate', autospec=True)
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.get')
     @mock.patch('subprocess.check_output', autospec=True, return_value='')
-    def test_images_with_missing_remote_results(self, subprocess_check_output_mock, requests_get_mock, tabulate_mock,
-                                                requests_bearer_auth_mock):
+    def test_images_with_missing_remote_results(self, subprocess_check_output_mock, requests_get_mock, tabulate_mock):
         with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
             requests_response_mock = requests_response_class_mock.return_value
             requests_response_mock.ok = False
@@ -887,6 +1017,9 @@ class TestCLI(unittest.TestCase):
                 u'errors': [{u'message': u'repository name not known to registry', u'code': u'NAME_UNKNOWN',
                              u'detail': {u'name': u'my_image'}}]
             }
+            requests_response_mock.status_code = http_client.NOT_FOUND
+            requests_response_mock.headers = {}
+            requests_response_mock.links = {}
             requests_get_mock.return_value = requests_response_mock
 
         self._invoke_cli(
@@ -899,28 +1032,23 @@ class TestCLI(unittest.TestCase):
             'docker',
             'images',
             '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
-            'my_image',
+            '--filter', 'reference=my_image',
         ]
         subprocess_check_output_mock.assert_called_once_with(expected_command)
 
         expected_url = 'https://%(registry)s/v2/my_image/tags/list' % dict(registry=REGISTRY)
-        requests_get_mock.assert_called_once_with(
-            url=expected_url,
-            verify=False,
-            auth=requests_bearer_auth_mock()
-        )
+        requests_get_mock.assert_called_once_with(url=expected_url, params={'n': utils.REGISTRY_PAGE_SIZE}, headers=None)
 
         expected_images_results = []
         tabulate_mock.assert_called_once_with(expected_images_results, headers=['REGISTRY', 'IMAGE', 'TAG'],
                                               tablefmt='grid')
 
-    @mock.patch('skipper.utils.HttpBearerAuth', autospec=True)
     @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.my_image']))
     @mock.patch('tabulate.tabulate', autospec=True)
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.get')
     @mock.patch('subprocess.check_output', autospec=True)
     def test_images_with_local_result_and_missing_remote_results(self, subprocess_check_output_mock, requests_get_mock,
-                                                                 tabulate_mock, requests_bearer_auth_mock):
+                                                                 tabulate_mock):
         subprocess_check_output_mock.return_value = '{"name": "my_image", "tag": "aaaaaaa"}'
 
         with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
@@ -930,6 +1058,9 @@ class TestCLI(unittest.TestCase):
                 u'errors': [{u'message': u'repository name not known to registry', u'code': u'NAME_UNKNOWN',
                              u'detail': {u'name': u'my_image'}}]
             }
+            requests_response_mock.status_code = http_client.NOT_FOUND
+            requests_response_mock.headers = {}
+            requests_response_mock.links = {}
             requests_get_mock.return_value = requests_response_mock
 
         self._invoke_cli(
@@ -942,16 +1073,12 @@ class TestCLI(unittest.TestCase):
             'docker',
             'images',
             '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
-            'my_image',
+            '--filter', 'reference=my_image',
         ]
         subprocess_check_output_mock.assert_called_once_with(expected_command)
 
         expected_url = 'https://%(registry)s/v2/my_image/tags/list' % dict(registry=REGISTRY)
-        requests_get_mock.assert_called_once_with(
-            url=expected_url,
-            verify=False,
-            auth=requests_bearer_auth_mock()
-        )
+        requests_get_mock.assert_called_once_with(url=expected_url, params={'n': utils.REGISTRY_PAGE_SIZE}, headers=None)
 
         expected_images_results = [
             ['none', 'my_image', 'aaaaaaa'],
@@ -960,13 +1087,11 @@ class TestCLI(unittest.TestCase):
         tabulate_mock.assert_called_once_with(expected_images_results, headers=['REGISTRY', 'IMAGE', 'TAG'],
                                               tablefmt='grid')
 
-    @mock.patch('skipper.utils.HttpBearerAuth', autospec=True)
     @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.my_image']))
     @mock.patch('tabulate.tabulate', mock.MagicMock(autospec=True))
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.get')
     @mock.patch('subprocess.check_output', autospec=True, return_value='')
-    def test_images_with_with_remote_error(self, subprocess_check_output_mock, requests_get_mock,
-                                           requests_bearer_auth_mock):
+    def test_images_with_with_remote_error(self, subprocess_check_output_mock, requests_get_mock):
         with mock.patch('requests.Response', autospec=True) as requests_response_class_mock:
             requests_response_mock = requests_response_class_mock.return_value
             requests_response_mock.ok = False
@@ -974,6 +1099,9 @@ class TestCLI(unittest.TestCase):
                 u'errors': [{u'message': u'repository name not known to registry', u'code': u'UNKNOWN_ERROR',
                              u'detail': {u'name': u'my_image'}}]
             }
+            requests_response_mock.status_code = http_client.NOT_FOUND
+            requests_response_mock.headers = {}
+            requests_response_mock.links = {}
             requests_get_mock.return_value = requests_response_mock
 
         result = self._invoke_cli(
@@ -986,16 +1114,12 @@ class TestCLI(unittest.TestCase):
             'docker',
             'images',
             '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
-            'my_image',
+            '--filter', 'reference=my_image',
         ]
         subprocess_check_output_mock.assert_called_once_with(expected_command)
 
         expected_url = 'https://%(registry)s/v2/my_image/tags/list' % dict(registry=REGISTRY)
-        requests_get_mock.assert_called_once_with(
-            url=expected_url,
-            verify=False,
-            auth=requests_bearer_auth_mock()
-        )
+        requests_get_mock.assert_called_once_with(url=expected_url, params={'n': utils.REGISTRY_PAGE_SIZE}, headers=None)
 
         self.assertIsInstance(result.exception, click.exceptions.ClickException)
 
@@ -1013,11 +1137,53 @@ class TestCLI(unittest.TestCase):
             'docker',
             'images',
             '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
-            'my_image',
+            '--filter', 'reference=my_image',
         ]
         subprocess_check_output_mock.assert_called_once_with(expected_command)
         tabulate_mock.assert_called_once_with([], headers=['REGISTRY', 'IMAGE', 'TAG'], tablefmt='grid')
 
+    @mock.patch('tabulate.tabulate', autospec=True)
+    @mock.patch('skipper.utils.image_to_dockerfile', mock.MagicMock(autospec=True, return_value='Dockerfile.build-container-image'))
+    @mock.patch('skipper.git.tracked_files', autospec=True, return_value=['Dockerfile.build-container-image'])
+    @mock.patch('skipper.context.context_report', autospec=True)
+    def test_context_report(self, context_report_mock, tracked_files_mock, tabulate_mock):
+        context_report_mock.return_value = [
+            {'path': 'node_modules', 'status': 'untracked', 'files': 1200, 'bytes': 254000000},
+            {'path': 'src', 'status': 'sent', 'files': 30, 'bytes': 120500},
+            {'path': 'README.md', 'status': 'sent', 'files': 1, 'bytes': 900},
+        ]
+        self._invoke_cli(
+            global_params=self.global_params + ['--context-source', 'git'],
+            subcmd='context-report',
+            subcmd_params=['--top', '2']
+        )
+        tracked_files_mock.assert_called_once_with('.')
+        context_report_mock.assert_called_once_with('.', 'Dockerfile.build-container-image', 1, ['Dockerfile.build-container-image'])
+        tabulate_mock.assert_called_once_with([
+            ['node_modules', 'untracked', 1200, '254.0MB'],
+            ['src', 'sent', 30, '120.5kB'],
+        ], headers=['PATH', 'STATUS', 'FILES', 'SIZE'], tablefmt='grid')
+
+    @mock.patch('tabulate.tabulate', autospec=True)
+    @mock.patch('skipper.pushes.wait', autospec=True)
+    def test_pushes_wait(self, wait_mock, tabulate_mock):
+        wait_mock.return_value = [
+            {'image': 'registry.io/image1:cache', 'digest': 'sha256:0123456789abcdef0123', 'pid': 1, 'log': '/run/1.log',
+             'returncode': 0},
+            {'image': 'registry.io/image2:cache', 'digest': None, 'pid': 2, 'log': '/run/2.log', 'returncode': 1},
+        ]
+        result = self._invoke_cli(
+            global_params=self.global_params,
+            subcmd='pushes',
+            subcmd_params=['--wait', '--timeout', '60']
+        )
+        wait_mock.assert_called_once_with(60)
+        tabulate_mock.assert_called_once_with([
+            ['registry.io/image1:cache', 'sha256:0123456789ab', 'succeeded', '/run/1.log'],
+            ['registry.io/image2:cache', '', 'failed', '/run/2.log'],
+        ], headers=['IMAGE', 'DIGEST', 'STATUS', 'LOG'], tablefmt='grid')
+        self.assertEqual(result.return_value, 1)
+
     @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.my_image']))
     @mock.patch('subprocess.check_output', autospec=True)
     def test_rmi_local(self, subprocess_check_output_mock):
@@ -1034,11 +1200,10 @@ class TestCLI(unittest.TestCase):
         ]
         subprocess_check_output_mock.assert_called_once_with(expected_command)
 
-    @mock.patch('skipper.utils.HttpBearerAuth', autospec=True)
     @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.' + IMAGE]))
-    @mock.patch('requests.delete', autospec=True)
-    @mock.patch('requests.get', autospec=True)
-    def test_rmi_remote(self, requests_get_mock, requests_delete_mock, requests_bearer_auth_mock):
+    @mock.patch('requests.Session.delete')
+    @mock.patch('requests.Session.get')
+    def test_rmi_remote(self, requests_get_mock, requests_delete_mock):
         requests_get_mock.side_effect = [mock.Mock(headers={'Docker-Content-Digest': 'digest'})]
         requests_delete_mock.side_effect = [mock.Mock(ok=True)]
         self._invoke_cli(
@@ -1050,18 +1215,15 @@ class TestCLI(unittest.TestCase):
         url = 'https://%(registry)s/v2/%(image)s/manifests/%(reference)s' % dict(registry=REGISTRY, image=IMAGE,
                                                                                  reference=TAG)
         headers = {"Accept": "application/vnd.docker.distribution.manifest.v2+json"}
-        requests_get_mock.assert_called_once_with(url=url, headers=headers, verify=False,
-                                                  auth=requests_bearer_auth_mock())
+        requests_get_mock.assert_called_once_with(url=url, headers=headers)
         url = 'https://%(registry)s/v2/%(image)s/manifests/%(reference)s' % dict(registry=REGISTRY, image=IMAGE,
                                                                                  reference='digest')
-        requests_delete_mock.assert_called_once_with(url=url, verify=False,
-                                                     auth=requests_bearer_auth_mock())
+        requests_delete_mock.assert_called_once_with(url=url)
 
-    @mock.patch('skipper.utils.HttpBearerAuth', autospec=True)
     @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.' + IMAGE]))
-    @mock.patch('requests.delete', autospec=True)
-    @mock.patch('requests.get', autospec=True)
-    def test_rmi_remote_fail(self, requests_get_mock, requests_delete_mock, requests_bearer_auth_mock):
+    @mock.patch('requests.Session.delete')
+    @mock.patch('requests.Session.get')
+    def test_rmi_remote_fail(self, requests_get_mock, requests_delete_mock):
         requests_get_mock.side_effect = [mock.Mock(headers={'Docker-Content-Digest': 'digest'})]
         requests_delete_mock.side_effect = HTTPError()
         result = self._invoke_cli(
@@ -1074,11 +1236,10 @@ class TestCLI(unittest.TestCase):
         url = 'https://%(registry)s/v2/%(image)s/manifests/%(reference)s' % dict(registry=REGISTRY, image=IMAGE,
                                                                                  reference=TAG)
         headers = {"Accept": "application/vnd.docker.distribution.manifest.v2+json"}
-        requests_get_mock.assert_called_once_with(url=url, headers=headers, verify=False,
-                                                  auth=requests_bearer_auth_mock())
+        requests_get_mock.assert_called_once_with(url=url, headers=headers)
         url = 'https://%(registry)s/v2/%(image)s/manifests/%(reference)s' % dict(registry=REGISTRY, image=IMAGE,
                                                                                  reference='digest')
-        requests_delete_mock.assert_called_once_with(url=url, verify=False, auth=requests_bearer_auth_mock())
+        requests_delete_mock.assert_called_once_with(url=url)
 
     @mock.patch('glob.glob', mock.MagicMock(autospec=True, return_value=['Dockerfile.' + IMAGE]))
     def test_validate_project_image(self):
@@ -1107,17 +1268,10 @@ class TestCLI(unittest.TestCase):
                                                         env_file=())
 
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value=''))
-    @mock.patch('requests.get', autospec=True)
+    @mock.patch('requests.Session.head')
     @mock.patch('skipper.runner.run', autospec=True)
-    def test_run_with_existing_remote_build_container(self, skipper_runner_run_mock, requests_get_mock):
-        requests_response_class_mock = mock.MagicMock(spec='requests.Response')
-        requests_response_mock = requests_response_class_mock.return_value
-        requests_response_mock.json.return_value = {
-            'name': 'my_image',
-            'tags': ['latest', 'aaaaaaa', 'bbbbbbb', 'build-container-tag']
-        }
-        requests_response_mock.status_code = http_client.OK
-        requests_get_mock.return_value = requests_response_mock
+    def test_run_with_existing_remote_build_container(self, skipper_runner_run_mock, requests_head_mock):
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.OK, headers={'Docker-Content-Digest': 'digest'})
 
         command = ['ls', '-l']
         run_params = command
@@ -1135,16 +1289,9 @@ class TestCLI(unittest.TestCase):
 
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value=''))
     @mock.patch('skipper.runner.run', mock.MagicMock(autospec=True))
-    @mock.patch('requests.get', autospec=True)
-    def test_run_with_non_existing_build_container(self, requests_get_mock):
-        requests_response_class_mock = mock.MagicMock(spec='requests.Response')
-        requests_response_mock = requests_response_class_mock.return_value
-        requests_response_mock.json.return_value = {
-            'name': 'my_image',
-            'tags': ['latest', 'aaaaaaa', 'bbbbbbb']
-        }
-
-        requests_get_mock.return_value = requests_response_mock
+    @mock.patch('requests.Session.head')
+    def test_run_with_non_existing_build_container(self, requests_head_mock):
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.NOT_FOUND, headers={}, text='')
         command = ['ls', '-l']
         run_params = command
         ret = self._invoke_cli(
@@ -1154,6 +1301,98 @@ class TestCLI(unittest.TestCase):
         )
         self.assertIsInstance(ret.exception, click.exceptions.ClickException)
 
+    @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value='1234567\n'))
+    @mock.patch('skipper.utils.image_to_dockerfile', mock.MagicMock(autospec=True, side_effect=lambda x: 'Dockerfile.'+x))
+    @mock.patch('skipper.context.content_hash', autospec=True, return_value='0123456789abcdef')
+    @mock.patch('skipper.runner.run', autospec=True)
+    def test_run_with_existing_content_hash_build_container(self, skipper_runner_run_mock, content_hash_mock):
+        global_params = self.global_params[:-1] + ['content:hash']
+        command = ['ls', '-l']
+        self._invoke_cli(
+            global_params=global_params,
+            subcmd='run',
+            subcmd_params=command
+        )
+        content_hash_mock.assert_called_once()
+        skipper_runner_run_mock.assert_called_once_with(command, fqdn_image='build-container-image:0123456789abcdef',
+                                                        environment=[], interactive=False, name=None, net=None,
+                                                        publish=(), volumes=None, workdir=None, workspace=None,
+                                                        use_cache=False, env_file=())
+
+    @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value=''))
+    @mock.patch('skipper.utils.image_to_dockerfile', mock.MagicMock(autospec=True, side_effect=lambda x: 'Dockerfile.'+x))
+    @mock.patch('skipper.context.content_hash', mock.MagicMock(autospec=True, return_value='0123456789abcdef'))
+    @mock.patch('skipper.runner.run', autospec=True, return_value=0)
+    @mock.patch('requests.Session.head')
+    def test_run_with_non_existing_content_hash_build_container(self, requests_head_mock, skipper_runner_run_mock):
+        requests_head_mock.return_value = mock.Mock(status_code=http_client.NOT_FOUND, headers={}, text='')
+        global_params = self.global_params[:-1] + ['content:hash']
+        command = ['ls', '-l']
+        self._invoke_cli(
+            global_params=global_params,
+            subcmd='run',
+            subcmd_params=command
+        )
+        expected_commands = [
+            mock.call(['build', '--network=host',
+                       '-f', 'Dockerfile.build-container-image',
+                       '-t', 'build-container-image:0123456789abcdef', '.'],
+                      stdout_to_stderr=True),
+            mock.call(command, fqdn_image='build-container-image:0123456789abcdef', environment=[],
+                      interactive=False, name=None, net=None, publish=(), volumes=None, workdir=None, workspace=None,
+                      use_cache=False, env_file=()),
+        ]
+        skipper_runner_run_mock.assert_has_calls(expected_commands)
+
+    @mock.patch('skipper.utils.image_to_dockerfile', mock.MagicMock(autospec=True, side_effect=lambda x: 'Dockerfile.'+x))
+    @mock.patch('skipper.context.content_hash', mock.MagicMock(autospec=True, return_value='0123456789abcdef'))
+    @mock.patch('skipper.utils.remote_image_exist', mock.MagicMock(autospec=True, return_value=False))
+    @mock.patch('skipper.utils.local_image_exist', autospec=True, side_effect=[False, True])
+    @mock.patch('skipper.locking.file_lock', autospec=True)
+    @mock.patch('skipper.runner.run', autospec=True, return_value=0)
+    def test_run_with_build_container_built_by_another_skipper(self, skipper_runner_run_mock, file_lock_mock, local_image_exist_mock):
+        # The other skipper released the lock before this one requested it, it did not wait
+        file_lock_mock.return_value.__enter__.return_value = False
+        global_params = self.global_params[:-1] + ['content:hash']
+        command = ['ls', '-l']
+        self._invoke_cli(
+            global_params=global_params,
+            subcmd='run',
+            subcmd_params=command
+        )
+        file_lock_mock.assert_called_once_with(mock.ANY, timeout=cli.BUILD_LOCK_TIMEOUT)
+        self.assertEqual(local_image_exist_mock.call_count, 2)
+        skipper_runner_run_mock.assert_called_once_with(command, fqdn_image='build-container-image:0123456789abcdef',
+                                                        environment=[], interactive=False, name=None, net=None,
+                                                        publish=(), volumes=None, workdir=None, workspace=None,
+                                                        use_cache=False, env_file=())
+
+    @mock.patch('skipper.utils.image_to_dockerfile', mock.MagicMock(autospec=True, side_effect=lambda x: 'Dockerfile.'+x))
+    @mock.patch('skipper.context.content_hash', mock.MagicMock(autospec=True, return_value='0123456789abcdef'))
+    @mock.patch('skipper.utils.remote_image_exist', mock.MagicMock(autospec=True, return_value=False))
+    @mock.patch('skipper.utils.local_image_exist', mock.MagicMock(autospec=True, return_value=False))
+    @mock.patch('skipper.locking.file_lock', autospec=True, side_effect=locking.LockTimeout('build.lock', '4242 agent'))
+    @mock.patch('skipper.runner.run', autospec=True, return_value=0)
+    def test_run_with_build_lock_timeout(self, skipper_runner_run_mock, file_lock_mock):
+        os.environ['SKIPPER_BUILD_LOCK_TIMEOUT'] = '60'
+        global_params = self.global_params[:-1] + ['content:hash']
+        command = ['ls', '-l']
+        self._invoke_cli(
+            global_params=global_params,
+            subcmd='run',
+            subcmd_params=command
+        )
+        file_lock_mock.assert_called_once_with(mock.ANY, timeout=60)
+        skipper_runner_run_mock.assert_has_calls([
+            mock.call(['build', '--network=host',
+                       '-f', 'Dockerfile.build-container-image',
+                       '-t', 'build-container-image:0123456789abcdef', '.'],
+                      stdout_to_stderr=True),
+            mock.call(command, fqdn_image='build-container-image:0123456789abcdef', environment=[],
+                      interactive=False, name=None, net=None, publish=(), volumes=None, workdir=None, workspace=None,
+                      use_cache=False, env_file=()),
+        ])
+
     @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
     @mock.patch('skipper.config.load_defaults', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF))
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value='1234567\n'))
@@ -1249,7 +1488,7 @@ class TestCLI(unittest.TestCase):
     @mock.patch('builtins.open', mock.MagicMock(create=True))
     @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
     @mock.patch('os.environ', {})
-    @mock.patch('yaml.safe_load', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF_WITH_ENV_LIST))
+    @mock.patch('yaml.load', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF_WITH_ENV_LIST))
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value='1234567\n'))
     @mock.patch('skipper.runner.run', autospec=True)
     def test_run_with_env_list(self, skipper_runner_run_mock):
@@ -1272,7 +1511,7 @@ class TestCLI(unittest.TestCase):
     @mock.patch('builtins.open', mock.MagicMock(create=True))
     @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
     @mock.patch('os.environ', {'key2': 'value2'})
-    @mock.patch('yaml.safe_load', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF_WITH_ENV_LIST))
+    @mock.patch('yaml.load', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF_WITH_ENV_LIST))
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value='1234567\n'))
     @mock.patch('skipper.runner.run', autospec=True)
     def test_run_with_env_list_get_from_env(self, skipper_runner_run_mock):
@@ -1294,7 +1533,7 @@ class TestCLI(unittest.TestCase):
 
     @mock.patch('builtins.open', mock.MagicMock(create=True))
     @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
-    @mock.patch('yaml.safe_load', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF_WITH_ENV_WRONG_TYPE))
+    @mock.patch('yaml.load', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF_WITH_ENV_WRONG_TYPE))
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value='1234567\n'))
     @mock.patch('skipper.runner.run', autospec=True)
     def test_run_with_env_wrong_type(self, skipper_runner_run_mock):
@@ -1603,6 +1842,23 @@ class TestCLI(unittest.TestCase):
                                                         volumes=['volume1', 'volume2'], workspace=None,
                                                         workdir=None, use_cache=False, env_file=())
 
+    @mock.patch('skipper.utils.local_image_exist', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    def test_make_with_volumes_from_skipper_yaml(self, runner_run_mock):
+        with tempfile.TemporaryDirectory() as project_dir:
+            skipper_conf = os.path.join(project_dir, 'skipper.yaml')
+            with open(skipper_conf, 'w') as confile:
+                confile.write('volumes:\n  - $(echo /volume1):/volume1\n  - /volume2:/volume2:ro\n')
+            with mock.patch.dict(os.environ, {'SKIPPER_CONF': skipper_conf}):
+                defaults = config.load_defaults()
+                result = self._invoke_cli(defaults=defaults, global_params=self.global_params, subcmd='make', subcmd_params=['all'])
+
+        self.assertIsNone(result.exception)
+        docker_cmd = runner_run_mock.call_args[0][0]
+        self.assertIn('/volume1:/volume1', docker_cmd)
+        self.assertIn('/volume2:/volume2:ro', docker_cmd)
+        self.assertEqual(list(defaults['volumes']), ['/volume1:/volume1', '/volume2:/volume2:ro'])
+
     @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
     @mock.patch('skipper.config.load_defaults', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF_WITH_WORKDIR))
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value='1234567\n'))
@@ -1644,6 +1900,7 @@ class TestCLI(unittest.TestCase):
     @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
     @mock.patch('skipper.config.load_defaults', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF_WITH_GIT_REV))
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value=b'1234567\n'))
+    @mock.patch('skipper.git.resolve_head', mock.MagicMock(autospec=True, return_value='1234567'))
     @mock.patch('skipper.git.uncommitted_changes', mock.MagicMock(return_value=True))
     @mock.patch('skipper.runner.run', autospec=True)
     def test_run_with_config_including_git_revision_with_uncommitted_changes(self, skipper_runner_run_mock):
@@ -1664,6 +1921,7 @@ class TestCLI(unittest.TestCase):
     @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
     @mock.patch('skipper.config.load_defaults', mock.MagicMock(autospec=True, return_value=SKIPPER_CONF_WITH_GIT_REV))
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value=b'1234567\n'))
+    @mock.patch('skipper.git.resolve_head', mock.MagicMock(autospec=True, return_value='1234567'))
     @mock.patch('skipper.git.uncommitted_changes', mock.MagicMock(return_value=False))
     @mock.patch('skipper.runner.run', autospec=True)
     def test_run_with_config_including_git_revision_without_uncommitted_changes(self, skipper_runner_run_mock):
@@ -1681,6 +1939,32 @@ class TestCLI(unittest.TestCase):
                                                         workdir=None, workspace=None, use_cache=False,
                                                         env_file=())
 
+    @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value=b'1234567\n'))
+    @mock.patch('skipper.git.resolve_head', mock.MagicMock(autospec=True, return_value='1234567'))
+    @mock.patch('skipper.utils.image_to_dockerfile', mock.MagicMock(autospec=True, return_value='Dockerfile.build'))
+    @mock.patch('skipper.git.uncommitted_changes', return_value=False)
+    @mock.patch('skipper.runner.run', autospec=True)
+    def test_run_with_scoped_git_dirty_check(self, skipper_runner_run_mock, uncommitted_changes_mock):
+        self._invoke_cli(
+            defaults=dict(SKIPPER_CONF_WITH_GIT_REV, container_context='build'),
+            global_params=['--git-dirty-check', 'scoped'],
+            subcmd='run',
+            subcmd_params=['ls']
+        )
+        uncommitted_changes_mock.assert_called_once_with('scoped', ('build', 'Dockerfile.build'))
+        self.assertEqual(skipper_runner_run_mock.call_args[1]['fqdn_image'], 'skipper-conf-build-container-image:1234567')
+
+    @mock.patch('skipper.context.hash_context', autospec=True, return_value='digest')
+    def test_context_hash(self, hash_context_mock):
+        with tempfile.TemporaryDirectory() as context_dir:
+            result = self._invoke_cli(
+                subcmd='context-hash',
+                subcmd_params=[context_dir, '-j', '4', '--no-index']
+            )
+            hash_context_mock.assert_called_once_with(context_dir, None, 4, use_index=False)
+        self.assertEqual(result.output, 'digest\n')
+
     @mock.patch('subprocess.check_output', mock.MagicMock(autospec=True, return_value='1234567\n'))
     @mock.patch('skipper.runner.run', autospec=True)
     def test_make(self, skipper_runner_run_mock):
@@ -1795,15 +2079,15 @@ class TestCLI(unittest.TestCase):
                                                         env_file=())
 
     @mock.patch('click.echo', autospec=True)
-    @mock.patch('skipper.cli.get_distribution', autospec=True)
-    def test_version(self, get_dist_mock, echo_mock):
+    @mock.patch('importlib.metadata.version', autospec=True)
+    def test_version(self, version_mock, echo_mock):
         expected_version = '1.2.3'
-        get_dist_mock.return_value = mock.MagicMock()
-        get_dist_mock.return_value.version = expected_version
+        version_mock.return_value = expected_version
 
         self._invoke_cli(
             subcmd='version',
         )
+        version_mock.assert_called_once_with('strato-skipper')
         echo_mock.assert_called_once_with(expected_version)
 
     def _invoke_cli(self, defaults=None, global_params=None, subcmd=None, subcmd_params=None):
@@ -1,8 +1,14 @@
 import json
 import os
+import tempfile
+import threading
+import time
+from collections.abc import Mapping, Sequence
 from shutil import which
 from unittest import TestCase, mock
 
+import yaml
+
 from skipper import config
 from tests.consts import (
     REGISTRY,
@@ -76,6 +82,13 @@ SKIPPER_CONF_WITH_INVALID_SHELL_INTERPOLATION = json.dumps(
 
 
 class TestConfig(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        environ_patcher = mock.patch.dict(os.environ, {"SKIPPER_CACHE_DIR": cache_dir.name})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+
     @mock.patch(
         "builtins.open",
         mock.MagicMock(side_effect=mock.mock_open(read_data=SKIPPER_CONF_WITH_ENV)),
@@ -116,5 +129,124 @@ class TestConfig(TestCase):
     )
     @mock.patch("os.path.exists", mock.MagicMock(autospec=True, return_value=True))
     def test_config_with_wrong_interpolation(self):
+        defaults = config.load_defaults()
         with self.assertRaises(ValueError):
-            config.load_defaults()
+            defaults.get("volumes")[0]  # pylint: disable=expression-not-assigned
+
+
+def _evaluate(value):
+    if isinstance(value, Mapping):
+        return {key: _evaluate(item) for key, item in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, str):
+        return [_evaluate(item) for item in value]
+    return value
+
+
+class TestLazyConfig(TestCase):
+    def setUp(self):
+        self.run_command_patcher = mock.patch("skipper.config._run_command", side_effect=lambda match: match[2:-1].upper())
+        self.run_command_mock = self.run_command_patcher.start()
+        self.addCleanup(self.run_command_patcher.stop)
+        self.defaults = config.LazyConfig(
+            {
+                "registry": "$(registry)",
+                "volumes": ["$(volume1):/a", "$(volume2):/b", "/c:/c"],
+                "env": {"KEY1": "$(value1)", "KEY2": "$(value2)", "KEY3": "$HOME_DIR"},
+                "containers": {"image": "$(not-interpolated)"},
+                "make": {"makefile": "Makefile"},
+            },
+            config.Interpolator(),
+            raw_keys=("containers",),
+        )
+
+    def test_values_are_interpolated_on_access(self):
+        self.assertEqual(self.defaults.get("make").get("makefile"), "Makefile")
+        self.run_command_mock.assert_not_called()
+        self.assertEqual(self.defaults["registry"], "REGISTRY")
+        self.run_command_mock.assert_called_once_with("$(registry)")
+
+    def test_raw_keys(self):
+        self.assertEqual(self.defaults["containers"], {"image": "$(not-interpolated)"})
+        self.run_command_mock.assert_not_called()
+
+    @mock.patch.dict(os.environ, {"HOME_DIR": "/home/user"})
+    def test_mapping_and_list(self):
+        self.assertEqual(self.defaults["volumes"], ["VOLUME1:/a", "VOLUME2:/b", "/c:/c"])
+        self.assertEqual(dict(self.defaults["env"].items()), {"KEY1": "VALUE1", "KEY2": "VALUE2", "KEY3": "/home/user"})
+        self.assertEqual(len(self.defaults["volumes"]), 3)
+
+    def test_commands_are_memoized(self):
+        interpolator = config.Interpolator()
+        self.assertEqual(interpolator.interpolate("$(value1)/x"), "VALUE1/x")
+        self.assertEqual(interpolator.interpolate("$(value1)/y"), "VALUE1/y")
+        self.run_command_mock.assert_called_once_with("$(value1)")
+
+    def test_commands_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def run_command(match):
+            barrier.wait()
+            return match[2:-1]
+
+        self.run_command_mock.side_effect = run_command
+        self.assertEqual(self.defaults["volumes"][0], "volume1:/a")
+
+
+class TestConfigCache(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.skipper_conf = os.path.join(tmp_dir.name, "skipper.yaml")
+        environ_patcher = mock.patch.dict(
+            os.environ,
+            {"SKIPPER_CACHE_DIR": os.path.join(tmp_dir.name, "cache"), "SKIPPER_CONF": self.skipper_conf, "MY_NUMBER": "5"},
+        )
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+        self._write_config(SKIPPER_CONF_WITH_SHELL_INTERPOLATION)
+
+    def _write_config(self, content, mtime=1000000000):
+        with open(self.skipper_conf, "w") as confile:
+            confile.write(content)
+        os.utime(self.skipper_conf, (mtime, mtime))
+
+    def _load_defaults(self):
+        with mock.patch("yaml.load", side_effect=yaml.load) as yaml_load_mock:
+            defaults = _evaluate(config.load_defaults())
+        return defaults, yaml_load_mock.call_count
+
+    def test_warm_load_skips_parsing(self):
+        defaults, parses = self._load_defaults()
+        self.assertEqual(defaults.get("env"), ["KEY=10"])
+        self.assertEqual(parses, 1)
+        self.assertEqual(self._load_defaults(), (defaults, 0))
+
+    def test_modified_config_is_loaded_again(self):
+        self._load_defaults()
+        self._write_config(SKIPPER_CONF_WITH_ENV, mtime=1000000001)
+        defaults, parses = self._load_defaults()
+        self.assertEqual(defaults.get("env")["KEY3"], "VAL3")
+        self.assertEqual(parses, 1)
+
+    def test_commands_run_on_every_load(self):
+        self._load_defaults()
+        with mock.patch.dict(os.environ, {"MY_NUMBER": "6"}):
+            defaults, parses = self._load_defaults()
+        self.assertEqual((defaults.get("env"), parses), (["KEY=11"], 0))
+
+        stamp_path = os.path.join(os.path.dirname(self.skipper_conf), "stamp")
+        self._write_config(json.dumps({"env": {"STAMP": f"$(cat {stamp_path})"}}))
+        for stamp in ("first", "second"):
+            with open(stamp_path, "w") as stamp_file:
+                stamp_file.write(stamp)
+            self.assertEqual(self._load_defaults()[0], {"env": {"STAMP": stamp}})
+
+    def test_recently_modified_config_is_not_cached(self):
+        self._write_config(SKIPPER_CONF_WITH_ENV, mtime=time.time())
+        self._load_defaults()
+        self.assertEqual(self._load_defaults()[1], 1)
+
+    def test_disabled_cache(self):
+        self._load_defaults()
+        with mock.patch.dict(os.environ, {"SKIPPER_CONFIG_CACHE": "false"}):
+            self.assertEqual(self._load_defaults()[1], 1)
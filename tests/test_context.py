@@ -0,0 +1,195 @@
+import io
+import os
+import subprocess
+import tarfile
+import tempfile
+import time
+import unittest
+
+import mock
+
+from skipper import context
+from skipper.builder import BuildOptions, Image
+
+
+class TestDockerIgnore(unittest.TestCase):
+    def test_patterns(self):
+        ignore = context.DockerIgnore(['# comment', '', '*.pyc', '/build', 'docs/**/*.md', '**/node_modules', 'te?t'])
+        self.assertTrue(ignore.ignored('module.pyc'))
+        self.assertFalse(ignore.ignored('package/module.pyc'))
+        self.assertTrue(ignore.ignored('build'))
+        self.assertTrue(ignore.ignored('build/output/binary'))
+        self.assertTrue(ignore.ignored('docs/README.md'))
+        self.assertTrue(ignore.ignored('docs/api/index.md'))
+        self.assertFalse(ignore.ignored('README.md'))
+        self.assertTrue(ignore.ignored('web/app/node_modules/lib.js'))
+        self.assertTrue(ignore.ignored('test'))
+        self.assertFalse(ignore.ignored('tests'))
+
+    def test_exclusions(self):
+        ignore = context.DockerIgnore(['*.md', '!README.md', 'vendor', '!vendor/keep'])
+        self.assertTrue(ignore.ignored('CHANGELOG.md'))
+        self.assertFalse(ignore.ignored('README.md'))
+        self.assertTrue(ignore.ignored('vendor/lib'))
+        self.assertFalse(ignore.ignored('vendor/keep/lib'))
+        self.assertTrue(ignore.has_exclusions)
+
+
+class TestContentHash(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.context_dir = tmp_dir.name
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        environ_patcher = mock.patch.dict(os.environ, {'SKIPPER_CACHE_DIR': cache_dir.name})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+        self._write('Dockerfile.build', 'FROM centos:7\nCOPY . /src\n')
+        self._write('src/main.py', 'print("hello")\n')
+        self._write('build/output.bin', 'binary')
+        self._write('.dockerignore', 'build\n')
+
+    def _write(self, path, content):
+        path = os.path.join(self.context_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as context_file:
+            context_file.write(content)
+
+    def _content_hash(self, build_args=None):
+        image = Image('build', 'content:hash', dockerfile=os.path.join(self.context_dir, 'Dockerfile.build'))
+        return context.content_hash(BuildOptions(image, self.context_dir, build_args=build_args))
+
+    def test_context_files(self):
+        ignore = context.DockerIgnore.load(self.context_dir)
+        self.assertEqual(context.context_files(self.context_dir, ignore), ['.dockerignore', 'Dockerfile.build', 'src/main.py'])
+
+    def test_hash_is_stable(self):
+        self.assertEqual(self._content_hash(), self._content_hash())
+        self.assertEqual(len(self._content_hash()), context.TAG_LENGTH)
+
+    def test_ignored_files_do_not_change_hash(self):
+        content_hash = self._content_hash()
+        self._write('build/output.bin', 'another binary')
+        self.assertEqual(self._content_hash(), content_hash)
+
+    def test_inputs_change_hash(self):
+        content_hash = self._content_hash()
+        self.assertNotEqual(self._content_hash(build_args=['VERSION=1']), content_hash)
+        self._write('src/main.py', 'print("bye")\n')
+        self.assertNotEqual(self._content_hash(), content_hash)
+
+    def test_executable_bit_changes_hash(self):
+        content_hash = self._content_hash()
+        os.chmod(os.path.join(self.context_dir, 'src/main.py'), 0o755)
+        self.assertNotEqual(self._content_hash(), content_hash)
+
+    def test_dockerfile_specific_ignore_file(self):
+        self._write('Dockerfile.build.dockerignore', 'src\n')
+        content_hash = self._content_hash()
+        self._write('src/main.py', 'print("bye")\n')
+        self.assertEqual(self._content_hash(), content_hash)
+
+
+class TestStatIndex(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.context_dir = os.path.join(tmp_dir.name, 'context')
+        for index in range(4):
+            self._write(f'src/file{index}.py', f'print({index})\n', mtime=1000000000)
+        environ_patcher = mock.patch.dict(os.environ, {'SKIPPER_CACHE_DIR': os.path.join(tmp_dir.name, 'cache')})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+
+    def _write(self, path, content, mtime=None):
+        path = os.path.join(self.context_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as context_file:
+            context_file.write(content)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def _hash_context(self, **kwargs):
+        file_digest = context._file_digest  # pylint: disable=protected-access
+        with mock.patch('skipper.context._file_digest', side_effect=file_digest) as file_digest_mock:
+            digest = context.hash_context(self.context_dir, **kwargs)
+        return digest, file_digest_mock.call_count
+
+    def test_unchanged_files_are_not_read_again(self):
+        digest, read_files = self._hash_context()
+        self.assertEqual(read_files, 4)
+        self.assertEqual(self._hash_context(), (digest, 0))
+
+    def test_changed_files_are_read_again(self):
+        digest, _ = self._hash_context()
+        self._write('src/file1.py', 'print(10)\n', mtime=1000000001)
+        changed_digest, read_files = self._hash_context()
+        self.assertEqual(read_files, 1)
+        self.assertNotEqual(changed_digest, digest)
+
+    def test_recently_modified_files_are_read_again(self):
+        self._hash_context()
+        self._write('src/file1.py', 'print(1)\n', mtime=time.time())
+        self.assertEqual(self._hash_context()[1], 1)
+        self.assertEqual(self._hash_context()[1], 1)
+
+    def test_removed_files_are_dropped(self):
+        self._hash_context()
+        os.remove(os.path.join(self.context_dir, 'src/file0.py'))
+        self._hash_context()
+        self.assertNotIn('src/file0.py', context.StatIndex.for_context(self.context_dir).entries)
+
+    def test_index_matches_full_hash(self):
+        indexed_digest, _ = self._hash_context()
+        self.assertEqual(self._hash_context(use_index=False, jobs=1), (indexed_digest, 4))
+        self.assertEqual(self._hash_context(use_index=False, jobs=4)[0], indexed_digest)
+
+
+class TestGitContext(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.context_dir = tmp_dir.name
+        self._write('Dockerfile.build', 'FROM centos:7\nCOPY . /src\n')
+        self._write('src/main.py', 'print("hello")\n')
+        self._write('docs/index.md', '# Docs\n')
+        self._write('.dockerignore', 'docs\n')
+        subprocess.check_call(['git', 'init', '-q', self.context_dir])
+        subprocess.check_call(['git', '-C', self.context_dir, 'add', '.'])
+        self._write('build/output.bin', 'binary')
+
+    def _write(self, path, content):
+        path = os.path.join(self.context_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as context_file:
+            context_file.write(content)
+
+    def test_git_context_files(self):
+        self.assertEqual(context.git_context_files(self.context_dir), ['.dockerignore', 'Dockerfile.build', 'src/main.py'])
+
+    def test_write_context_archive(self):
+        stream = io.BytesIO()
+        context.write_context_archive(stream, self.context_dir, ['src/main.py'], os.path.join(self.context_dir, 'Dockerfile.build'))
+        stream.seek(0)
+        with tarfile.open(fileobj=stream) as archive:
+            self.assertEqual(archive.getnames(), ['src/main.py', context.ARCHIVED_DOCKERFILE])
+            self.assertEqual(archive.getmember('src/main.py').uid, 0)
+            self.assertEqual(archive.extractfile('src/main.py').read(), b'print("hello")\n')
+
+    def test_context_report(self):
+        rows = context.context_report(self.context_dir, tracked=context.git_context_files(self.context_dir) + ['docs/index.md'])
+        statuses = {row['path']: (row['status'], row['files']) for row in rows if row['path'] != '.git'}
+        self.assertEqual(statuses, {
+            '.dockerignore': (context.SENT, 1),
+            'Dockerfile.build': (context.SENT, 1),
+            'src': (context.SENT, 1),
+            'docs': (context.IGNORED, 1),
+            'build': (context.UNTRACKED, 1),
+        })
+        self.assertEqual([row['bytes'] for row in rows], sorted((row['bytes'] for row in rows), reverse=True))
+
+    def test_context_report_of_a_directory(self):
+        rows = context.context_report(self.context_dir, depth=2)
+        self.assertIn({'path': 'build/output.bin', 'status': context.SENT, 'files': 1, 'bytes': 6}, rows)
+        self.assertIn({'path': 'docs/index.md', 'status': context.IGNORED, 'files': 1, 'bytes': 7}, rows)
@@ -0,0 +1,136 @@
+import http.server
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from skipper import engine, utils
+
+
+class FakeEngineHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        return 'fake-engine'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.server.requests.append((self.command, self.path, body))
+        status, response = self.server.routes.get((self.command, self.path), (404, {'message': 'not found'}))
+        data = response.encode() if isinstance(response, str) else json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain' if isinstance(response, str) else 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_DELETE = _handle
+
+
+class FakeEngineServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, routes):
+        super().__init__(path, FakeEngineHandler)
+        self.routes = routes
+        self.requests = []
+        self.connections = 0
+
+    def get_request(self):
+        self.connections += 1
+        request, _ = super().get_request()
+        return request, ('fake-engine', 0)
+
+
+class TestEngineClient(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.socket_path = os.path.join(tmp_dir.name, 'docker.sock')
+        self.routes = {('GET', '/_ping'): (200, 'OK')}
+        self.server = FakeEngineServer(self.socket_path, self.routes)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = engine.EngineClient(self.socket_path)
+        self.addCleanup(self.client.close)
+
+    def test_image_exists(self):
+        self.routes[('GET', '/images/registry.io:5000/image:1234567/json')] = (200, {'Id': 'sha256:abc'})
+        self.assertTrue(self.client.image_exists('registry.io:5000/image:1234567'))
+        self.assertFalse(self.client.image_exists('image:missing'))
+
+    def test_image_id(self):
+        self.routes[('GET', '/images/image:1234567/json')] = (200, {'Id': 'sha256:abc'})
+        self.assertEqual(self.client.image_id('image:1234567'), 'sha256:abc')
+        self.assertIsNone(self.client.image_id('image:missing'))
+
+    def test_requests_share_one_connection(self):
+        for _ in range(3):
+            self.assertTrue(self.client.ping())
+        self.assertEqual(self.server.connections, 1)
+
+    def test_tag_image(self):
+        self.routes[('POST', '/images/image:1234567/tag?repo=registry.io%3A5000%2Fimage&tag=1234567')] = (201, '')
+        self.client.tag_image('image:1234567', 'registry.io:5000/image:1234567')
+
+    def test_remove_image_failure(self):
+        self.routes[('DELETE', '/images/image:1234567')] = (409, {'message': 'image is being used'})
+        with self.assertRaises(engine.EngineError) as context:
+            self.client.remove_image('image:1234567')
+        self.assertEqual(context.exception.status, 409)
+
+    def test_networks(self):
+        self.routes[('POST', '/networks/create')] = (201, {'Id': 'abc'})
+        self.routes[('GET', '/networks/net')] = (200, {'Name': 'net'})
+        self.routes[('DELETE', '/networks/net')] = (204, '')
+
+        self.client.create_network('net')
+        self.assertTrue(self.client.network_exists('net'))
+        self.assertFalse(self.client.network_exists('other-net'))
+        self.client.remove_network('net')
+        self.assertIn(('POST', '/networks/create', {'Name': 'net', 'CheckDuplicate': True}), self.server.requests)
+
+    def test_container_running(self):
+        self.routes[('GET', '/containers/running/json')] = (200, {'State': {'Running': True}})
+        self.routes[('GET', '/containers/exited/json')] = (200, {'State': {'Running': False}})
+        self.assertTrue(self.client.container_running('running'))
+        self.assertFalse(self.client.container_running('exited'))
+        self.assertFalse(self.client.container_running('missing'))
+
+    def test_connect(self):
+        with mock.patch.dict(os.environ, {'DOCKER_HOST': 'unix://' + self.socket_path}):
+            client = engine.connect('docker')
+        self.assertEqual(client.path, self.socket_path)
+        client.close()
+
+    def test_connect_unreachable(self):
+        with mock.patch.dict(os.environ, {'DOCKER_HOST': 'unix:///no/such/docker.sock'}):
+            self.assertIsNone(engine.connect('docker'))
+        with mock.patch.dict(os.environ, {'DOCKER_HOST': 'tcp://127.0.0.1:2375'}):
+            self.assertIsNone(engine.connect('docker'))
+
+    def test_local_image_exist_uses_engine(self):
+        self.routes[('GET', '/images/image:1234567/json')] = (200, {'Id': 'sha256:abc'})
+        utils.ENGINE_CLIENT = self.client
+        self.addCleanup(setattr, utils, 'ENGINE_CLIENT', None)
+        with mock.patch('subprocess.check_output') as check_output_mock:
+            self.assertTrue(utils.local_image_exist('image', '1234567'))
+        check_output_mock.assert_not_called()
+
+
+class TestSplitImageTag(unittest.TestCase):
+    def test_split_image_tag(self):
+        self.assertEqual(engine.split_image_tag('image:tag'), ('image', 'tag'))
+        self.assertEqual(engine.split_image_tag('registry.io:5000/image:tag'), ('registry.io:5000/image', 'tag'))
+        self.assertEqual(engine.split_image_tag('registry.io:5000/image'), ('registry.io:5000/image', 'latest'))
+        self.assertEqual(engine.split_image_tag('image'), ('image', 'latest'))
@@ -1,4 +1,7 @@
+import os
 import subprocess
+import tempfile
+import threading
 import unittest
 import mock
 from skipper import git
@@ -6,30 +9,49 @@ from skipper import git
 
 GIT_HASH_FULL = b'00efe974e3cf18c3493f110f5aeda04ff78b125f'
 GIT_HASH_SHORT = b'00efe97'
+OTHER_HASH = 'c0ffee974e3cf18c3493f110f5aeda04ff78b125'
 
 
 class TestGit(unittest.TestCase):
+    def setUp(self):
+        git._get_hash.cache_clear()  # pylint: disable=protected-access
+        self.addCleanup(git._get_hash.cache_clear)  # pylint: disable=protected-access
+        for name, value in (('DIRTY_CHECK', 'full'), ('DIRTY_CHECK_PATHS', ()), ('DIRTY_CHECK_IN_BACKGROUND', False)):
+            patcher = mock.patch.object(git, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
     @mock.patch('subprocess.check_output', return_value=GIT_HASH_FULL)
+    @mock.patch('skipper.git.resolve_head', return_value=None)
+    @mock.patch('skipper.git.uncommitted_changes', return_value=False)
     @mock.patch('skipper.git.is_git_repository', return_value=True)
-    def test_get_hash_with_default_argument(self, is_git_repository_mock, check_output_mock):
+    def test_get_hash_with_default_argument(self, is_git_repository_mock, uncommitted_changes_mock, resolve_head_mock, check_output_mock):
         git_hash = git.get_hash()
         is_git_repository_mock.assert_called_once()
+        uncommitted_changes_mock.assert_called_once()
+        resolve_head_mock.assert_called_once()
         check_output_mock.assert_called_once_with(['git', 'rev-parse', 'HEAD'])
         self.assertEqual(git_hash, GIT_HASH_FULL.decode('utf-8'))
 
-    @mock.patch('subprocess.check_output', return_value=GIT_HASH_FULL)
+    @mock.patch('subprocess.check_output')
+    @mock.patch('skipper.git.resolve_head', return_value=GIT_HASH_FULL.decode('utf-8'))
+    @mock.patch('skipper.git.uncommitted_changes', return_value=False)
     @mock.patch('skipper.git.is_git_repository', return_value=True)
-    def test_get_full_hash(self, is_git_repository_mock, check_output_mock):
+    def test_get_full_hash(self, is_git_repository_mock, uncommitted_changes_mock, resolve_head_mock, check_output_mock):
         git_hash = git.get_hash(short=False)
         is_git_repository_mock.assert_called_once()
-        check_output_mock.assert_called_once_with(['git', 'rev-parse', 'HEAD'])
+        uncommitted_changes_mock.assert_called_once()
+        resolve_head_mock.assert_called_once()
+        check_output_mock.assert_not_called()
         self.assertEqual(git_hash, GIT_HASH_FULL.decode('utf-8'))
 
     @mock.patch('subprocess.check_output', return_value=GIT_HASH_SHORT)
+    @mock.patch('skipper.git.uncommitted_changes', return_value=False)
     @mock.patch('skipper.git.is_git_repository', return_value=True)
-    def test_get_short_hash(self, is_git_repository_mock, check_output_mock):
+    def test_get_short_hash(self, is_git_repository_mock, uncommitted_changes_mock, check_output_mock):
         git_hash = git.get_hash(short=True)
         is_git_repository_mock.assert_called_once()
+        uncommitted_changes_mock.assert_called_once()
         check_output_mock.assert_called_once_with(['git', 'rev-parse', '--short', 'HEAD'])
         self.assertEqual(git_hash, GIT_HASH_SHORT.decode('utf-8'))
 
@@ -38,21 +60,154 @@ class TestGit(unittest.TestCase):
         self.assertEqual(git.get_hash(), 'none')
         is_git_repository_mock.assert_called_once()
 
-    @mock.patch('os.path.exists', return_value=True)
-    def test_should_be_in_git_project_os_path(self, exists_mock):
-        self.assertTrue(git.is_git_repository())
-        exists_mock.assert_called_once_with('.git')
-
-    @mock.patch('subprocess.call', return_value=0)
-    @mock.patch('os.path.exists', return_value=False)
-    def test_should_be_in_git_project_git(self, exists_mock, call_mock):
-        self.assertTrue(git.is_git_repository())
-        exists_mock.assert_called_once_with('.git')
-        call_mock.assert_called_once_with(['git', 'rev-parse', '--is-inside-work-tree'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    @mock.patch('subprocess.check_output', return_value=GIT_HASH_FULL)
+    @mock.patch('skipper.git.resolve_head', return_value=None)
+    @mock.patch('skipper.git.uncommitted_changes', return_value=True)
+    @mock.patch('skipper.git.is_git_repository', return_value=True)
+    def test_get_hash_is_memoized(self, is_git_repository_mock, uncommitted_changes_mock, resolve_head_mock, check_output_mock):
+        self.assertEqual(git.get_hash(), git.get_hash())
+        is_git_repository_mock.assert_called_once()
+        uncommitted_changes_mock.assert_called_once()
+        resolve_head_mock.assert_called_once()
+        check_output_mock.assert_called_once()
 
     @mock.patch('subprocess.call', return_value=1)
-    @mock.patch('os.path.exists', return_value=False)
-    def test_should_not_be_in_git_project(self, exists_mock, call_mock):
+    def test_uncommitted_changes_strategies(self, call_mock):
+        self.assertTrue(git.uncommitted_changes())
+        call_mock.assert_called_with(['git', 'diff', '--quiet', 'HEAD'])
+        git.uncommitted_changes('scoped', ('.', 'Dockerfile.build'))
+        call_mock.assert_called_with(['git', 'diff', '--quiet', 'HEAD', '--', '.', 'Dockerfile.build'])
+        call_mock.reset_mock()
+        self.assertFalse(git.uncommitted_changes('off'))
+        call_mock.assert_not_called()
+
+    @mock.patch('subprocess.check_output', return_value=b'Dockerfile\0src/main.py\0')
+    def test_tracked_files(self, check_output_mock):
+        self.assertEqual(git.tracked_files('context'), ['Dockerfile', 'src/main.py'])
+        check_output_mock.assert_called_once_with(['git', '-C', 'context', 'ls-files', '-z', '--recurse-submodules'],
+                                                  stderr=mock.ANY)
+
+    @mock.patch('skipper.git.resolve_head', return_value=GIT_HASH_FULL.decode('utf-8'))
+    @mock.patch('skipper.git.is_git_repository', return_value=True)
+    def test_dirty_check_off(self, is_git_repository_mock, resolve_head_mock):
+        git.DIRTY_CHECK = 'off'
+        with mock.patch('skipper.git.uncommitted_changes') as uncommitted_changes_mock:
+            self.assertEqual(git.get_hash(), GIT_HASH_FULL.decode('utf-8'))
+        uncommitted_changes_mock.assert_not_called()
+        is_git_repository_mock.assert_called_once()
+        resolve_head_mock.assert_called_once()
+
+    @mock.patch('skipper.git.resolve_head', return_value=GIT_HASH_FULL.decode('utf-8'))
+    @mock.patch('skipper.git.is_git_repository', return_value=True)
+    def test_dirty_check_in_background(self, is_git_repository_mock, resolve_head_mock):
+        git.DIRTY_CHECK, git.DIRTY_CHECK_PATHS, git.DIRTY_CHECK_IN_BACKGROUND = 'scoped', ('.',), True
+        checking, checked = threading.Event(), threading.Event()
+
+        def uncommitted_changes(strategy, paths):
+            checking.wait(5)
+            checked.set()
+            return strategy == 'scoped' and paths == ('.',)
+
+        with mock.patch('skipper.git.uncommitted_changes', side_effect=uncommitted_changes), \
+                mock.patch('logging.warning') as warning_mock:
+            # HEAD is resolved before the check completes
+            self.assertEqual(git.get_hash(), GIT_HASH_FULL.decode('utf-8'))
+            self.assertFalse(checked.is_set())
+            checking.set()
+            self.assertTrue(checked.wait(5))
+            for thread in threading.enumerate():
+                if thread.name == 'git-dirty-check':
+                    thread.join(5)
+            warning_mock.assert_called_once()
+        is_git_repository_mock.assert_called_once()
+        resolve_head_mock.assert_called_once()
+
+
+class TestResolveHead(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.work_tree = os.path.realpath(tmp_dir.name)
+        self.git_dir = os.path.join(self.work_tree, '.git')
+        environ_patcher = mock.patch.dict(os.environ)
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+        os.environ.pop('GIT_DIR', None)
+
+    def _write(self, path, content):
+        path = os.path.join(self.work_tree, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as git_file:
+            git_file.write(content)
+
+    def test_loose_ref(self):
+        self._write('.git/HEAD', 'ref: refs/heads/main\n')
+        self._write('.git/refs/heads/main', GIT_HASH_FULL.decode('utf-8') + '\n')
+        self.assertEqual(git.resolve_head(self.git_dir), GIT_HASH_FULL.decode('utf-8'))
+
+    def test_packed_ref(self):
+        self._write('.git/HEAD', 'ref: refs/heads/main\n')
+        self._write('.git/packed-refs', '\n'.join([
+            '# pack-refs with: peeled fully-peeled sorted',
+            OTHER_HASH + ' refs/heads/feature',
+            GIT_HASH_FULL.decode('utf-8') + ' refs/heads/main',
+            '^' + OTHER_HASH,
+        ]) + '\n')
+        self.assertEqual(git.resolve_head(self.git_dir), GIT_HASH_FULL.decode('utf-8'))
+
+    def test_loose_ref_takes_precedence_over_packed_ref(self):
+        self._write('.git/HEAD', 'ref: refs/heads/main\n')
+        self._write('.git/packed-refs', GIT_HASH_FULL.decode('utf-8') + ' refs/heads/main\n')
+        self._write('.git/refs/heads/main', OTHER_HASH + '\n')
+        self.assertEqual(git.resolve_head(self.git_dir), OTHER_HASH)
+
+    def test_detached_head(self):
+        self._write('.git/HEAD', OTHER_HASH + '\n')
+        self.assertEqual(git.resolve_head(self.git_dir), OTHER_HASH)
+
+    def test_unborn_branch(self):
+        self._write('.git/HEAD', 'ref: refs/heads/main\n')
+        self.assertIsNone(git.resolve_head(self.git_dir))
+
+    def test_linked_work_tree(self):
+        self._write('main/.git/refs/heads/feature', OTHER_HASH + '\n')
+        self._write('main/.git/worktrees/feature/HEAD', 'ref: refs/heads/feature\n')
+        self._write('main/.git/worktrees/feature/commondir', '../..\n')
+        self._write('feature/.git', 'gitdir: ../main/.git/worktrees/feature\n')
+        os.makedirs(os.path.join(self.work_tree, 'feature/src'))
+        git_dir = git.find_git_dir(os.path.join(self.work_tree, 'feature/src'))
+        self.assertEqual(git_dir, os.path.join(self.work_tree, 'main/.git/worktrees/feature'))
+        self.assertEqual(git.resolve_head(git_dir), OTHER_HASH)
+
+    def test_current_branch(self):
+        self._write('.git/HEAD', 'ref: refs/heads/feature/login\n')
+        self.assertEqual(git.current_branch(self.git_dir), 'feature/login')
+        self._write('.git/HEAD', OTHER_HASH + '\n')
+        self.assertIsNone(git.current_branch(self.git_dir))
+
+    def test_default_branch(self):
+        self.assertIsNone(git.default_branch(self.git_dir))
+        self._write('.git/refs/remotes/origin/HEAD', 'ref: refs/remotes/origin/main\n')
+        self.assertEqual(git.default_branch(self.git_dir), 'main')
+
+    def test_find_git_dir(self):
+        self._write('.git/HEAD', 'ref: refs/heads/main\n')
+        os.makedirs(os.path.join(self.work_tree, 'src/package'))
+        self.assertEqual(git.find_git_dir(os.path.join(self.work_tree, 'src/package')), self.git_dir)
+
+    def test_find_git_dir_from_environment(self):
+        os.environ['GIT_DIR'] = self.work_tree
+        self.assertEqual(git.find_git_dir('/'), self.work_tree)
+
+    @mock.patch('subprocess.check_output', return_value=b'.git\n')
+    def test_find_git_dir_of_unknown_git_file(self, check_output_mock):
+        self._write('.git', 'gitdir: ../missing\n')
+        self.assertEqual(git.find_git_dir(self.work_tree), self.git_dir)
+        check_output_mock.assert_called_once_with(['git', '-C', self.work_tree, 'rev-parse', '--git-dir'], stderr=mock.ANY)
+
+    @mock.patch('subprocess.check_output', side_effect=subprocess.CalledProcessError(128, 'git'))
+    @mock.patch('os.path.abspath', return_value='/')
+    def test_not_in_git_project(self, abspath_mock, check_output_mock):
         self.assertFalse(git.is_git_repository())
-        exists_mock.assert_called_once_with('.git')
-        call_mock.assert_called_once_with(['git', 'rev-parse', '--is-inside-work-tree'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        abspath_mock.assert_called_once_with('.')
+        check_output_mock.assert_called_once_with(['git', '-C', '/', 'rev-parse', '--git-dir'], stderr=mock.ANY)
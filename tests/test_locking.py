@@ -0,0 +1,100 @@
+import itertools
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from skipper import locking
+
+
+class TestLocking(unittest.TestCase):
+    def test_runtime_dir(self):
+        with mock.patch.dict(os.environ, {'SKIPPER_RUNTIME_DIR': '/skipper', 'XDG_RUNTIME_DIR': '/run/user/1000'}):
+            self.assertEqual(locking.runtime_dir('networks.json'), '/skipper/networks.json')
+            del os.environ['SKIPPER_RUNTIME_DIR']
+            self.assertEqual(locking.runtime_dir('networks.json'), '/run/user/1000/skipper/networks.json')
+
+    def test_file_lock_is_exclusive(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'locks', 'build.lock')
+            acquired = threading.Event()
+
+            def lock():
+                with locking.file_lock(path):
+                    acquired.set()
+
+            with locking.file_lock(path):
+                thread = threading.Thread(target=lock)
+                thread.start()
+                self.assertFalse(acquired.wait(0.2))
+            thread.join(5)
+            self.assertTrue(acquired.is_set())
+
+    def test_file_lock_records_its_holder(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'build.lock')
+            with locking.file_lock(path) as waited:
+                self.assertFalse(waited)
+                with open(path) as lock_file:
+                    self.assertEqual(lock_file.read(), f'{os.getpid()} {socket.gethostname()}\n')
+            with open(path) as lock_file:
+                self.assertEqual(lock_file.read(), '')
+
+    def test_file_lock_timeout(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'build.lock')
+            with locking.file_lock(path):
+                with self.assertRaises(locking.LockTimeout) as context:
+                    with locking.file_lock(path, timeout=0.2):
+                        self.fail('Acquired a lock held by another holder')
+            self.assertFalse(context.exception.stale)
+            self.assertEqual(context.exception.holder, f'{os.getpid()} {socket.gethostname()}')
+
+    def test_file_lock_waits_for_its_holder(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'build.lock')
+            results = []
+
+            def lock():
+                with locking.file_lock(path, timeout=5) as waited:
+                    results.append(waited)
+
+            with locking.file_lock(path):
+                thread = threading.Thread(target=lock)
+                thread.start()
+                thread.join(0.2)
+            thread.join(5)
+            self.assertEqual(results, [True])
+
+    def test_file_lock_held_by_a_process_that_is_gone(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'build.lock')
+            with locking.file_lock(path):
+                with open(path, 'w') as lock_file:
+                    lock_file.write(f'999999 {socket.gethostname()}\n')
+                with self.assertRaises(locking.LockTimeout) as context:
+                    with locking.file_lock(path, timeout=60):
+                        self.fail('Acquired a lock held by another holder')
+            self.assertTrue(context.exception.stale)
+
+    def test_file_lock_holder_that_is_gone_once(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'build.lock')
+            results = []
+
+            def lock():
+                with locking.file_lock(path, timeout=5) as waited:
+                    results.append(waited)
+
+            # The record of a previous holder, seen right before the current one replaced it
+            holder_gone = itertools.chain([True], itertools.repeat(False))
+            with mock.patch('skipper.locking._holder_gone', side_effect=lambda holder: next(holder_gone)):
+                with locking.file_lock(path):
+                    thread = threading.Thread(target=lock)
+                    thread.start()
+                    thread.join(0.3)
+                thread.join(5)
+            self.assertEqual(results, [True])
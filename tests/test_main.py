@@ -0,0 +1,34 @@
+import subprocess
+import sys
+import unittest
+
+# Modules that are slow to import, and only needed by some of the commands
+LAZY_MODULES = ('requests', 'urllib3', 'pkg_resources', 'pbr', 'tabulate', 'http.client')
+# Seconds, generous enough for slow CI machines, but well below importing the modules above
+IMPORT_TIME_BUDGET = 0.3
+
+IMPORT_SCRIPT = '''
+import sys
+import time
+start = time.perf_counter()
+import skipper.main
+print(time.perf_counter() - start)
+print(' '.join(name for name in sys.argv[1:] if name in sys.modules))
+'''
+
+
+def _import_main():
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT] + list(LAZY_MODULES), text=True)
+    import_time, loaded_modules = output.split('\n', 1)
+    return float(import_time), loaded_modules.split()
+
+
+class TestImportTime(unittest.TestCase):
+    def test_slow_modules_are_imported_lazily(self):
+        _, loaded_modules = _import_main()
+        self.assertEqual(loaded_modules, [])
+
+    def test_import_time_budget(self):
+        # The best of a few runs, to leave out a busy machine's noise
+        import_time = min(_import_main()[0] for _ in range(3))
+        self.assertLess(import_time, IMPORT_TIME_BUDGET)
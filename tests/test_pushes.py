@@ -0,0 +1,62 @@
+import logging
+import os
+import tempfile
+import unittest
+
+import mock
+
+from skipper import pushes
+from skipper.cache import write_json
+
+IMAGE = 'registry.io:5000/build-container:cache'
+DIGEST = 'sha256:0123456789abcdef'
+
+
+@mock.patch('skipper.utils.local_image_id', mock.MagicMock(autospec=True, return_value=DIGEST))
+class TestPushes(unittest.TestCase):
+    def setUp(self):
+        runtime_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(runtime_dir.cleanup)
+        environ_patcher = mock.patch.dict(os.environ, {'SKIPPER_RUNTIME_DIR': runtime_dir.name})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+        self.logger = logging.getLogger('skipper')
+
+    def _push(self, runtime_command):
+        # The worker runs "<runtime> push <image>", true and false stand for a push that succeeds or fails
+        with mock.patch('skipper.utils.get_runtime_command', return_value=runtime_command):
+            return pushes.push_in_background(IMAGE, self.logger)
+
+    def test_push_in_background(self):
+        state = self._push('true')
+        self.assertEqual(state['command'], ['true', 'push', IMAGE])
+        self.assertEqual(state['digest'], DIGEST)
+        states = pushes.wait(timeout=30, interval=0.05)
+        self.assertEqual(len(states), 1)
+        self.assertEqual(pushes.status(states[0]), pushes.SUCCEEDED)
+        with open(states[0]['log']) as log_file:
+            self.assertIn(f'true push {IMAGE}', log_file.read())
+
+    def test_failed_push(self):
+        self._push('false')
+        states = pushes.wait(timeout=30, interval=0.05)
+        self.assertEqual([pushes.status(state) for state in states], [pushes.FAILED])
+
+    @mock.patch('subprocess.Popen')
+    def test_push_of_the_same_digest_is_not_repeated(self, popen_mock):
+        path = pushes._state_path(IMAGE)  # pylint: disable=protected-access
+        write_json(path, {'image': IMAGE, 'digest': DIGEST, 'pid': os.getpid(), 'log': path + '.log', 'returncode': None})
+        self.assertEqual(self._push('docker')['pid'], os.getpid())
+        popen_mock.assert_not_called()
+
+    @mock.patch('subprocess.call')
+    def test_worker_without_state(self, call_mock):
+        self.assertEqual(pushes._work(pushes._state_path(IMAGE)), 1)  # pylint: disable=protected-access
+        call_mock.assert_not_called()
+
+    def test_status(self):
+        self.assertEqual(pushes.status({'pid': os.getpid(), 'returncode': None}), pushes.RUNNING)
+        self.assertEqual(pushes.status({'pid': os.getpid(), 'returncode': 0}), pushes.SUCCEEDED)
+        self.assertEqual(pushes.status({'pid': os.getpid(), 'returncode': 1}), pushes.FAILED)
+        with mock.patch('skipper.locking.process_alive', return_value=False):
+            self.assertEqual(pushes.status({'pid': 999999, 'returncode': None}), pushes.FAILED)
@@ -0,0 +1,154 @@
+import json
+import tempfile
+import unittest
+
+import mock
+import requests
+from requests.adapters import BaseAdapter
+
+from skipper import cache, registry
+
+REGISTRY_URL = 'https://registry.io:5000/v2/my_image/tags/list'
+REALM = 'https://auth.registry.io/token'
+CHALLENGE = f'Bearer realm="{REALM}",service="registry.io",scope="repository:my_image:pull"'
+
+
+class FakeRegistryAdapter(BaseAdapter):
+    """Answers like a token protected registry, recording every request it gets."""
+
+    def __init__(self, expires_in=300):
+        super().__init__()
+        self.requests = []
+        self.expires_in = expires_in
+        self.issued = 0
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        self.requests.append(request)
+        response = requests.Response()
+        response.request = request
+        response.connection = self
+        response.url = request.url
+        response.raw = mock.MagicMock()
+        if request.url.startswith(REALM):
+            self.issued += 1
+            response.status_code = 200
+            response._content = json.dumps({'token': f'token-{self.issued}', 'expires_in': self.expires_in}).encode()
+        elif request.headers.get('Authorization') == f'Bearer token-{self.issued}':
+            response.status_code = 200
+            response._content = json.dumps({'name': 'my_image', 'tags': ['latest']}).encode()
+        else:
+            response.status_code = 401
+            response.headers['WWW-Authenticate'] = CHALLENGE
+            response._content = b''
+        return response
+
+    def close(self):
+        pass
+
+
+class TestRegistryClient(unittest.TestCase):
+    def setUp(self):
+        self.client = registry.RegistryClient('user', 'pass')
+        self.adapter = FakeRegistryAdapter()
+        self.client.session('registry.io:5000').mount('https://', self.adapter)
+
+    def test_session_per_registry(self):
+        self.assertIs(self.client.session('registry.io:5000'), self.client.session('registry.io:5000'))
+        self.assertIsNot(self.client.session('registry.io:5000'), self.client.session('other.io'))
+
+    def test_token_is_reused(self):
+        for _ in range(3):
+            response = self.client.get(REGISTRY_URL)
+            self.assertEqual(response.json()['tags'], ['latest'])
+
+        self.assertEqual(self.adapter.issued, 1)
+        # challenge, token request, authorized request, and then only authorized requests
+        self.assertEqual(len(self.adapter.requests), 5)
+
+    @mock.patch('time.monotonic')
+    def test_expired_token_is_renewed(self, monotonic_mock):
+        monotonic_mock.return_value = 1000
+        self.client.get(REGISTRY_URL)
+        monotonic_mock.return_value = 1000 + self.adapter.expires_in
+        response = self.client.get(REGISTRY_URL)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.adapter.issued, 2)
+
+    def test_token_request_uses_credentials(self):
+        self.client.get(REGISTRY_URL)
+        token_request = self.adapter.requests[1]
+        self.assertTrue(token_request.url.startswith(REALM))
+        self.assertTrue(token_request.headers['Authorization'].startswith('Basic '))
+
+    def test_close(self):
+        session = self.client.session('registry.io:5000')
+        self.client.close()
+        self.assertIsNot(self.client.session('registry.io:5000'), session)
+
+
+class TestCachedRegistryClient(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache = cache.RegistryCache(cache_dir.name)
+        self.client = registry.RegistryClient(cache=self.cache)
+        self.session = mock.Mock()
+        self.client._sessions['registry.io:5000'] = self.session  # pylint: disable=protected-access
+
+    @staticmethod
+    def _response(status_code, headers=None, text=''):
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers.update(headers or {})
+        response._content = text.encode()  # pylint: disable=protected-access
+        return response
+
+    def test_fresh_entry_is_served_from_cache(self):
+        self.session.get.return_value = self._response(200, {'ETag': '"etag"'}, '{"tags": ["latest"]}')
+        for _ in range(2):
+            response = self.client.get(REGISTRY_URL, cached=True)
+            self.assertEqual(response.json(), {'tags': ['latest']})
+        self.session.get.assert_called_once_with(url=REGISTRY_URL)
+
+    def test_uncached_requests_are_not_stored(self):
+        self.session.get.return_value = self._response(200, text='{"tags": ["latest"]}')
+        self.client.get(REGISTRY_URL)
+        self.client.get(REGISTRY_URL)
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_stale_entry_is_revalidated(self):
+        self.cache.positive_ttl = -1
+        self.session.get.side_effect = [
+            self._response(200, {'ETag': '"etag"'}, '{"tags": ["latest"]}'),
+            self._response(304),
+        ]
+        self.client.get(REGISTRY_URL, cached=True)
+        response = self.client.get(REGISTRY_URL, cached=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'tags': ['latest']})
+        self.session.get.assert_called_with(url=REGISTRY_URL, headers={'If-None-Match': '"etag"'})
+
+    def test_revalidated_entry_is_checked_while_fresh(self):
+        self.session.get.side_effect = [
+            self._response(200, {'ETag': '"etag"'}, '{"tags": ["latest"]}'),
+            self._response(304),
+            self._response(200, {'ETag': '"etag2"'}, '{"tags": ["latest", "new"]}'),
+        ]
+        self.client.get(REGISTRY_URL, cached=True, revalidate=True)
+        response = self.client.get(REGISTRY_URL, cached=True, revalidate=True)
+        self.assertEqual(response.json(), {'tags': ['latest']})
+        self.session.get.assert_called_with(url=REGISTRY_URL, headers={'If-None-Match': '"etag"'})
+
+        response = self.client.get(REGISTRY_URL, cached=True, revalidate=True)
+        self.assertEqual(response.json(), {'tags': ['latest', 'new']})
+        self.assertEqual(self.session.get.call_count, 3)
+
+    def test_delete_invalidates_image(self):
+        self.session.head.return_value = self._response(200, {'Docker-Content-Digest': 'digest'})
+        manifest_url = 'https://registry.io:5000/v2/my_image/manifests/latest'
+        self.client.head(manifest_url, cached=True)
+        self.client.delete('https://registry.io:5000/v2/my_image/manifests/digest')
+        self.client.head(manifest_url, cached=True)
+        self.assertEqual(self.session.head.call_count, 2)
@@ -1,7 +1,13 @@
+import io
+import json
 import sys
 import os
+import subprocess
+import tempfile
+import time
 import unittest
 import mock
+from skipper import engine
 from skipper import utils
 from skipper import runner
 from skipper.runner import get_default_net
@@ -22,6 +28,7 @@ PROJECT_DIR = os.path.join(WORKDIR, PROJECT)
 ENV = ["KEY1=VAL1", "KEY2=VAL2"]
 ENV_FILE_PATH = '/home/envfile.env'
 ENV_FILES = [ENV_FILE_PATH, ENV_FILE_PATH]
+DEAD_PID = 999999
 
 
 def get_volume_mapping(volume_mapping):
@@ -41,6 +48,7 @@ class TestRunner(unittest.TestCase):
     def setUp(self):
         self.runtime = "docker"
         utils.CONTAINER_RUNTIME_COMMAND = self.runtime
+        utils.ENGINE_CLIENT = False
         os.environ['KEEP_CONTAINERS'] = 'True'
 
     @mock.patch('subprocess.Popen', autospec=False)
@@ -59,6 +67,21 @@ class TestRunner(unittest.TestCase):
         runner.run(command)
         popen_mock.assert_called_once_with([self.runtime] + command)
 
+    def test_run_with_stdin_writer(self):
+        with mock.patch('skipper.utils.get_runtime_command', return_value='sh'):
+            self.assertEqual(runner.run(['-c', 'test "$(cat)" = context'], stdin_writer=lambda stream: stream.write(b'context')), 0)
+            # A command that does not read all of its input fails on its own
+            self.assertEqual(runner.run(['-c', 'exit 2'], stdin_writer=lambda stream: stream.write(b'x' * 1024 * 1024)), 2)
+
+    @mock.patch('sys.stderr', new_callable=io.StringIO)
+    def test_run_with_stderr_callback(self, stderr_mock):
+        lines = []
+        with mock.patch('skipper.utils.get_runtime_command', return_value='sh'):
+            ret = runner.run(['-c', 'echo "#1 DONE 0.1s" >&2; echo "#1 CACHED" >&2; exit 3'], stderr_callback=lines.append)
+        self.assertEqual(ret, 3)
+        self.assertEqual(lines, ['#1 DONE 0.1s\n', '#1 CACHED\n'])
+        self.assertEqual(stderr_mock.getvalue(), '#1 DONE 0.1s\n#1 CACHED\n')
+
     @mock.patch('os.path.exists', mock.MagicMock(autospec=True, return_value=True))
     @mock.patch('getpass.getuser', mock.MagicMock(autospec=True, return_value='testuser'))
     @mock.patch('os.getcwd', mock.MagicMock(autospec=True, return_value=PROJECT_DIR))
@@ -67,10 +90,10 @@ class TestRunner(unittest.TestCase):
     @mock.patch('grp.getgrnam', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_simple_command_nested_network_exist(self, resource_filename_mock, check_output_mock,
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_simple_command_nested_network_exist(self, get_extra_file_mock, check_output_mock,
                                                      popen_mock, grp_getgrnam_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+        get_extra_file_mock.return_value = "entrypoint.sh"
         check_output_mock.side_effect = [self.NET_LS, '']
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
@@ -113,10 +136,10 @@ class TestRunner(unittest.TestCase):
     @mock.patch('grp.getgrnam', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_simple_command_nested_network_not_exist(self, resource_filename_mock,
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_simple_command_nested_network_not_exist(self, get_extra_file_mock,
                                                          check_output_mock, popen_mock, grp_getgrnam_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+        get_extra_file_mock.return_value = "entrypoint.sh"
         check_output_mock.side_effect = [self.NET_NOT_EXISTS, 'new-net-hash', '']
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
@@ -159,9 +182,9 @@ class TestRunner(unittest.TestCase):
     @mock.patch('grp.getgrnam', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_simple_command_nested_with_env(self, resource_filename_mock, check_output_mock, popen_mock, grp_getgrnam_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_simple_command_nested_with_env(self, get_extra_file_mock, check_output_mock, popen_mock, grp_getgrnam_mock, os_getuid_mock):
+        get_extra_file_mock.return_value = "entrypoint.sh"
         check_output_mock.side_effect = [self.NET_LS, '']
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
@@ -210,12 +233,12 @@ class TestRunner(unittest.TestCase):
     @mock.patch('grp.getgrnam', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
     def test_run_simple_command_nested_with_env_file(
-            self, resource_filename_mock, check_output_mock, popen_mock,
+            self, get_extra_file_mock, check_output_mock, popen_mock,
             grp_getgrnam_mock, os_getuid_mock
     ):
-        resource_filename_mock.return_value = "entrypoint.sh"
+        get_extra_file_mock.return_value = "entrypoint.sh"
         check_output_mock.side_effect = [self.NET_LS, '']
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb',
                                                                'ccc', '']
@@ -266,12 +289,12 @@ class TestRunner(unittest.TestCase):
     @mock.patch('grp.getgrnam', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
     def test_run_simple_command_nested_with_multiple_env_files(
-            self, resource_filename_mock, check_output_mock, popen_mock,
+            self, get_extra_file_mock, check_output_mock, popen_mock,
             grp_getgrnam_mock, os_getuid_mock
     ):
-        resource_filename_mock.return_value = "entrypoint.sh"
+        get_extra_file_mock.return_value = "entrypoint.sh"
         check_output_mock.side_effect = [self.NET_LS, '']
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb',
                                                                'ccc', '']
@@ -320,10 +343,10 @@ class TestRunner(unittest.TestCase):
     @mock.patch('grp.getgrnam', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_simple_command_nested_interactive(self, resource_filename_mock,
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_simple_command_nested_interactive(self, get_extra_file_mock,
                                                    check_output_mock, popen_mock, grp_getgrnam_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+        get_extra_file_mock.return_value = "entrypoint.sh"
         check_output_mock.side_effect = [self.NET_LS, '']
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
@@ -369,9 +392,9 @@ class TestRunner(unittest.TestCase):
     @mock.patch('grp.getgrnam', autospec=True,)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_complex_command_nested(self, resource_filename_mock, check_output_mock, popen_mock, grp_getgrnam_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_complex_command_nested(self, get_extra_file_mock, check_output_mock, popen_mock, grp_getgrnam_mock, os_getuid_mock):
+        get_extra_file_mock.return_value = "entrypoint.sh"
         check_output_mock.side_effect = [self.NET_LS, '']
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
@@ -414,9 +437,9 @@ class TestRunner(unittest.TestCase):
     @mock.patch('grp.getgrnam', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_complex_command_nested_with_env(self, resource_filename_mock, check_output_mock, popen_mock, grp_getgrnam_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_complex_command_nested_with_env(self, get_extra_file_mock, check_output_mock, popen_mock, grp_getgrnam_mock, os_getuid_mock):
+        get_extra_file_mock.return_value = "entrypoint.sh"
         check_output_mock.side_effect = [self.NET_LS, '']
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
@@ -464,13 +487,13 @@ class TestRunner(unittest.TestCase):
     @mock.patch('grp.getgrnam', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_complex_command_nested_with_special_case_verification(self, resource_filename_mock, check_output_mock,
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_complex_command_nested_with_special_case_verification(self, get_extra_file_mock, check_output_mock,
                                                                        popen_mock, grp_getgrnam_mock, os_getuid_mock,
                                                                        path_exists_mock, create_path_and_add_data_mock):
 
         path_exists_mock.return_value = False
-        resource_filename_mock.return_value = "entrypoint.sh"
+        get_extra_file_mock.return_value = "entrypoint.sh"
         check_output_mock.side_effect = [self.NET_LS, '']
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
@@ -516,3 +539,324 @@ class TestRunner(unittest.TestCase):
         volumes = ['bad volume mount']
         with self.assertRaises(ValueError):
             runner.handle_volumes_bind_mount(docker_cmd, HOME_DIR, volumes, WORKDIR)
+
+
+@mock.patch('os.getcwd', mock.MagicMock(autospec=True, return_value=PROJECT_DIR))
+@mock.patch('skipper.runner._container_args', mock.MagicMock(autospec=True, return_value=['--privileged', '-e', 'KEY1=VAL1']))
+@mock.patch('skipper.utils.get_extra_file', mock.MagicMock(autospec=True, return_value='session.sh'))
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        utils.CONTAINER_RUNTIME_COMMAND = 'docker'
+        utils.ENGINE_CLIENT = False
+        environ_patcher = mock.patch.dict(os.environ, {'SKIPPER_SESSION_TIMEOUT': '600'})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+        os.environ.pop('KEEP_CONTAINERS', None)
+
+    @staticmethod
+    def _exec_command(session, command='make all'):
+        return ['exec', '-t', '-w', PROJECT_DIR, session, runner.SESSION_SCRIPT, 'exec', command]
+
+    @mock.patch('skipper.runner._network_exists', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('skipper.runner._container_running', autospec=True)
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    def test_first_command_starts_session(self, run_mock, container_running_mock):
+        container_running_mock.return_value = False
+        self.assertEqual(runner.run(['make', 'all'], FQDN_IMAGE), 0)
+        start_command = run_mock.call_args_list[0][0][0]
+        session = start_command[start_command.index('--name') + 1]
+        self.assertTrue(session.startswith(runner.SESSION_PREFIX))
+        self.assertEqual(start_command[:4], ['run', '-d', '--rm', '--name'])
+        self.assertIn('SKIPPER_SESSION_TIMEOUT=600', start_command)
+        self.assertIn('session.sh:/opt/skipper/skipper-session.sh:ro', start_command)
+        self.assertEqual(start_command[-2:], [FQDN_IMAGE, '/opt/skipper/skipper-session.sh keepalive'])
+        self.assertEqual(run_mock.call_args_list[0][1], {'stdout_to_stderr': True})
+        self.assertEqual(run_mock.call_args_list[1], mock.call(self._exec_command(session), stderr_callback=mock.ANY))
+
+    @mock.patch('skipper.runner._container_running', autospec=True, return_value=True)
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    def test_later_commands_exec_in_session(self, run_mock, container_running_mock):
+        runner.run(['make', 'all'], FQDN_IMAGE)
+        runner.run(['make', 'test'], FQDN_IMAGE, interactive=True)
+        session = container_running_mock.call_args[0][0]
+        self.assertEqual(run_mock.call_args_list, [
+            mock.call(self._exec_command(session), stderr_callback=mock.ANY),
+            mock.call(['exec', '-i', '-e', 'SKIPPER_INTERACTIVE=True'] + self._exec_command(session, 'make test')[1:],
+                      stderr_callback=mock.ANY),
+        ])
+        runner.run(['make', 'all'], REGISTRY + '/' + IMAGE + ':other')
+        self.assertNotEqual(container_running_mock.call_args[0][0], session)
+
+    @mock.patch('skipper.runner._network_exists', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('skipper.runner._container_running', autospec=True)
+    @mock.patch('skipper.runner._run', autospec=True)
+    def test_expired_session_is_started_again(self, run_mock, container_running_mock):
+        container_running_mock.return_value = True
+
+        def run(cmd, stderr_callback=None, **_):
+            if stderr_callback:
+                stderr_callback('Error response from daemon: container 0123456789ab is not running\n')
+                return 1
+            return 0
+
+        run_mock.side_effect = run
+        self.assertEqual(runner.run(['make', 'all'], FQDN_IMAGE), 0)
+        self.assertEqual(run_mock.call_count, 3)
+        self.assertEqual(run_mock.call_args_list[1][0][0][:2], ['run', '-d'])
+        self.assertEqual(run_mock.call_args_list[0][0], run_mock.call_args_list[2][0])
+
+    @mock.patch('skipper.runner._container_running', autospec=True, return_value=True)
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    def test_changed_env_file_starts_new_session(self, run_mock, container_running_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            env_file = os.path.join(tmp_dir, 'env')
+            with open(env_file, 'w') as env:
+                env.write('KEY2=VAL2\n')
+            runner.run(['make', 'all'], FQDN_IMAGE, env_file=(env_file,))
+            session = container_running_mock.call_args[0][0]
+            runner.run(['make', 'all'], FQDN_IMAGE, env_file=(env_file,))
+            self.assertEqual(container_running_mock.call_args[0][0], session)
+
+            with open(env_file, 'a') as env:
+                env.write('KEY3=VAL3\n')
+            runner.run(['make', 'all'], FQDN_IMAGE, env_file=(env_file,))
+            self.assertNotEqual(container_running_mock.call_args[0][0], session)
+        self.assertEqual(run_mock.call_count, 3)
+
+    @mock.patch('skipper.runner._container_running', autospec=True)
+    @mock.patch('skipper.runner._run', autospec=True, return_value=137)
+    def test_failed_command_is_not_run_again(self, run_mock, container_running_mock):
+        # The command stopped the session, or was killed with it
+        container_running_mock.side_effect = [True, False]
+        self.assertEqual(runner.run(['make', 'all'], FQDN_IMAGE), 137)
+        run_mock.assert_called_once()
+
+    @mock.patch('skipper.runner._container_running', autospec=True)
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    @mock.patch('skipper.runner._network', mock.MagicMock(autospec=True))
+    def test_named_containers_do_not_use_sessions(self, run_mock, container_running_mock):
+        runner.run(['make', 'all'], FQDN_IMAGE, name='test')
+        container_running_mock.assert_not_called()
+        self.assertEqual(run_mock.call_args[0][0][:3], ['run', '--name', 'test'])
+
+
+@mock.patch('getpass.getuser', mock.MagicMock(autospec=True, return_value='testuser'))
+@mock.patch('os.getuid', mock.MagicMock(autospec=True, return_value=USER_ID))
+@mock.patch('os.getcwd', mock.MagicMock(autospec=True, return_value=PROJECT_DIR))
+@mock.patch('os.path.expanduser', mock.MagicMock(autospec=True, return_value=HOME_DIR))
+@mock.patch('grp.getgrnam', mock.MagicMock(autospec=True, return_value=mock.MagicMock(gr_gid=978)))
+@mock.patch('skipper.runner._container_args', mock.MagicMock(autospec=True, return_value=['--privileged']))
+@mock.patch('skipper.runner._network', mock.MagicMock(autospec=True))
+@mock.patch('skipper.utils.run_container_command', mock.MagicMock(autospec=True, return_value=''))
+class TestUserLayer(unittest.TestCase):
+    def setUp(self):
+        utils.CONTAINER_RUNTIME_COMMAND = 'docker'
+        utils.ENGINE_CLIENT = False
+        environ_patcher = mock.patch.dict(os.environ, {'SKIPPER_USER_LAYER': 'true'})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+        os.environ.pop('KEEP_CONTAINERS', None)
+        os.environ.pop('SKIPPER_SESSION_TIMEOUT', None)
+
+    @mock.patch('skipper.utils.local_image_id', autospec=True, return_value='sha256:abc')
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    def test_command_starts_as_user(self, run_mock, local_image_id_mock):
+        runner.run(['make', 'all'], FQDN_IMAGE)
+        user_layer = local_image_id_mock.call_args[0][0]
+        self.assertTrue(user_layer.startswith(runner.USER_LAYER_REPOSITORY + ':'))
+        run_mock.assert_called_once_with([
+            'run', '-t', '--rm', '--privileged', '-w', PROJECT_DIR,
+            '--user', 'testuser', '--entrypoint', '/bin/bash', user_layer, '-c', 'make all',
+        ])
+
+    @mock.patch('skipper.utils.local_image_id', autospec=True)
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    def test_missing_layer_is_built(self, run_mock, local_image_id_mock):
+        local_image_id_mock.side_effect = ['sha256:abc', None]
+        dockerfiles = []
+
+        def run(cmd, **kwargs):  # pylint: disable=unused-argument
+            if cmd[0] == 'build':
+                with open(os.path.join(cmd[-1], 'Dockerfile')) as dockerfile:
+                    dockerfiles.append(dockerfile.read())
+            return 0
+
+        run_mock.side_effect = run
+        runner.run(['make', 'all'], FQDN_IMAGE)
+
+        build_command = run_mock.call_args_list[0][0][0]
+        user_layer = build_command[build_command.index('-t') + 1]
+        self.assertEqual(build_command[:10], ['build', '-q', '--label', 'skipper.user-layer=true',
+                                              '--label', f'skipper.user-layer.image={FQDN_IMAGE}',
+                                              '--label', 'skipper.user-layer.user=testuser',
+                                              '--label', f'skipper.user-layer.homedir={HOME_DIR}'])
+        self.assertEqual(run_mock.call_args_list[0][1], {'stdout_to_stderr': True})
+        self.assertEqual(dockerfiles[0].splitlines()[0], 'FROM ' + FQDN_IMAGE)
+        self.assertIn(f'RUN mkdir -p {HOME_DIR} && ', dockerfiles[0])
+        self.assertIn(f'SKIPPER_USERNAME=testuser SKIPPER_UID={USER_ID} SKIPPER_DOCKER_GID=978 HOME={HOME_DIR}', dockerfiles[0])
+        self.assertIn(user_layer, run_mock.call_args_list[1][0][0])
+
+    @mock.patch('skipper.utils.local_image_id', autospec=True)
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    def test_previous_layers_are_removed(self, run_mock, local_image_id_mock):
+        local_image_id_mock.side_effect = ['sha256:abc', None]
+        # The first layer is still used by a session
+        side_effect = ['sha256:old1\nsha256:old2', subprocess.CalledProcessError(1, 'docker'), '']
+        with mock.patch('skipper.utils.run_container_command', side_effect=side_effect) as run_container_command_mock:
+            runner.run(['make', 'all'], FQDN_IMAGE)
+        self.assertEqual(run_container_command_mock.call_args_list, [
+            mock.call(['images', '-q', '--no-trunc', '--filter', f'label=skipper.user-layer.image={FQDN_IMAGE}',
+                       '--filter', 'label=skipper.user-layer.user=testuser', '--filter', f'label=skipper.user-layer.homedir={HOME_DIR}']),
+            mock.call(['rmi', 'sha256:old1']),
+            mock.call(['rmi', 'sha256:old2']),
+        ])
+        self.assertEqual(run_mock.call_args_list[0][0][0][0], 'build')
+
+    @mock.patch('skipper.utils.local_image_id', autospec=True)
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    def test_previous_layers_are_removed_through_engine_api(self, run_mock, local_image_id_mock):
+        local_image_id_mock.side_effect = ['sha256:abc', None]
+        engine_client = mock.MagicMock()
+        engine_client.remove_image.side_effect = [engine.EngineError(409, 'image is being used'), None]
+        with mock.patch('skipper.utils.get_engine_client', return_value=engine_client), \
+                mock.patch('skipper.utils.run_container_command', return_value='sha256:old1\nsha256:old2'):
+            runner.run(['make', 'all'], FQDN_IMAGE)
+        self.assertEqual(engine_client.remove_image.call_args_list, [mock.call('sha256:old1'), mock.call('sha256:old2')])
+        self.assertEqual(run_mock.call_args_list[0][0][0][0], 'build')
+
+    @mock.patch('skipper.utils.local_image_id', autospec=True)
+    @mock.patch('skipper.runner._run', autospec=True)
+    def test_failed_build_falls_back_to_entrypoint(self, run_mock, local_image_id_mock):
+        local_image_id_mock.side_effect = ['sha256:abc', None]
+        run_mock.side_effect = lambda cmd, **kwargs: 1 if cmd[0] == 'build' else 0
+        runner.run(['make', 'all'], FQDN_IMAGE)
+        self.assertEqual(run_mock.call_args[0][0][-4:], ['--entrypoint', runner.ENTRYPOINT, FQDN_IMAGE, 'make all'])
+
+    @mock.patch('skipper.utils.local_image_id', autospec=True, return_value=None)
+    @mock.patch('skipper.runner._run', autospec=True, return_value=0)
+    def test_image_to_pull_uses_entrypoint(self, run_mock, local_image_id_mock):
+        runner.run(['make', 'all'], FQDN_IMAGE)
+        local_image_id_mock.assert_called_once_with(FQDN_IMAGE)
+        self.assertEqual(run_mock.call_args[0][0][-4:], ['--entrypoint', runner.ENTRYPOINT, FQDN_IMAGE, 'make all'])
+
+
+@mock.patch('os.getcwd', mock.MagicMock(autospec=True, return_value=PROJECT_DIR))
+@mock.patch('skipper.runner._container_args', mock.MagicMock(autospec=True, return_value=['--privileged']))
+class TestExec(unittest.TestCase):
+    def setUp(self):
+        utils.CONTAINER_RUNTIME_COMMAND = 'docker'
+        utils.ENGINE_CLIENT = False
+        environ_patcher = mock.patch.dict(os.environ, {'SKIPPER_EXEC': 'true'})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+        for variable in ('KEEP_CONTAINERS', 'SKIPPER_SESSION_TIMEOUT', 'SKIPPER_USER_LAYER'):
+            os.environ.pop(variable, None)
+
+    @mock.patch('skipper.runner._network_exists', mock.MagicMock(autospec=True, return_value=True))
+    @mock.patch('subprocess.Popen', autospec=True)
+    @mock.patch('os.execvp', autospec=True)
+    def test_runtime_replaces_process(self, execvp_mock, popen_mock):
+        # os.execvp does not return
+        execvp_mock.side_effect = SystemExit
+        with self.assertRaises(SystemExit):
+            runner.run(['make', 'all'], FQDN_IMAGE)
+        execvp_mock.assert_called_once_with('docker', [
+            'docker', 'run', '-t', '--rm', '--privileged', '-w', PROJECT_DIR,
+            '--entrypoint', runner.ENTRYPOINT, FQDN_IMAGE, 'make all',
+        ])
+        popen_mock.assert_not_called()
+
+    @mock.patch('skipper.runner._network_exists', mock.MagicMock(autospec=True, return_value=False))
+    @mock.patch('skipper.runner._create_network', autospec=True)
+    @mock.patch('skipper.runner._destroy_network', autospec=True)
+    @mock.patch('os.execvp', autospec=True)
+    def test_created_network_is_kept_for_the_runtime(self, execvp_mock, destroy_network_mock, create_network_mock):
+        execvp_mock.side_effect = SystemExit
+        with tempfile.TemporaryDirectory() as runtime_dir, mock.patch.dict(os.environ, {'SKIPPER_RUNTIME_DIR': runtime_dir}):
+            with self.assertRaises(SystemExit):
+                runner.run(['make', 'all'], FQDN_IMAGE, net='skipper-net')
+            with open(os.path.join(runtime_dir, runner.NETWORKS_FILE)) as networks_file:
+                self.assertEqual(json.load(networks_file), {'skipper-net': {'users': [os.getpid()]}})
+        create_network_mock.assert_called_once_with('skipper-net')
+        destroy_network_mock.assert_not_called()
+        execvp_mock.assert_called_once()
+
+
+@mock.patch('skipper.locking.process_alive', mock.MagicMock(autospec=True, side_effect=lambda pid: pid != DEAD_PID))
+class TestNetworks(unittest.TestCase):
+    def setUp(self):
+        utils.CONTAINER_RUNTIME_COMMAND = 'docker'
+        utils.ENGINE_CLIENT = False
+        runtime_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(runtime_dir.cleanup)
+        self.networks_path = os.path.join(runtime_dir.name, runner.NETWORKS_FILE)
+        environ_patcher = mock.patch.dict(os.environ, {'SKIPPER_RUNTIME_DIR': runtime_dir.name})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+        os.environ.pop('SKIPPER_NETWORK_IDLE_TIMEOUT', None)
+        self.existing = set()
+        for name, side_effect in (('_network_exists', self.existing.__contains__),
+                                  ('_create_network', self.existing.add),
+                                  ('_destroy_network', self.existing.remove)):
+            patcher = mock.patch('skipper.runner.' + name, autospec=True, side_effect=side_effect)
+            setattr(self, name.lstrip('_') + '_mock', patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def _networks(self):
+        with open(self.networks_path) as networks_file:
+            return json.load(networks_file)
+
+    def _use_network(self, net, pid):
+        with mock.patch('os.getpid', return_value=pid):
+            runner._acquire_network(net)  # pylint: disable=protected-access
+
+    def _release_network(self, net, pid):
+        with mock.patch('os.getpid', return_value=pid):
+            runner._release_network(net)  # pylint: disable=protected-access
+
+    def test_concurrent_invocations_share_network(self):
+        self._use_network('skipper-net', 100)
+        self._use_network('skipper-net', 200)
+        self.create_network_mock.assert_called_once_with('skipper-net')
+        self.network_exists_mock.assert_called_once_with('skipper-net')
+        self._release_network('skipper-net', 100)
+        self.assertEqual(self._networks(), {'skipper-net': {'users': [200]}})
+        self._release_network('skipper-net', 200)
+        self.destroy_network_mock.assert_not_called()
+        self.assertEqual(self._networks()['skipper-net']['users'], [])
+
+    def test_idle_networks_are_removed_later(self):
+        self._use_network('skipper-net', 100)
+        self._release_network('skipper-net', 100)
+        networks = self._networks()
+        networks['skipper-net']['idle_since'] = time.time() - runner.NETWORK_IDLE_TIMEOUT
+        runner.write_json(self.networks_path, networks)
+        self._use_network('other-net', 100)
+        self.destroy_network_mock.assert_called_once_with('skipper-net')
+        self.assertEqual(list(self._networks()), ['other-net'])
+
+    def test_references_of_dead_processes_are_dropped(self):
+        os.environ['SKIPPER_NETWORK_IDLE_TIMEOUT'] = '0'
+        self._use_network('skipper-net', DEAD_PID)
+        self._use_network('other-net', 100)
+        self.destroy_network_mock.assert_called_once_with('skipper-net')
+
+    def test_networks_not_created_by_skipper_are_kept(self):
+        os.environ['SKIPPER_NETWORK_IDLE_TIMEOUT'] = '0'
+        self.existing.add('user-net')
+        self._use_network('user-net', 100)
+        self._release_network('user-net', 100)
+        self.create_network_mock.assert_not_called()
+        self.destroy_network_mock.assert_not_called()
+
+    def test_network_in_use_is_not_removed(self):
+        os.environ['SKIPPER_NETWORK_IDLE_TIMEOUT'] = '0'
+        self._use_network('skipper-net', 100)
+        self.destroy_network_mock.side_effect = subprocess.CalledProcessError(1, 'docker')
+        self._release_network('skipper-net', 100)
+        self.assertIn('skipper-net', self._networks())
+
+    def test_builtin_networks_are_not_tracked(self):
+        self._use_network('host', 100)
+        self.network_exists_mock.assert_not_called()
+        self.assertFalse(os.path.exists(self.networks_path))
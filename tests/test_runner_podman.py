@@ -39,6 +39,7 @@ class TestRunnerPodman(unittest.TestCase):
     def setUp(self):
         self.runtime = "podman"
         utils.CONTAINER_RUNTIME_COMMAND = self.runtime
+        utils.ENGINE_CLIENT = False
         os.environ['KEEP_CONTAINERS'] = 'True'
 
     @mock.patch('subprocess.Popen', autospec=False)
@@ -63,9 +64,9 @@ class TestRunnerPodman(unittest.TestCase):
     @mock.patch('os.getuid', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_simple_command_nested_network_exist(self, resource_filename_mock, check_output_mock, popen_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_simple_command_nested_network_exist(self, get_extra_file_mock, check_output_mock, popen_mock, os_getuid_mock):
+        get_extra_file_mock.return_value = "entrypoint.sh"
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
         os_getuid_mock.return_value = USER_ID
@@ -105,9 +106,9 @@ class TestRunnerPodman(unittest.TestCase):
     @mock.patch('os.getuid', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=True)
-    def test_run_simple_command_nested_network_not_exist(self, resource_filename_mock, check_output_mock, popen_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+    @mock.patch('skipper.utils.get_extra_file', autospec=True)
+    def test_run_simple_command_nested_network_not_exist(self, get_extra_file_mock, check_output_mock, popen_mock, os_getuid_mock):
+        get_extra_file_mock.return_value = "entrypoint.sh"
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
         os_getuid_mock.return_value = USER_ID
@@ -147,9 +148,9 @@ class TestRunnerPodman(unittest.TestCase):
     @mock.patch('os.getuid', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_complex_command_nested(self, resource_filename_mock, check_output_mock, popen_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_complex_command_nested(self, get_extra_file_mock, check_output_mock, popen_mock, os_getuid_mock):
+        get_extra_file_mock.return_value = "entrypoint.sh"
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
         os_getuid_mock.return_value = USER_ID
@@ -189,11 +190,11 @@ class TestRunnerPodman(unittest.TestCase):
     @mock.patch('os.getuid', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
     @mock.patch('os.makedirs', mock.MagicMock(autospec=True, side_effect=mock_makedirs))
-    def test_run_non_existent_unauthorized_volume(self, resource_filename_mock,
+    def test_run_non_existent_unauthorized_volume(self, get_extra_file_mock,
                                                   check_output_mock, popen_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+        get_extra_file_mock.return_value = "entrypoint.sh"
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
         os_getuid_mock.return_value = USER_ID
@@ -235,9 +236,9 @@ class TestRunnerPodman(unittest.TestCase):
     @mock.patch('os.getuid', autospec=True)
     @mock.patch('subprocess.Popen', autospec=False)
     @mock.patch('subprocess.check_output', autospec=False)
-    @mock.patch('pkg_resources.resource_filename', autospec=False)
-    def test_run_complex_command_nested_with_env(self, resource_filename_mock, check_output_mock, popen_mock, os_getuid_mock):
-        resource_filename_mock.return_value = "entrypoint.sh"
+    @mock.patch('skipper.utils.get_extra_file', autospec=False)
+    def test_run_complex_command_nested_with_env(self, get_extra_file_mock, check_output_mock, popen_mock, os_getuid_mock):
+        get_extra_file_mock.return_value = "entrypoint.sh"
         popen_mock.return_value.stdout.readline.side_effect = ['aaa', 'bbb', 'ccc', '']
         popen_mock.return_value.poll.return_value = -1
         os_getuid_mock.return_value = USER_ID
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from skipper import scheduler
+
+
+class TestGetDependencies(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def _dockerfile(self, name, content):
+        path = os.path.join(self.tmp_dir, 'Dockerfile.' + name)
+        with open(path, 'w') as dockerfile:
+            dockerfile.write(content)
+        return path
+
+    def test_get_base_images(self):
+        dockerfile = self._dockerfile('image', '\n'.join([
+            'ARG TAG',
+            'FROM --platform=$BUILDPLATFORM golang:1.21 AS builder',
+            'from registry.io:5000/base:${TAG}',
+            'FROM builder',
+            'FROM other@sha256:abcdef as final',
+        ]))
+        self.assertEqual(scheduler.get_base_images(dockerfile), {'golang', 'base', 'other'})
+
+    def test_get_base_images_missing_dockerfile(self):
+        self.assertEqual(scheduler.get_base_images(os.path.join(self.tmp_dir, 'Dockerfile.missing')), set())
+
+    def test_get_dependencies(self):
+        images = {
+            'base': self._dockerfile('base', 'FROM centos:7\n'),
+            'app': self._dockerfile('app', 'FROM base:${TAG}\n'),
+            'tests': self._dockerfile('tests', 'FROM app\nFROM base\n'),
+        }
+        self.assertEqual(scheduler.get_dependencies(images), {'base': set(), 'app': {'base'}, 'tests': {'app', 'base'}})
+
+    def test_get_dependencies_cycle(self):
+        images = {
+            'image1': self._dockerfile('image1', 'FROM image2\n'),
+            'image2': self._dockerfile('image2', 'FROM image1\n'),
+        }
+        with self.assertRaises(scheduler.DependencyCycleError):
+            scheduler.get_dependencies(images)
+
+    def test_topological_order(self):
+        dependencies = {'tests': {'app'}, 'other': set(), 'app': {'base'}, 'base': set()}
+        self.assertEqual(scheduler.topological_order(dependencies), ['base', 'app', 'tests', 'other'])
+
+
+class TestSchedule(unittest.TestCase):
+    def test_parents_are_built_first(self):
+        built = []
+        dependencies = {'tests': {'app'}, 'app': {'base'}, 'base': set()}
+        results = scheduler.schedule(dependencies, lambda image: built.append(image) or 0, jobs=4)
+        self.assertEqual(built, ['base', 'app', 'tests'])
+        self.assertEqual(results, {'base': 0, 'app': 0, 'tests': 0})
+
+    def test_independent_images_are_built_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def build(image):  # pylint: disable=unused-argument
+            barrier.wait()
+            return 0
+
+        results = scheduler.schedule({'image1': set(), 'image2': set(), 'image3': set()}, build, jobs=3)
+        self.assertEqual(results, {'image1': 0, 'image2': 0, 'image3': 0})
+
+    def test_fail_fast(self):
+        build = mock.Mock(side_effect=lambda image: 1 if image == 'image1' else 0)
+        results = scheduler.schedule({'image1': set(), 'image2': set(), 'image3': set()}, build, jobs=1)
+        self.assertEqual(results, {'image1': 1})
+        build.assert_called_once_with('image1')
+
+    def test_keep_going_skips_dependents_of_failed_images(self):
+        build = mock.Mock(side_effect=lambda image: 1 if image == 'base' else 0)
+        logger = mock.Mock()
+        dependencies = {'base': set(), 'app': {'base'}, 'tests': {'app'}, 'other': set()}
+        results = scheduler.schedule(dependencies, build, jobs=2, keep_going=True, logger=logger)
+        self.assertEqual(results, {'base': 1, 'other': 0})
+        self.assertEqual(logger.warning.call_count, 2)
@@ -1,4 +1,6 @@
 import os
+import threading
+import time
 import unittest
 
 import mock
@@ -49,3 +51,115 @@ class TestUtils(unittest.TestCase):
         utils.create_path_and_add_data(test_file, "", True)
         makedir_mock.assert_not_called()
         open_mock.assert_called_once_with(test_file, "w")
+
+    @mock.patch('skipper.utils.run_container_command', autospec=True)
+    def test_get_local_images_info(self, run_container_command_mock):
+        run_container_command_mock.return_value = '\n'.join([
+            '{"name": "foo", "tag": "abc"}',
+            '{"name": "bar", "tag": "def"}',
+            '{"name": "other", "tag": "ghi"}',
+        ])
+        self.assertEqual(utils.get_local_images_info(['bar', 'foo']), [['none', 'bar', 'def'], ['none', 'foo', 'abc']])
+        run_container_command_mock.assert_called_once_with([
+            'images', '--format', '{"name": "{{.Repository}}", "tag": "{{.Tag}}"}',
+            '--filter', 'reference=bar', '--filter', 'reference=foo'])
+
+    @mock.patch('skipper.utils.run_container_command', autospec=True)
+    def test_get_local_images_info_of_podman(self, run_container_command_mock):
+        run_container_command_mock.return_value = '\n'.join([
+            '{"name": "localhost/foo", "tag": "abc"}',
+            '{"name": "registry.io:5000/bar", "tag": "def"}',
+            '{"name": "localhost/other", "tag": "ghi"}',
+        ])
+        self.assertEqual(utils.get_local_images_info(['foo', 'bar']),
+                         [['none', 'localhost/foo', 'abc'], ['none', 'registry.io:5000/bar', 'def']])
+
+    def test_env_flag(self):
+        for value, expected in (('true', True), ('ON', True), ('1', True), ('false', False), ('No', False), ('0', False)):
+            with mock.patch.dict(os.environ, {'SKIPPER_FLAG': value}):
+                self.assertEqual(utils.env_flag('SKIPPER_FLAG'), expected)
+                self.assertEqual(utils.env_flag('SKIPPER_FLAG', default=True), expected)
+        with mock.patch.dict(os.environ, {'SKIPPER_FLAG': 'maybe'}):
+            self.assertTrue(utils.env_flag('SKIPPER_FLAG', default=True))
+        os.environ.pop('SKIPPER_FLAG', None)
+        self.assertFalse(utils.env_flag('SKIPPER_FLAG'))
+
+    def test_env_int(self):
+        with mock.patch.dict(os.environ, {'SKIPPER_NUMBER': '60'}):
+            self.assertEqual(utils.env_int('SKIPPER_NUMBER', 10), 60)
+        with mock.patch.dict(os.environ, {'SKIPPER_NUMBER': '-5'}):
+            self.assertEqual(utils.env_int('SKIPPER_NUMBER', 10), -5)
+            self.assertEqual(utils.env_int('SKIPPER_NUMBER', 10, minimum=0), 0)
+        with mock.patch.dict(os.environ, {'SKIPPER_NUMBER': 'ten'}):
+            self.assertEqual(utils.env_int('SKIPPER_NUMBER', 10), 10)
+        os.environ.pop('SKIPPER_NUMBER', None)
+        self.assertEqual(utils.env_int('SKIPPER_NUMBER', 10), 10)
+
+    @mock.patch('skipper.utils.get_remote_image_info', autospec=True)
+    def test_get_remote_images_info_keeps_order(self, get_remote_image_info_mock):
+        def _image_info(client, image, registry, page_size):
+            # later images answer first
+            time.sleep(0.01 * (3 - int(image[-1])))
+            yield [registry, image, 'latest']
+
+        get_remote_image_info_mock.side_effect = _image_info
+        images_info = list(utils.get_remote_images_info(None, ['image1', 'image2', 'image3'], 'registry.io', jobs=3))
+
+        self.assertEqual(images_info, [['registry.io', 'image1', 'latest'],
+                                       ['registry.io', 'image2', 'latest'],
+                                       ['registry.io', 'image3', 'latest']])
+
+    @mock.patch('skipper.utils.get_remote_image_info', autospec=True)
+    def test_get_remote_images_info_streams_rows(self, get_remote_image_info_mock):
+        release = threading.Event()
+
+        def _image_info(client, image, registry, page_size):
+            yield [registry, image, 'page1']
+            # The next page of each image is only answered once the first row was yielded
+            self.assertTrue(release.wait(5))
+            yield [registry, image, 'page2']
+
+        get_remote_image_info_mock.side_effect = _image_info
+        images_info = utils.get_remote_images_info(None, ['image1', 'image2'], 'registry.io', jobs=2)
+        self.assertEqual(next(images_info), ['registry.io', 'image1', 'page1'])
+        release.set()
+        self.assertEqual(list(images_info), [['registry.io', 'image1', 'page2'],
+                                             ['registry.io', 'image2', 'page1'],
+                                             ['registry.io', 'image2', 'page2']])
+
+    @mock.patch('skipper.utils.get_remote_image_info', autospec=True)
+    def test_get_remote_images_info_failure_cancels_pending(self, get_remote_image_info_mock):
+        release = threading.Event()
+        queried = []
+
+        def _image_info(client, image, registry, page_size):
+            queried.append(image)
+            if image == 'image1':
+                raise RuntimeError('registry error')
+            release.wait(0.2)
+            yield [registry, image, 'latest']
+
+        get_remote_image_info_mock.side_effect = _image_info
+        with self.assertRaises(RuntimeError):
+            list(utils.get_remote_images_info(None, ['image1', 'image2', 'image3', 'image4'], 'registry.io', jobs=2))
+        release.set()
+
+        self.assertNotIn('image4', queried)
+
+    def test_remote_image_info_pages(self):
+        client = mock.Mock()
+        client.get.side_effect = [
+            mock.Mock(ok=True, links={'next': {'url': '/v2/my_image/tags/list?n=2&last=b'}},
+                      json=mock.Mock(return_value={'name': 'my_image', 'tags': ['a', 'b']})),
+            mock.Mock(ok=True, links={}, json=mock.Mock(return_value={'name': 'my_image', 'tags': ['c']})),
+        ]
+
+        rows = list(utils.get_remote_image_info(client, 'my_image', 'registry.io', page_size=2))
+
+        self.assertEqual(rows, [['registry.io', 'my_image', 'a'],
+                                ['registry.io', 'my_image', 'b'],
+                                ['registry.io', 'my_image', 'c']])
+        self.assertEqual(client.get.call_args_list, [
+            mock.call('https://registry.io/v2/my_image/tags/list', cached=True, revalidate=True, params={'n': 2}, headers=None),
+            mock.call('https://registry.io/v2/my_image/tags/list?n=2&last=b', cached=True, revalidate=True, params=None, headers=None),
+        ])